@@ -52,6 +52,7 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "churn.middleware.StageTimingMiddleware",
 ]
 
 ROOT_URLCONF = "backend.urls"
@@ -151,4 +152,109 @@ STATIC_URL = "static/"
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
-DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
\ No newline at end of file
+DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
+
+
+# Churn prediction service
+# Similarity search backend for customer recommendations: "exact", "balltree" or "hnsw"
+CHURN_SIMILARITY_BACKEND = os.environ.get("CHURN_SIMILARITY_BACKEND", "exact")
+
+# Seconds without progress after which a queued/running retraining job is considered abandoned
+CHURN_RETRAIN_JOB_TIMEOUT = 3600
+
+# Retraining in "auto" mode continues the current model on new rows and only
+# refits from scratch once this many seconds have passed since the last full refit
+CHURN_FULL_REFIT_INTERVAL = 7 * 24 * 3600
+
+# Full refits over a training log at least this large stream it from disk
+# into XGBoost external memory instead of loading it with pandas
+CHURN_STREAMING_THRESHOLD_BYTES = 512 * 1024 * 1024
+
+# Prediction log buffering: flush after this many rows or this many seconds
+CHURN_LOG_FLUSH_ROWS = 500
+CHURN_LOG_FLUSH_SECONDS = 2.0
+# Rows/records kept for retry while the feature store or database can't be
+# written; the oldest beyond this are dropped (churn_prediction_log_dropped_total)
+CHURN_LOG_MAX_PENDING = 100000
+
+# Cache of prediction results keyed on the feature vector and model version.
+# MAX_SIZE 0 disables it; BACKEND names a CACHES alias to share entries across
+# workers instead of keeping them in-process.
+CHURN_PREDICTION_CACHE = {
+    "MAX_SIZE": 10000,
+    "TTL": 300,
+    "BACKEND": None,
+}
+
+# Same for the per-feature churn explanations (/api/explain/, "explain": true)
+CHURN_EXPLANATION_CACHE = {
+    "MAX_SIZE": 10000,
+    "TTL": 300,
+    "BACKEND": None,
+}
+
+# Add a Server-Timing header with the per-stage latencies to every response
+CHURN_SERVER_TIMING = os.environ.get("CHURN_SERVER_TIMING", "0") == "1"
+
+# Async prediction view (/api/predict/async/): threads scoring requests, and
+# how many requests may be admitted at once before new ones get a 503
+CHURN_ASYNC_WORKERS = os.cpu_count()
+CHURN_ASYNC_MAX_PENDING = 4 * (os.cpu_count() or 1)
+
+# Micro-batching of concurrent single-customer predictions: requests queued up
+# behind a running model call (up to MAX_BATCH, waiting at most WINDOW_MS) share
+# the next one. Only useful with threaded/async workers that serve concurrent
+# requests in one process, so off by default (sync gunicorn workers never
+# coalesce). A request not scored within TIMEOUT_SECONDS fails instead of hanging.
+CHURN_MICRO_BATCHING = {
+    "ENABLED": os.environ.get("CHURN_MICRO_BATCHING", "0") == "1",
+    "WINDOW_MS": 2.0,
+    "MAX_BATCH": 64,
+    "WORKERS": 1,
+    "TIMEOUT_SECONDS": 10.0,
+}
+
+# Rows scored and saved per chunk by the /api/predict/upload/ endpoint
+CHURN_UPLOAD_CHUNK_ROWS = 5000
+
+# Logged predictions are stored as columnar segments under logs/feature_store/;
+# the log flusher compacts the store once it has more segments than this
+CHURN_FEATURE_STORE_MAX_SEGMENTS = 64
+
+# Serve models from their native export (XGBoost JSON / NumPy arrays under
+# <version>/native/, see `manage.py export_models`) instead of unpickling them
+CHURN_NATIVE_MODELS = os.environ.get("CHURN_NATIVE_MODELS", "1") == "1"
+
+# Hyperparameter search run by retraining in "tune" mode (see churn/tuning.py):
+# strategy "grid", "random" or "halving"; N_JOBS None uses every core
+CHURN_TUNING = {
+    "STRATEGY": "halving",
+    "N_CANDIDATES": 27,
+    "N_JOBS": None,
+    "MAX_ROUNDS": 500,
+    "EARLY_STOPPING_ROUNDS": 20,
+}
+
+# Daily churn-risk rollups (churn/rollups.py): refreshed from the prediction log
+# flusher at most every MIN_INTERVAL seconds, or by `manage.py refresh_rollups`.
+# Records younger than SETTLE_SECONDS wait for the next refresh.
+CHURN_ROLLUPS = {
+    "REFRESH_ON_FLUSH": True,
+    "MIN_INTERVAL": 10.0,
+    "SETTLE_SECONDS": 5.0,
+    "BATCH_SIZE": 50000,
+}
+
+# Data-drift monitor (churn/drift.py): live feature and churn-probability
+# distributions vs. REFERENCE_ROWS sampled training rows, in BINS quantile bins.
+# Set CHURN_DRIFT_PSI_THRESHOLD (0.2 is a common "significant shift" level) to
+# queue a retrain once any PSI reaches it over MIN_OBSERVATIONS predictions,
+# at most once per RETRAIN_COOLDOWN seconds.
+CHURN_DRIFT = {
+    "BINS": 10,
+    "REFERENCE_ROWS": 50000,
+    "RETRAIN_PSI_THRESHOLD": float(os.environ["CHURN_DRIFT_PSI_THRESHOLD"]) if os.environ.get("CHURN_DRIFT_PSI_THRESHOLD") else None,
+    "MIN_OBSERVATIONS": 1000,
+    "CHECK_EVERY": 500,
+    "RETRAIN_COOLDOWN": 6 * 3600,
+}
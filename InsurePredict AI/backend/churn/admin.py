@@ -1,4 +1,6 @@
 from django.contrib import admin
-from .models import CustomerRecord
+from .models import ChurnRollup, CustomerRecord, RetrainJob
 
 admin.site.register(CustomerRecord)
+admin.site.register(RetrainJob)
+admin.site.register(ChurnRollup)
@@ -0,0 +1,121 @@
+import threading
+import time
+from collections import deque
+
+from .metrics import metrics
+
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024)
+
+
+class _Pending:
+    __slots__ = ("item", "enqueued", "dispatched", "result", "error", "done")
+
+    def __init__(self, item):
+        self.item = item
+        self.enqueued = time.monotonic()
+        self.dispatched = None
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class MicroBatcher:
+    """
+    Coalesces concurrent single-item calls into batched calls of fn.
+
+    submit() queues one item and blocks until its result is ready. A
+    dispatcher thread takes the queued items and calls fn(items) once for
+    all of them, handing each caller its own result. An item that finds the
+    queue otherwise empty and no batch in flight is dispatched at once, so a
+    request without concurrent company pays no batching delay; items that
+    queued up behind a running batch are dispatched together, waiting at
+    most window_ms (from the oldest item's arrival) for up to max_batch
+    items. An exception raised by fn is re-raised in every caller of that
+    batch; a caller whose item isn't scored within timeout seconds gets a
+    TimeoutError.
+
+    Achieved batch sizes are exported as churn_micro_batch_size and the time
+    each item waited in the queue as the batching.queue_delay stage.
+    """
+
+    def __init__(self, fn, window_ms=2.0, max_batch=64, workers=1, timeout=10.0, name="micro-batcher"):
+        self.fn = fn
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        self.workers = workers
+        self.timeout = timeout
+        self.name = name
+        self._queue = deque()
+        self._in_flight = 0
+        self._condition = threading.Condition()
+        self._threads = []
+        self.batch_sizes = metrics.register_histogram(
+            "churn_micro_batch_size", "Items scored per micro-batch", BATCH_SIZE_BUCKETS
+        )
+
+    def submit(self, item):
+        pending = _Pending(item)
+        with self._condition:
+            self._queue.append(pending)
+            self._condition.notify()
+        self._ensure_threads()
+
+        if not pending.done.wait(self.timeout):
+            with self._condition:
+                if pending in self._queue:
+                    # Not picked up yet: nobody is left to use the result
+                    self._queue.remove(pending)
+            raise TimeoutError(f"Prediction not scored within {self.timeout}s by the micro-batcher")
+        metrics.observe("batching.queue_delay", pending.dispatched - pending.enqueued)
+        if pending.error is not None:
+            raise pending.error
+        return pending.result
+
+    def _ensure_threads(self):
+        # Started lazily so forked workers each get their own dispatchers
+        if len(self._threads) == self.workers and all(thread.is_alive() for thread in self._threads):
+            return
+        with self._condition:
+            self._threads = [thread for thread in self._threads if thread.is_alive()]
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._run, name=f"{self.name}-{len(self._threads)}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _next_batch(self):
+        with self._condition:
+            while not self._queue:
+                self._condition.wait()
+            deadline = self._queue[0].enqueued + self.window
+            # A lone request with nothing in flight has nobody to share a batch with
+            while len(self._queue) < self.max_batch and (len(self._queue) > 1 or self._in_flight):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            batch = [self._queue.popleft() for _ in range(min(len(self._queue), self.max_batch))]
+            self._in_flight += 1
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                continue
+            dispatched = time.monotonic()
+            for pending in batch:
+                pending.dispatched = dispatched
+            self.batch_sizes.observe(len(batch))
+
+            try:
+                results = self.fn([pending.item for pending in batch])
+                for pending, result in zip(batch, results):
+                    pending.result = result
+            except Exception as e:
+                for pending in batch:
+                    pending.error = e
+            finally:
+                with self._condition:
+                    self._in_flight -= 1
+                for pending in batch:
+                    pending.done.set()
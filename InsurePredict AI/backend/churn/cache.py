@@ -0,0 +1,115 @@
+import copy
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+def feature_key(features, model_version, namespace="prediction"):
+    """
+    Cache key for one customer: a hash of the feature vector normalized to
+    float64 (so 1, 1.0 and -0.0/0.0 hash alike) plus the model version.
+    """
+    vector = np.asarray(features, dtype=np.float64).reshape(-1) + 0.0
+    digest = hashlib.blake2b(vector.tobytes(), digest_size=16)
+    digest.update(str(model_version).encode())
+    return f"churn:{namespace}:" + digest.hexdigest()
+
+
+class PredictionCache:
+    """
+    Bounded LRU cache of analysis results with an optional TTL.
+
+    Entries live in-process by default. With backend set to a Django cache
+    alias (e.g. "default" backed by Redis/Memcached) they are shared between
+    workers instead. Keys include the model version, so results from an older
+    model are never served once a retrain is published; the in-process store
+    is also dropped as soon as a new version is seen. namespace keeps caches
+    of different results apart in a shared backend.
+    """
+
+    def __init__(self, max_size=10000, ttl=None, backend=None, namespace="prediction"):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.backend = backend
+        self.namespace = namespace
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._version = None
+        self._lock = threading.Lock()
+
+    def _shared(self):
+        from django.core.cache import caches
+        return caches[self.backend]
+
+    def _check_version(self, model_version):
+        if model_version != self._version:
+            self._entries.clear()
+            self._version = model_version
+
+    def get(self, features, model_version):
+        if not self.max_size:
+            return None
+        key = feature_key(features, model_version, self.namespace)
+
+        if self.backend:
+            value = self._shared().get(key)
+        else:
+            with self._lock:
+                self._check_version(model_version)
+                entry = self._entries.get(key)
+                value = None
+                if entry is not None:
+                    expires_at, value = entry
+                    if expires_at is not None and expires_at < time.monotonic():
+                        del self._entries[key]
+                        value = None
+                    else:
+                        self._entries.move_to_end(key)
+
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        # Callers get their own copy; cached results must not be mutated
+        return copy.deepcopy(value)
+
+    def set(self, features, model_version, result):
+        if not self.max_size:
+            return
+        key = feature_key(features, model_version, self.namespace)
+        value = copy.deepcopy(result)
+
+        if self.backend:
+            self._shared().set(key, value, timeout=self.ttl)
+            return
+
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._check_version(model_version)
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "backend": self.backend or "local",
+                "model_version": self._version,
+            }
@@ -0,0 +1,308 @@
+import math
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+from django.db import close_old_connections
+
+from .inference import FEATURE_NAMES, get_pipeline
+from .metrics import metrics
+from .registry import feature_store
+
+PROBABILITY = "churn_probability"
+REPORT_QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+
+# Floor for empty bins, so PSI stays finite
+PSI_EPSILON = 1e-4
+
+
+class RunningMoments:
+    """
+    Count, mean, variance, min and max of each column, merged batch by batch
+    (Chan et al.'s parallel form of Welford's update): no raw values kept.
+    """
+
+    def __init__(self, n_columns):
+        self.count = 0
+        self.mean = np.zeros(n_columns)
+        self.m2 = np.zeros(n_columns)
+        self.min = np.full(n_columns, np.inf)
+        self.max = np.full(n_columns, -np.inf)
+
+    def update(self, block):
+        n = len(block)
+        if not n:
+            return
+        block_mean = block.mean(axis=0)
+        block_m2 = ((block - block_mean) ** 2).sum(axis=0)
+        total = self.count + n
+        delta = block_mean - self.mean
+        self.mean = self.mean + delta * (n / total)
+        self.m2 = self.m2 + block_m2 + delta ** 2 * (self.count * n / total)
+        self.count = total
+        self.min = np.minimum(self.min, block.min(axis=0))
+        self.max = np.maximum(self.max, block.max(axis=0))
+
+    @property
+    def std(self):
+        return np.sqrt(self.m2 / self.count) if self.count else np.full(len(self.mean), np.nan)
+
+
+class DriftReference:
+    """
+    The training distribution of each monitored column, as the interior
+    edges of its reference quantile bins (deciles by default; fewer for
+    discrete columns, whose quantiles coincide) and the share of reference
+    rows in each bin. Live values are counted into the same bins, which
+    makes the bin counts a fixed-size quantile sketch aligned with the
+    reference.
+    """
+
+    def __init__(self, columns, sample, bins=10):
+        self.columns = list(columns)
+        self.rows = len(sample)
+        self.built_at = time.time()
+        self.edges = []
+        self.expected = []
+        probabilities = np.linspace(0, 1, bins + 1)[1:-1]
+        for values in sample.T:
+            edges = np.unique(np.quantile(values, probabilities))
+            counts = np.bincount(np.searchsorted(edges, values, side="right"), minlength=len(edges) + 1)
+            self.edges.append(edges)
+            self.expected.append(counts / max(len(values), 1))
+        self.moments = RunningMoments(len(self.columns))
+        self.moments.update(sample)
+        self.quantiles = np.quantile(sample, REPORT_QUANTILES, axis=0).T if self.rows else None
+
+    def bin_counts(self, block):
+        """
+        Per column, the number of rows of block in each reference bin.
+        """
+        return [np.bincount(np.searchsorted(edges, block[:, i], side="right"), minlength=len(edges) + 1)
+                for i, edges in enumerate(self.edges)]
+
+
+def population_stability_index(counts, expected):
+    actual = np.maximum(counts / max(counts.sum(), 1), PSI_EPSILON)
+    expected = np.maximum(expected, PSI_EPSILON)
+    return float(np.sum((actual - expected) * np.log(actual / expected)))
+
+
+def ks_statistic(counts, expected):
+    # Largest CDF gap at the bin edges: the two-sample KS statistic evaluated
+    # where the sketch is exact (a lower bound of the raw-data statistic)
+    actual = np.cumsum(counts)[:-1] / max(counts.sum(), 1)
+    return float(np.max(np.abs(actual - np.cumsum(expected)[:-1]), initial=0.0))
+
+
+def sketch_quantiles(counts, edges, low, high, quantiles=REPORT_QUANTILES):
+    """
+    Quantiles interpolated linearly within the sketch bins; the outer bins
+    are bounded by the observed min and max.
+    """
+    total = counts.sum()
+    if not total:
+        return [None] * len(quantiles)
+    bounds = np.concatenate([[low], np.clip(edges, low, high), [high]])
+    cumulative = np.cumsum(counts)
+    estimates = []
+    for q in quantiles:
+        target = q * total
+        i = min(int(np.searchsorted(cumulative, target, side="left")), len(counts) - 1)
+        before = cumulative[i - 1] if i else 0
+        fraction = (target - before) / counts[i] if counts[i] else 0.0
+        estimates.append(float(bounds[i] + fraction * (bounds[i + 1] - bounds[i])))
+    return estimates
+
+
+class DriftMonitor:
+    """
+    Streaming data-drift monitor for the serving model.
+
+    Every scored batch updates running moments and reference-bin counts of
+    each feature in FEATURE_NAMES and of the churn probability: O(1) work per
+    prediction and no stored rows. The report compares them against the
+    training reference with the population stability index (PSI) and the
+    Kolmogorov-Smirnov statistic.
+
+    The reference is a sample of up to reference_rows feature-store rows the
+    current model version was trained on (its trained_store_rows mark), with
+    the churn probabilities that version gives them. It is built in a
+    background thread on the first batch after a (re)load; live statistics
+    restart with each model version. With psi_threshold set, a retrain
+    (drift_detected=True, so "auto" refits in full) is queued once any
+    column's PSI reaches it over at least min_observations predictions, at
+    most once per cooldown seconds. Statistics are per worker process.
+    """
+
+    def __init__(self, store, bins=10, reference_rows=50000, psi_threshold=None, min_observations=1000,
+                 check_every=500, cooldown=6 * 3600):
+        self.store = store
+        self.bins = bins
+        self.reference_rows = reference_rows
+        self.psi_threshold = psi_threshold
+        self.min_observations = min_observations
+        self.check_every = check_every
+        self.cooldown = cooldown
+        self.columns = FEATURE_NAMES + [PROBABILITY]
+        self.retrain = {"job_id": None, "queued_at": None, "max_psi": None}
+        self._next_retrain = 0.0
+        self._lock = threading.Lock()
+        self._reset(None)
+
+    def _reset(self, version):
+        self.version = version
+        self.since = time.time()
+        self.moments = RunningMoments(len(self.columns))
+        self.reference = None
+        self.reference_error = None
+        self.counts = None
+        self.binned = 0
+        self._last_check = 0
+        self._building = False
+
+    def observe(self, features_matrix, churn_probabilities, bundle):
+        """
+        Fold a scored batch into the live statistics.
+        """
+        block = np.column_stack([np.asarray(features_matrix, dtype=float),
+                                 np.asarray(churn_probabilities, dtype=float)])
+        with self._lock:
+            if bundle.version != self.version:
+                self._reset(bundle.version)
+            if self.reference is None and not self._building and self.reference_error is None:
+                self._building = True
+                threading.Thread(target=self._build_reference, args=(bundle,), name="drift-reference",
+                                 daemon=True).start()
+            self.moments.update(block)
+            if self.reference is not None:
+                for counts, new in zip(self.counts, self.reference.bin_counts(block)):
+                    counts += new
+                self.binned += len(block)
+            due = self._retrain_due()
+        if due is not None:
+            threading.Thread(target=self._queue_retrain, args=(due,), name="drift-retrain", daemon=True).start()
+
+    def _build_reference(self, bundle):
+        try:
+            end = bundle.metadata.get("trained_store_rows", self.store.rows) or self.store.rows
+            step = max(1, math.ceil(end / self.reference_rows))
+            # Every step-th row of [0, end), one memory-mapped segment at a time
+            sample = [block[(-first_row) % step::step]
+                      for first_row, block in self.store.iter_segments(FEATURE_NAMES, end_row=end)]
+            sample = np.concatenate(sample) if sample else np.empty((0, len(FEATURE_NAMES)))
+            if not len(sample):
+                raise ValueError("No training rows in the feature store")
+            probabilities, _ = get_pipeline(bundle).score(sample)
+            reference = DriftReference(self.columns, np.column_stack([sample, probabilities]), self.bins)
+        except Exception as e:
+            print(f"Error building drift reference: {str(e)}")
+            with self._lock:
+                if self.version == bundle.version:
+                    self.reference_error = str(e)
+                    self._building = False
+            return
+        with self._lock:
+            if self.version == bundle.version:
+                self.reference = reference
+                self.counts = [np.zeros(len(edges) + 1, dtype=np.int64) for edges in reference.edges]
+                self._building = False
+
+    def _max_psi(self):
+        scores = [population_stability_index(counts, expected)
+                  for counts, expected in zip(self.counts, self.reference.expected)]
+        return max(scores), self.columns[int(np.argmax(scores))]
+
+    def _retrain_due(self):
+        # Called under the lock after every batch; the PSI check itself runs every check_every rows
+        if self.psi_threshold is None or self.reference is None or self.binned < self.min_observations:
+            return None
+        if self.binned - self._last_check < self.check_every:
+            return None
+        self._last_check = self.binned
+        max_psi, column = self._max_psi()
+        if max_psi < self.psi_threshold or time.time() < self._next_retrain:
+            return None
+        self._next_retrain = time.time() + self.cooldown
+        return {"max_psi": round(max_psi, 4), "column": column}
+
+    def _queue_retrain(self, trigger):
+        from .jobs import submit_retrain
+        try:
+            job, created = submit_retrain(drift_detected=True)
+            self.retrain = {"job_id": job.pk, "queued_at": time.time(), "coalesced": not created, **trigger}
+        except Exception as e:
+            print(f"Error queuing drift retrain: {str(e)}")
+        finally:
+            close_old_connections()
+
+    def report(self):
+        """
+        Live statistics per column against the training reference, the
+        largest PSI and the columns at or above the retrain threshold.
+        """
+        with self._lock:
+            reference, counts, moments = self.reference, [c.copy() for c in self.counts or []], self.moments
+            mean, std, low, high = moments.mean.copy(), moments.std, moments.min.copy(), moments.max.copy()
+            report = {
+                "model_version": self.version,
+                "since": self.since,
+                "observations": moments.count,
+                "binned_observations": self.binned,
+                "reference": ({"rows": reference.rows, "built_at": reference.built_at} if reference is not None
+                              else {"status": "failed" if self.reference_error else "building",
+                                    "error": self.reference_error}),
+                "psi_threshold": self.psi_threshold,
+                "last_retrain": self.retrain,
+            }
+
+        columns = {}
+        for i, name in enumerate(self.columns):
+            column = {
+                "mean": float(mean[i]) if moments.count else None,
+                "std": float(std[i]) if moments.count else None,
+                "min": float(low[i]) if moments.count else None,
+                "max": float(high[i]) if moments.count else None,
+            }
+            if reference is not None:
+                column.update({
+                    "quantiles": dict(zip(map(str, REPORT_QUANTILES),
+                                          sketch_quantiles(counts[i], reference.edges[i], low[i], high[i]))),
+                    "reference_mean": float(reference.moments.mean[i]),
+                    "reference_std": float(reference.moments.std[i]),
+                    "reference_quantiles": dict(zip(map(str, REPORT_QUANTILES), reference.quantiles[i].tolist())),
+                    "psi": population_stability_index(counts[i], reference.expected[i]) if counts[i].sum() else None,
+                    "ks": ks_statistic(counts[i], reference.expected[i]) if counts[i].sum() else None,
+                })
+            columns[name] = column
+
+        scores = {name: column["psi"] for name, column in columns.items() if column.get("psi") is not None}
+        report["features"] = {name: columns[name] for name in FEATURE_NAMES}
+        report[PROBABILITY] = columns[PROBABILITY]
+        report["max_psi"] = max(scores.values()) if scores else None
+        report["drifted"] = sorted(name for name, score in scores.items()
+                                   if self.psi_threshold is not None and score >= self.psi_threshold)
+        return report
+
+    def max_psi(self):
+        with self._lock:
+            if self.reference is None or not self.binned:
+                return 0.0
+            return self._max_psi()[0]
+
+
+_drift_settings = getattr(settings, "CHURN_DRIFT", {})
+drift_monitor = DriftMonitor(
+    feature_store,
+    bins=_drift_settings.get("BINS", 10),
+    reference_rows=_drift_settings.get("REFERENCE_ROWS", 50000),
+    psi_threshold=_drift_settings.get("RETRAIN_PSI_THRESHOLD"),
+    min_observations=_drift_settings.get("MIN_OBSERVATIONS", 1000),
+    check_every=_drift_settings.get("CHECK_EVERY", 500),
+    cooldown=_drift_settings.get("RETRAIN_COOLDOWN", 6 * 3600),
+)
+metrics.register("churn_drift_max_psi", "gauge", "Largest feature/probability PSI against the training reference",
+                 drift_monitor.max_psi)
+metrics.register("churn_drift_observations", "gauge", "Predictions folded into the drift statistics",
+                 lambda: drift_monitor.moments.count)
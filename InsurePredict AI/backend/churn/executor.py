@@ -0,0 +1,89 @@
+import asyncio
+import contextvars
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from .metrics import metrics
+
+
+class InferenceExecutor:
+    """
+    Bounded worker pool for the async prediction view.
+
+    Model calls are CPU-bound but NumPy and XGBoost release the GIL while they
+    work, so a thread pool keeps every core busy without each worker process
+    loading its own copy of the models. At most max_pending requests may be
+    admitted at once (queued or running); try_acquire() fails beyond that so
+    the view can shed load with a 503 instead of queueing without bound.
+    """
+
+    def __init__(self, max_workers=None, max_pending=None):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_pending = max_pending or self.max_workers * 4
+        self.in_flight = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+        self._pool = None
+        self._background = set()
+
+    def _executor(self):
+        # Created on first use so forked workers each get their own threads
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="inference")
+        return self._pool
+
+    def try_acquire(self):
+        with self._lock:
+            if self.in_flight >= self.max_pending:
+                self.rejected += 1
+                return False
+            self.in_flight += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    async def run(self, fn, *args):
+        """
+        Await fn(*args) on the pool. The caller's context (e.g. the request's
+        stage timings) is carried over to the worker thread.
+        """
+        context = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(self._executor(), context.run, fn, *args)
+
+    def run_in_background(self, fn, *args):
+        """
+        Schedule fn(*args) on the pool without waiting for it, e.g. logging
+        that should happen after the response has been sent.
+        """
+        future = self._executor().submit(self._run_logged, fn, *args)
+        self._background.add(future)
+        future.add_done_callback(self._background.discard)
+        return future
+
+    @staticmethod
+    def _run_logged(fn, *args):
+        try:
+            fn(*args)
+        except Exception as e:
+            print(f"Error in background task {getattr(fn, '__name__', fn)}: {str(e)}")
+        finally:
+            close_old_connections()
+
+
+inference_executor = InferenceExecutor(
+    max_workers=getattr(settings, "CHURN_ASYNC_WORKERS", None),
+    max_pending=getattr(settings, "CHURN_ASYNC_MAX_PENDING", None),
+)
+
+metrics.register("churn_async_in_flight", "gauge", "Async predictions admitted and not yet scored",
+                 lambda: inference_executor.in_flight)
+metrics.register("churn_async_rejected_total", "counter", "Async predictions rejected with 503 under load",
+                 lambda: inference_executor.rejected)
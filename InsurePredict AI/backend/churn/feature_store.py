@@ -0,0 +1,403 @@
+import json
+import os
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+from .inference import FEATURE_NAMES
+
+try:
+    import fcntl
+except ImportError:  # Windows development machines; single process there
+    fcntl = None
+
+LABEL_COLUMN = "Churn"
+COLUMNS = FEATURE_NAMES + [LABEL_COLUMN]
+SCHEMA_VERSION = 1
+
+# Logged predictions store the served churn probability as their label; like
+# the API's is_churn_risk, more than this counts as churn
+CHURN_THRESHOLD = 0.5
+
+# Replaced segments stay on disk this long after compaction, so readers that
+# listed them just before the swap can still open them (open memory maps
+# outlive the purge)
+RETIRED_GRACE_SECONDS = 300
+
+
+def churn_labels(values, strict=True):
+    """
+    Binary churn labels (int64 0/1) from a label column holding observed 0/1
+    labels and/or logged churn probabilities: positive above CHURN_THRESHOLD.
+
+    Parameters:
+    - strict: raise for labels outside [0, 1]; otherwise they come back as
+      NaN (unknown) in a float64 result
+
+    Raises:
+    - ValueError for missing labels or labels outside [0, 1] when strict
+    """
+    values = np.asarray(values, dtype=np.float64)
+    invalid = ~((values >= 0) & (values <= 1))
+    if not invalid.any():
+        return (values > CHURN_THRESHOLD).astype(np.int64)
+    if strict:
+        raise ValueError(f"Churn labels should be 0/1 or probabilities in [0, 1]; {int(invalid.sum())} of "
+                         f"{len(values)} rows are not (e.g. {values[invalid][0]})")
+    return np.where(invalid, np.nan, values > CHURN_THRESHOLD)
+
+
+class FeatureStore:
+    """
+    Append-only columnar store of logged customers (features + churn label).
+
+    Layout under root:
+    - schema.json: column names and dtype, checked against FEATURE_NAMES
+    - MANIFEST.json: the live segments in append order, replaced atomically
+    - segments/<id>/cNN.npy: one float64 array per column, plus logged_at.npy
+      with the unix time each row was logged
+
+    Every append writes a new immutable segment and then adds it to the
+    manifest under an exclusive file lock, so any number of worker processes
+    can append concurrently. compact() merges runs of small adjacent segments
+    without changing row order, so row offsets stay stable: a row's position
+    in read() never changes, which the similarity index and the retrainer's
+    high-water marks rely on. Reads memory-map only the requested columns and
+    skip segments outside the requested row or time range.
+    """
+
+    def __init__(self, root, columns=COLUMNS, legacy_csv=None):
+        self.root = root
+        self.columns = list(columns)
+        self.legacy_csv = legacy_csv
+        self.segments_dir = os.path.join(root, "segments")
+        self.manifest_path = os.path.join(root, "MANIFEST.json")
+        self.schema_path = os.path.join(root, "schema.json")
+        self._manifest = None
+        self._manifest_stat = None
+        self._ready = False
+        self._lock = threading.RLock()
+
+    # --- setup -------------------------------------------------------------
+
+    def _ensure_ready(self):
+        if self._ready:
+            return
+        with self._lock:
+            if self._ready:
+                return
+            os.makedirs(self.segments_dir, exist_ok=True)
+            schema = {"version": SCHEMA_VERSION, "columns": self.columns, "dtype": "float64",
+                      "timestamp": "logged_at"}
+            with self._file_lock():
+                if os.path.exists(self.schema_path):
+                    with open(self.schema_path) as f:
+                        existing = json.load(f)
+                    if existing.get("columns") != self.columns:
+                        raise ValueError(f"Feature store at {self.root} has columns {existing.get('columns')}, "
+                                         f"expected {self.columns}")
+                else:
+                    self._write_json(self.schema_path, schema)
+            if self.legacy_csv:
+                self._bootstrap_from_csv(self.legacy_csv)
+            self._ready = True
+
+    def _bootstrap_from_csv(self, csv_path):
+        # One-off import of the pre-feature-store training log
+        if not os.path.exists(csv_path) or self._read_manifest().get("bootstrapped"):
+            return
+        with self._file_lock("compact"):
+            manifest = self._read_manifest(force=True)
+            if manifest.get("bootstrapped"):
+                return
+            if not manifest["segments"]:
+                for chunk in pd.read_csv(csv_path, chunksize=1000000, usecols=range(len(self.columns))):
+                    self._append(chunk.to_numpy(dtype=np.float64), np.zeros(len(chunk)))
+            with self._file_lock():
+                manifest = self._read_manifest(force=True)
+                manifest["bootstrapped"] = csv_path
+                self._write_manifest(manifest)
+
+    @contextmanager
+    def _file_lock(self, name="manifest"):
+        with self._lock, open(os.path.join(self.root, f".{name}.lock"), "a") as f:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    @staticmethod
+    def _write_json(path, payload):
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(payload, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    # --- manifest ----------------------------------------------------------
+
+    def _read_manifest(self, force=False):
+        try:
+            stat = os.stat(self.manifest_path)
+            key = (stat.st_mtime_ns, stat.st_ino, stat.st_size)
+        except FileNotFoundError:
+            return {"generation": 0, "segments": [], "retired": []}
+        if force or key != self._manifest_stat:
+            with open(self.manifest_path) as f:
+                self._manifest = json.load(f)
+            self._manifest_stat = key
+        return self._manifest
+
+    def _write_manifest(self, manifest):
+        manifest["generation"] = manifest.get("generation", 0) + 1
+        self._write_json(self.manifest_path, manifest)
+        self._manifest, self._manifest_stat = None, None
+
+    def segments(self):
+        """
+        Live segments in append order: dicts with id, rows, min_time and max_time.
+        """
+        self._ensure_ready()
+        return list(self._read_manifest()["segments"])
+
+    @property
+    def rows(self):
+        return sum(segment["rows"] for segment in self.segments())
+
+    @property
+    def generation(self):
+        self._ensure_ready()
+        return self._read_manifest().get("generation", 0)
+
+    # --- writes ------------------------------------------------------------
+
+    def _write_segment(self, data, timestamps):
+        segment_id = f"{time.time_ns():020d}-{os.getpid()}-{threading.get_ident() % 10**6:06d}"
+        staging_dir = os.path.join(self.segments_dir, f".staging-{segment_id}")
+        os.makedirs(staging_dir)
+        try:
+            for index in range(data.shape[1]):
+                np.save(os.path.join(staging_dir, f"c{index:02d}.npy"), np.ascontiguousarray(data[:, index]))
+            np.save(os.path.join(staging_dir, "logged_at.npy"), timestamps)
+        except Exception:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+            raise
+        os.rename(staging_dir, os.path.join(self.segments_dir, segment_id))
+        return {
+            "id": segment_id,
+            "rows": int(len(data)),
+            "min_time": float(timestamps.min()) if len(timestamps) else None,
+            "max_time": float(timestamps.max()) if len(timestamps) else None,
+        }
+
+    def append(self, rows, timestamps=None):
+        """
+        Append rows (n, len(columns)) as one new segment.
+
+        Parameters:
+        - rows: feature values followed by the label, in schema column order
+        - timestamps: unix time each row was logged (default: now)
+
+        Returns:
+        - The new segment id, or None for an empty append
+        """
+        self._ensure_ready()
+        return self._append(rows, timestamps)
+
+    def _append(self, rows, timestamps=None):
+        data = np.asarray(rows, dtype=np.float64)
+        if data.size == 0:
+            return None
+        if data.ndim != 2 or data.shape[1] != len(self.columns):
+            raise ValueError(f"Rows must have {len(self.columns)} values in schema column order")
+        timestamps = (np.full(len(data), time.time()) if timestamps is None
+                      else np.asarray(timestamps, dtype=np.float64))
+
+        segment = self._write_segment(data, timestamps)
+        with self._file_lock():
+            manifest = self._read_manifest(force=True)
+            manifest.setdefault("segments", []).append(segment)
+            self._write_manifest(manifest)
+        return segment["id"]
+
+    def import_csv(self, csv_path, chunk_rows=1000000, timestamp=0.0, compact=True):
+        """
+        Append a CSV in the logs/training_data.csv layout (header, 12 features,
+        label). Rows get the given timestamp, 0 meaning "logged before the
+        store existed". Returns the number of rows imported.
+        """
+        imported = 0
+        for chunk in pd.read_csv(csv_path, chunksize=chunk_rows, usecols=range(len(self.columns))):
+            self.append(chunk.to_numpy(dtype=np.float64), np.full(len(chunk), float(timestamp)))
+            imported += len(chunk)
+        if compact:
+            self.compact()
+        return imported
+
+    def compact(self, target_rows=1000000):
+        """
+        Merge runs of adjacent segments into segments of up to target_rows
+        rows, keeping row order. Segments already holding half of target_rows
+        are left alone, so large segments aren't rewritten on every call.
+        Returns the number of segments replaced.
+        """
+        self._ensure_ready()
+        with self._file_lock("compact"):
+            snapshot = self._read_manifest(force=True)["segments"]
+            runs, run, run_rows = [], [], 0
+            for segment in snapshot:
+                if run and (run_rows + segment["rows"] > target_rows or segment["rows"] >= target_rows // 2):
+                    runs.append(run)
+                    run, run_rows = [], 0
+                if segment["rows"] >= target_rows // 2:
+                    continue
+                run.append(segment)
+                run_rows += segment["rows"]
+            runs.append(run)
+            runs = [run for run in runs if len(run) > 1]
+            if not runs:
+                self._purge_retired()
+                return 0
+
+            merged = {}
+            for run in runs:
+                data = np.column_stack([np.concatenate([self._column(segment, index) for segment in run])
+                                        for index in range(len(self.columns))])
+                timestamps = np.concatenate([self._timestamps(segment) for segment in run])
+                merged[run[0]["id"]] = (run, self._write_segment(data, timestamps))
+
+            # Only compaction removes segments, so each run is still contiguous;
+            # appends made meanwhile are kept after it
+            with self._file_lock():
+                manifest = self._read_manifest(force=True)
+                replaced = {segment["id"] for run in runs for segment in run}
+                segments = []
+                for segment in manifest["segments"]:
+                    if segment["id"] in merged:
+                        segments.append(merged[segment["id"]][1])
+                    elif segment["id"] not in replaced:
+                        segments.append(segment)
+                now = time.time()
+                manifest["segments"] = segments
+                manifest["retired"] = manifest.get("retired", []) + [
+                    {"id": segment_id, "retired_at": now} for segment_id in sorted(replaced)
+                ]
+                self._write_manifest(manifest)
+            self._purge_retired()
+            return len(replaced)
+
+    def _purge_retired(self):
+        with self._file_lock():
+            manifest = self._read_manifest(force=True)
+            cutoff = time.time() - RETIRED_GRACE_SECONDS
+            expired = [entry for entry in manifest.get("retired", []) if entry["retired_at"] < cutoff]
+            if not expired:
+                return
+            for entry in expired:
+                shutil.rmtree(os.path.join(self.segments_dir, entry["id"]), ignore_errors=True)
+            manifest["retired"] = [entry for entry in manifest["retired"] if entry["retired_at"] >= cutoff]
+            self._write_manifest(manifest)
+
+    # --- reads -------------------------------------------------------------
+
+    def _column(self, segment, index):
+        return np.load(os.path.join(self.segments_dir, segment["id"], f"c{index:02d}.npy"), mmap_mode="r")
+
+    def _timestamps(self, segment):
+        return np.load(os.path.join(self.segments_dir, segment["id"], "logged_at.npy"), mmap_mode="r")
+
+    def _column_indices(self, columns):
+        if columns is None:
+            return list(range(len(self.columns)))
+        unknown = [column for column in columns if column not in self.columns]
+        if unknown:
+            raise KeyError(f"Unknown columns: {unknown}")
+        return [self.columns.index(column) for column in columns]
+
+    def iter_segments(self, columns=None, start_row=0, end_row=None, start_time=None, end_time=None,
+                      with_timestamps=False):
+        """
+        Yield (first_row, block) per segment overlapping the requested range,
+        where block is a (rows, len(columns)) float64 array and first_row the
+        store offset of its first row. Time bounds are [start_time, end_time)
+        in unix seconds; with_timestamps appends the logged_at column.
+
+        The segments are listed and memory-mapped when this is called, not as
+        the iteration reaches them: the open maps keep their files readable
+        after compaction retires and purges them, so a slow reader sees one
+        consistent snapshot however long it takes.
+        """
+        indices = self._column_indices(columns)
+        snapshot = []
+        offset = 0
+        for segment in self.segments():
+            lo, hi = offset, offset + segment["rows"]
+            offset = hi
+            if hi <= start_row or (end_row is not None and lo >= end_row):
+                continue
+            if start_time is not None and segment["max_time"] is not None and segment["max_time"] < start_time:
+                continue
+            if end_time is not None and segment["min_time"] is not None and segment["min_time"] >= end_time:
+                continue
+
+            first = max(start_row - lo, 0)
+            last = segment["rows"] if end_row is None else min(end_row - lo, segment["rows"])
+            snapshot.append((lo + first, [self._column(segment, index)[first:last] for index in indices],
+                             self._timestamps(segment)[first:last]))
+        return self._iter_snapshot(snapshot, start_time, end_time, with_timestamps)
+
+    @staticmethod
+    def _iter_snapshot(snapshot, start_time, end_time, with_timestamps):
+        for first_row, block, timestamps in snapshot:
+            if with_timestamps:
+                block = block + [timestamps]
+            block = np.column_stack(block) if block else np.empty((len(timestamps), 0))
+
+            if start_time is not None or end_time is not None:
+                mask = np.ones(len(timestamps), dtype=bool)
+                if start_time is not None:
+                    mask &= timestamps >= start_time
+                if end_time is not None:
+                    mask &= timestamps < end_time
+                if not mask.all():
+                    # Offsets no longer map 1:1 onto the returned rows
+                    block = block[mask]
+            yield first_row, block
+
+    def read(self, columns=None, start_row=0, end_row=None, start_time=None, end_time=None,
+             with_timestamps=False):
+        """
+        Rows of the requested columns (default: all) as one float64 array.
+        """
+        blocks = [block for _, block in self.iter_segments(columns, start_row, end_row, start_time, end_time,
+                                                           with_timestamps)]
+        if not blocks:
+            width = len(self._column_indices(columns)) + (1 if with_timestamps else 0)
+            return np.empty((0, width))
+        return np.concatenate(blocks)
+
+    def read_frame(self, columns=None, start_row=0, end_row=None, start_time=None, end_time=None,
+                   with_timestamps=False):
+        """
+        read() as a DataFrame with the schema column names.
+        """
+        names = list(columns or self.columns) + (["logged_at"] if with_timestamps else [])
+        return pd.DataFrame(self.read(columns, start_row, end_row, start_time, end_time, with_timestamps),
+                            columns=names)
+
+    def export_csv(self, csv_path):
+        """
+        Write the whole store in the legacy training_data.csv layout.
+        """
+        with open(csv_path, "w") as f:
+            f.write(",".join(self.columns) + "\n")
+            for _, block in self.iter_segments():
+                np.savetxt(f, block, delimiter=",", fmt="%.10g")
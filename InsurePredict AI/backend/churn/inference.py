@@ -0,0 +1,178 @@
+import threading
+import warnings
+
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import StandardScaler
+
+from .metrics import timer
+from .native import AffineScaler
+
+FEATURE_NAMES = ['Age', 'Gender', 'Earnings ($)', 'Claim Amount ($)',
+                 'Insurance Plan Amount ($)', 'Credit Score', 'Marital Status', 'days_passed',
+                 'Automobile Insurance', 'Health Insurance', 'Life Insurance', 'Plan Type']
+
+SCALE_COLUMNS = ['Age', 'Earnings ($)', 'Claim Amount ($)', 'Insurance Plan Amount ($)']
+SCALE_INDEX = [FEATURE_NAMES.index(column) for column in SCALE_COLUMNS]
+
+PLAN_TYPE_INDEX = FEATURE_NAMES.index('Plan Type')
+
+# Rows of the stacked affine transform
+CHURN, PLAN, PLAN_CHURN = 0, 1, 2
+
+
+def _is_xgboost(model):
+    return type(model).__module__.startswith("xgboost")
+
+
+def iteration_range(booster):
+    """
+    The trees predict_proba and the native export use: up to best_iteration
+    when early stopping recorded one, otherwise all of them.
+    """
+    best_iteration = booster.attr("best_iteration")
+    return (0, int(best_iteration) + 1) if best_iteration is not None else (0, 0)
+
+
+def _affine_from_scaler(scaler):
+    """
+    Full-width (multiplier, offset) vectors so that x * multiplier + offset
+    equals the scaler applied to SCALE_COLUMNS, with identity elsewhere.
+    Returns None for anything but a StandardScaler or its native export,
+    which are then applied with their own transform().
+    """
+    multiplier = np.ones(len(FEATURE_NAMES))
+    offset = np.zeros(len(FEATURE_NAMES))
+    if scaler is None:
+        return multiplier, offset
+    if isinstance(scaler, StandardScaler):
+        # mean_/scale_ are set even when with_mean/with_std turn them off
+        mean = scaler.mean_ if scaler.with_mean else None
+        scale = scaler.scale_ if scaler.with_std else None
+    elif isinstance(scaler, AffineScaler):
+        mean, scale = scaler.mean_, scaler.scale_
+    else:
+        return None
+
+    mean = np.zeros(len(SCALE_COLUMNS)) if mean is None else np.asarray(mean, dtype=float)
+    scale = np.ones(len(SCALE_COLUMNS)) if scale is None else np.asarray(scale, dtype=float)
+    multiplier[SCALE_INDEX] = 1.0 / scale
+    offset[SCALE_INDEX] = -mean / scale
+    return multiplier, offset
+
+
+class InferencePipeline:
+    """
+    The scalers and models of one ModelBundle compiled into NumPy operations.
+
+    At build time the StandardScaler mean/scale vectors of churn_scaler,
+    plan_scaler and plan_scaler_churn are expanded to full-width affine
+    coefficients and stacked into one (3, n_features) pair, so a single fused
+    multiply-add on a preallocated buffer produces all three scaled views of a
+    batch. Other scalers keep identity coefficients and are applied with
+    their own transform() afterwards. Models are then called on raw ndarrays: natively exported models
+    (churn/native.py) directly, pickled XGBoost models without feature-name
+    validation and with churn probabilities from inplace_predict.
+    """
+
+    def __init__(self, bundle):
+        self.version = bundle.version
+        self.churn_model = bundle.serving("churn_model")
+        self.plan_recommender = bundle.serving("plan_recommender")
+        self.plan_recommender_churn = bundle.serving("plan_recommender_churn")
+        self.churn_scaler = bundle.serving("churn_scaler")
+        self.plan_scaler = bundle.serving("plan_scaler")
+        self.plan_scaler_churn = bundle.serving("plan_scaler_churn")
+        if _is_xgboost(self.churn_model):
+            self.churn_booster = self.churn_model.get_booster()
+            self.churn_iteration_range = iteration_range(self.churn_booster)
+
+        scalers = (self.churn_scaler, self.plan_scaler, self.plan_scaler_churn)
+        affines = [_affine_from_scaler(scaler) for scaler in scalers]
+        # Row of the stacked transform -> scaler applied with transform()
+        self.uncompiled = {row: scaler for row, (scaler, affine) in enumerate(zip(scalers, affines))
+                           if affine is None}
+        affines = [_affine_from_scaler(None) if affine is None else affine for affine in affines]
+        self.multiplier = np.ascontiguousarray([affine[0] for affine in affines])
+        self.offset = np.ascontiguousarray([affine[1] for affine in affines])
+        self._local = threading.local()
+
+    def _buffer(self, n_rows):
+        # Reused per thread; only grows for larger batches
+        buffer = getattr(self._local, "buffer", None)
+        if buffer is None or buffer.shape[1] < n_rows:
+            buffer = np.empty((3, max(n_rows, 1), len(FEATURE_NAMES)))
+            self._local.buffer = buffer
+        return buffer[:, :n_rows]
+
+    def transform(self, features):
+        """
+        Scale a (n_rows, n_features) matrix for all three models at once.
+        Returns a (3, n_rows, n_features) view indexed by CHURN / PLAN / PLAN_CHURN.
+        """
+        scaled = self._buffer(len(features))
+        np.multiply(features, self.multiplier[:, None, :], out=scaled)
+        scaled += self.offset[:, None, :]
+        if self.uncompiled:
+            columns = pd.DataFrame(features[:, SCALE_INDEX], columns=SCALE_COLUMNS)
+            for row, scaler in self.uncompiled.items():
+                scaled[row][:, SCALE_INDEX] = scaler.transform(columns)
+        return scaled
+
+    def churn_probabilities(self, scaled_churn):
+        if _is_xgboost(self.churn_model):
+            return self.churn_booster.inplace_predict(scaled_churn, validate_features=False,
+                                                      iteration_range=self.churn_iteration_range)
+        with warnings.catch_warnings():
+            warnings.filterwarnings("ignore", message="X does not have valid feature names")
+            return self.churn_model.predict_proba(scaled_churn)[:, 1]
+
+    @staticmethod
+    def _predict_plan(recommender, plan_features):
+        if _is_xgboost(recommender):
+            return recommender.predict(plan_features, validate_features=False)
+        with warnings.catch_warnings():
+            warnings.filterwarnings("ignore", message="X does not have valid feature names")
+            return recommender.predict(plan_features)
+
+    def score(self, features):
+        """
+        Churn probability and recommended plan for every row of features.
+
+        Parameters:
+        - features: float ndarray of shape (n_rows, n_features) in FEATURE_NAMES order
+
+        Returns:
+        - (churn_probabilities, recommended_plans) as ndarrays in input order
+        """
+        with timer("model.transform"):
+            scaled = self.transform(features)
+        with timer("model.churn"):
+            churn_probabilities = np.asarray(self.churn_probabilities(scaled[CHURN]), dtype=float)
+        churn_mask = churn_probabilities > 0.5
+
+        # Default to the current plan when no scaler is available for a row
+        recommended_plans = features[:, PLAN_TYPE_INDEX].copy()
+        if self.plan_scaler_churn is not None:
+            routes = [(churn_mask, PLAN_CHURN, self.plan_recommender_churn),
+                      (~churn_mask, PLAN, self.plan_recommender)]
+        else:
+            routes = [(np.ones_like(churn_mask), PLAN, self.plan_recommender)]
+
+        for mask, row, recommender in routes:
+            if row == PLAN and self.plan_scaler is None:
+                continue
+            if not mask.any():
+                continue
+            with timer("model.plan"):
+                plan_features = np.delete(scaled[row][mask], PLAN_TYPE_INDEX, axis=1)
+                recommended_plans[mask] = self._predict_plan(recommender, plan_features)
+
+        return churn_probabilities, recommended_plans
+
+
+def get_pipeline(bundle):
+    """
+    The compiled pipeline for a bundle, built once and cached on it.
+    """
+    return bundle.derived("inference_pipeline", InferencePipeline)
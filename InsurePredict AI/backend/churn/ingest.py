@@ -0,0 +1,126 @@
+import csv
+import io
+import json
+
+import pandas as pd
+
+from .inference import FEATURE_NAMES, PLAN_TYPE_INDEX
+from .models import CustomerRecord
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet uploads need pyarrow; CSV works without it
+    pa = pq = None
+
+OUTPUT_FORMATS = ("ndjson", "csv")
+CSV_RESULT_COLUMNS = ["row", "churn_probability", "is_churn_risk", "recommended_plan",
+                      "recommended_plan_name", "recommendation"]
+
+# What reading a malformed upload raises: pandas parser and decoding errors are
+# ValueErrors; pyarrow raises ArrowException subclasses, or OSError for corrupt pages
+READ_ERRORS = (ValueError, OSError) + ((pa.ArrowException,) if pa is not None else ())
+
+
+def _column(name):
+    return FEATURE_NAMES.index(name)
+
+
+def is_parquet(uploaded_file):
+    name = (getattr(uploaded_file, "name", "") or "").lower()
+    return name.endswith((".parquet", ".pq")) or getattr(uploaded_file, "content_type", "") == "application/vnd.apache.parquet"
+
+
+def iter_feature_chunks(uploaded_file, chunk_rows=5000):
+    """
+    Read an uploaded customer file chunk by chunk as DataFrames with the
+    FEATURE_NAMES columns, in order. Columns are matched by name; extra columns (e.g. a
+    Churn label) are ignored. Only one chunk is held in memory at a time.
+
+    Raises:
+    - ValueError if the file lacks feature columns or Parquet support is missing,
+      or any of READ_ERRORS if it is malformed
+    """
+    if is_parquet(uploaded_file):
+        if pq is None:
+            raise ValueError("Parquet uploads require pyarrow; upload a CSV file instead")
+        parquet = pq.ParquetFile(uploaded_file)
+        missing = [name for name in FEATURE_NAMES if name not in parquet.schema_arrow.names]
+        if missing:
+            raise ValueError(f"Missing columns: {', '.join(missing)}")
+        for batch in parquet.iter_batches(batch_size=chunk_rows, columns=FEATURE_NAMES):
+            yield batch.to_pandas()[FEATURE_NAMES]
+        return
+
+    reader = pd.read_csv(uploaded_file, chunksize=chunk_rows,
+                         usecols=lambda column: column in FEATURE_NAMES)
+    for chunk in reader:
+        missing = [name for name in FEATURE_NAMES if name not in chunk.columns]
+        if missing:
+            raise ValueError(f"Missing columns: {', '.join(missing)}")
+        yield chunk[FEATURE_NAMES]
+
+
+def _insurance_type(row):
+    # First insurance the customer holds, in the record's choice order; the form defaults to health
+    for column, insurance_type in (('Health Insurance', 'health'), ('Life Insurance', 'life'),
+                                   ('Automobile Insurance', 'auto')):
+        if row[_column(column)]:
+            return insurance_type
+    return 'health'
+
+
+def records_from_features(features_matrix, results):
+    """
+    Unsaved CustomerRecord rows for scored feature rows, mapping the numeric
+    model encoding back to the record's choice fields.
+    """
+    records = []
+    for row, result in zip(features_matrix, results):
+        churn_data = result["churn_analysis"]
+        records.append(CustomerRecord(
+            age=int(row[_column('Age')]),
+            gender='M' if row[_column('Gender')] == 1 else 'F',
+            earnings=float(row[_column('Earnings ($)')]),
+            claim_amount=float(row[_column('Claim Amount ($)')]),
+            insurance_plan_amount=float(row[_column('Insurance Plan Amount ($)')]),
+            credit_score=bool(row[_column('Credit Score')]),
+            marital_status='M' if row[_column('Marital Status')] == 1 else 'S',
+            days_passed=int(row[_column('days_passed')]),
+            type_of_insurance=_insurance_type(row),
+            plan_type='basic' if row[PLAN_TYPE_INDEX] <= 1 else 'premium',
+            churn_probability=churn_data["churn_probability"],
+            recommendation=churn_data["recommendation"],
+        ))
+    return records
+
+
+def format_results(results, first_row, output_format):
+    """
+    Serialize one scored chunk for the streaming response.
+    """
+    if output_format == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for offset, result in enumerate(results):
+            churn_data, plan_data = result["churn_analysis"], result["plan_recommendation"]
+            writer.writerow([first_row + offset, churn_data["churn_probability"], churn_data["is_churn_risk"],
+                             plan_data["recommended_plan"], plan_data["recommended_plan_name"],
+                             churn_data["recommendation"]])
+        return buffer.getvalue()
+
+    return "".join(json.dumps({"row": first_row + offset, **result}) + "\n" for offset, result in enumerate(results))
+
+
+def format_error(first_row, n_rows, error, output_format):
+    """
+    Report a chunk (rows first_row .. first_row + n_rows - 1) that could not
+    be scored; n_rows is None when the file itself could not be read further.
+    """
+    last_row = None if n_rows is None else first_row + n_rows - 1
+    if output_format == "csv":
+        buffer = io.StringIO()
+        csv.writer(buffer).writerow([first_row if last_row is None else f"{first_row}-{last_row}",
+                                     "", "", "", "", f"error: {error}"])
+        return buffer.getvalue()
+    return json.dumps({"rows": [first_row, last_row], "error": str(error)}) + "\n"
@@ -0,0 +1,141 @@
+import os
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.utils import timezone
+
+from .models import RetrainJob
+
+# RetrainJob's churn_retrainjob_one_active constraint allows one such row at a time
+ACTIVE_STATUSES = ('queued', 'running')
+
+# A single worker thread: at most one training job runs in this process
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="retrain")
+_recovery_lock = threading.Lock()
+_recovered = False
+
+HOSTNAME = socket.gethostname()
+
+
+def _owner():
+    # Not cached: pre-forking servers import this module before forking workers
+    return f"{HOSTNAME}:{os.getpid()}"
+
+
+def _process_alive(pid):
+    if os.name != "posix":
+        return True  # os.kill(pid, 0) would terminate the process on Windows
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _fail_orphaned_jobs():
+    # Jobs run in the process that queued them; one owned by a process on this
+    # host that no longer exists (or by this pid, before this process queued
+    # anything) will never finish. Other hosts' jobs are left to the heartbeat timeout.
+    orphaned = []
+    for job_id, owner in RetrainJob.objects.filter(status__in=ACTIVE_STATUSES).values_list('id', 'owner'):
+        host, _, pid = owner.rpartition(':')
+        if host == HOSTNAME and pid.isdigit() and (owner == _owner() or not _process_alive(int(pid))):
+            orphaned.append(job_id)
+    if orphaned:
+        RetrainJob.objects.filter(pk__in=orphaned, status__in=ACTIVE_STATUSES).update(
+            status='failed', error='Abandoned: the worker process that owned the job exited',
+            finished_at=timezone.now()
+        )
+
+
+def _recover_once():
+    global _recovered
+    if _recovered:
+        return
+    with _recovery_lock:
+        if not _recovered:
+            _fail_orphaned_jobs()
+            _recovered = True
+
+
+def _expire_abandoned_jobs():
+    # A job whose heartbeat stopped belonged to a worker that died mid-training
+    timeout = getattr(settings, "CHURN_RETRAIN_JOB_TIMEOUT", 3600)
+    cutoff = timezone.now() - timedelta(seconds=timeout)
+    RetrainJob.objects.filter(status__in=ACTIVE_STATUSES, updated_at__lt=cutoff).update(
+        status='failed', error='Abandoned: no progress reported before the job timeout', finished_at=timezone.now()
+    )
+
+
+def _active_job():
+    return RetrainJob.objects.filter(status__in=ACTIVE_STATUSES).order_by('created_at').first()
+
+
+def submit_retrain(source=None, **options):
+    """
+    Queue a retraining job, or return the one already queued or running.
+    source defaults to the feature store (see model_utils.retrain_model).
+
+    Coalescing holds across worker processes: the database accepts one
+    active job at a time (see RetrainJob.Meta), and a submission that loses
+    the race returns the winner's job. The first submission in a process
+    fails jobs left active by dead processes on this host.
+
+    Returns:
+    - (RetrainJob, created) where created is False for a coalesced submission
+    """
+    _recover_once()
+    _expire_abandoned_jobs()
+    job = _active_job()
+    if job is not None:
+        return job, False
+    try:
+        with transaction.atomic():
+            job = RetrainJob.objects.create(options=options, message='Queued', owner=_owner())
+    except IntegrityError:
+        # Another worker queued a job between the lookup and the insert
+        job = _active_job()
+        if job is None:
+            raise
+        return job, False
+
+    transaction.on_commit(lambda: _executor.submit(_run_job, job.pk, source, options))
+    return job, True
+
+
+def _run_job(job_id, source, options):
+    close_old_connections()
+    try:
+        RetrainJob.objects.filter(pk=job_id).update(
+            status='running', started_at=timezone.now(), updated_at=timezone.now(), message='Starting'
+        )
+
+        def progress(fraction, message):
+            RetrainJob.objects.filter(pk=job_id).update(
+                progress=round(fraction, 3), message=message[:200], updated_at=timezone.now()
+            )
+
+        options.setdefault("full_refit_interval", getattr(settings, "CHURN_FULL_REFIT_INTERVAL", 7 * 24 * 3600))
+        options.setdefault("streaming_threshold", getattr(settings, "CHURN_STREAMING_THRESHOLD_BYTES", 512 * 1024 * 1024))
+        options.setdefault("tuning", {key.lower(): value for key, value in getattr(settings, "CHURN_TUNING", {}).items()})
+        # Imported here so serving workers only load XGBoost/scikit-learn when they train
+        from .model_utils import retrain_model
+        result = retrain_model(source, progress=progress, **options)
+        RetrainJob.objects.filter(pk=job_id).update(
+            status='succeeded', progress=1.0, message=result["message"][:200],
+            metrics=dict(result["metrics"], mode=result["mode"]), model_version=result["version"],
+            finished_at=timezone.now(), updated_at=timezone.now()
+        )
+    except Exception as e:
+        RetrainJob.objects.filter(pk=job_id).update(
+            status='failed', error=str(e), message='Failed',
+            finished_at=timezone.now(), updated_at=timezone.now()
+        )
+    finally:
+        close_old_connections()
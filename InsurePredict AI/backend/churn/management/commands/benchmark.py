@@ -0,0 +1,500 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import override_settings
+
+from churn import utils
+from churn.explain import explain_batch, feature_contributions
+from churn.inference import FEATURE_NAMES, PLAN_TYPE_INDEX, SCALE_COLUMNS, InferencePipeline, get_pipeline
+from churn.feature_store import FeatureStore
+from churn.model_utils import StoreSource, retrain_model
+from churn.prediction_log import prediction_log
+from churn.registry import ARTIFACTS, ModelBundle, ModelRegistry, TrainingDataset, models
+from churn.similarity import SimilarityIndex
+
+# raw_data sent with every /api/predict/ request of the end-to-end benchmark
+SAMPLE_RAW_DATA = {
+    "age": 35, "gender": "M", "earnings": 50000, "claim_amount": 6000, "insurance_plan_amount": 1200,
+    "credit_score": True, "marital_status": "S", "days_passed": 300, "type_of_insurance": "health",
+    "plan_type": "basic",
+}
+
+
+def synthetic_features(n_rows, seed=0):
+    """
+    Random customer rows in FEATURE_NAMES order with realistic value ranges.
+    """
+    rng = np.random.default_rng(seed)
+    return np.column_stack([
+        rng.integers(18, 80, n_rows),            # Age
+        rng.integers(0, 2, n_rows),              # Gender
+        rng.normal(60000, 15000, n_rows).round(),  # Earnings ($)
+        rng.normal(5000, 2000, n_rows).round(),  # Claim Amount ($)
+        rng.normal(1200, 300, n_rows).round(),   # Insurance Plan Amount ($)
+        rng.integers(0, 2, n_rows),              # Credit Score
+        rng.integers(0, 2, n_rows),              # Marital Status
+        rng.integers(0, 2000, n_rows),           # days_passed
+        rng.integers(0, 2, n_rows),              # Automobile Insurance
+        rng.integers(0, 2, n_rows),              # Health Insurance
+        rng.integers(0, 2, n_rows),              # Life Insurance
+        rng.integers(1, 4, n_rows),              # Plan Type
+    ]).astype(float)
+
+
+def synthetic_labels(features, seed=0):
+    """
+    Churn labels with some learnable signal: older, high-claim customers on
+    cheaper plans churn more often.
+    """
+    rng = np.random.default_rng(seed + 1)
+    logit = (0.04 * (features[:, 0] - 45) + 0.0004 * (features[:, 3] - 5000)
+             - 0.6 * (features[:, PLAN_TYPE_INDEX] - 2) + rng.normal(0, 1, len(features)))
+    return (logit > 0).astype(int)
+
+
+def write_training_csv(path, n_rows, seed=0, chunk_rows=1000000):
+    """
+    Write n_rows synthetic customers plus a Churn column in the
+    logs/training_data.csv layout, chunk by chunk so 10M rows fit in memory.
+    """
+    with open(path, "w") as f:
+        f.write(",".join(FEATURE_NAMES + ["Churn"]) + "\n")
+        for chunk, start in enumerate(range(0, n_rows, chunk_rows)):
+            features = synthetic_features(min(chunk_rows, n_rows - start), seed=seed + chunk)
+            data = np.column_stack([features, synthetic_labels(features, seed=seed + chunk)])
+            np.savetxt(f, data, delimiter=",", fmt="%g")
+
+
+class SyntheticWorkspace:
+    """
+    A temporary feature store of the requested size, served in place of the
+    real one for the duration of a benchmark run: it is imported from a
+    generated CSV, the similarity index is built over it and prediction
+    logging goes into it. Customer records are written to a throwaway test
+    database (created like Django's test runner does, and destroyed
+    afterwards), so records saved by live traffic in the real database are
+    never touched. The prediction cache is disabled so repeated rows are
+    actually scored.
+    """
+
+    def __init__(self, n_rows, seed=0):
+        self.n_rows = n_rows
+        self.seed = seed
+        self.directory = tempfile.mkdtemp(prefix="churn-benchmark-")
+        self.csv_path = os.path.join(self.directory, "training_data.csv")
+        self.store = FeatureStore(os.path.join(self.directory, "feature_store"))
+
+    def __enter__(self):
+        started = time.perf_counter()
+        write_training_csv(self.csv_path, self.n_rows, seed=self.seed)
+        self.generate_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        self.store.import_csv(self.csv_path)
+        self.import_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        X, y, vectors = TrainingDataset(self.store, os.path.join(self.directory, "training_data")).load()
+        self.index_seconds = time.perf_counter() - started
+
+        self._saved = (utils._similarity_index, utils.prediction_cache.max_size, prediction_log.store)
+        # Anything still buffered belongs to the real database; write it there first
+        prediction_log.flush()
+        self._database_name = connection.settings_dict["NAME"]
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        utils._similarity_index = SimilarityIndex(
+            X, y, vectors=vectors, backend=getattr(settings, "CHURN_SIMILARITY_BACKEND", "exact")
+        )
+        utils.prediction_cache.max_size = 0
+        prediction_log.store = self.store
+        return self
+
+    def __exit__(self, *exc_info):
+        prediction_log.flush()
+        utils._similarity_index, utils.prediction_cache.max_size, prediction_log.store = self._saved
+        connection.creation.destroy_test_db(self._database_name, verbosity=0)
+        # SQLite ignores close() while the name still points at its in-memory test
+        # database; now that it's restored, drop that connection for a fresh one
+        connection.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def summary(self):
+        return {
+            "rows": self.n_rows,
+            "csv_mb": round(os.path.getsize(self.csv_path) / 2**20, 1),
+            "generate_seconds": round(self.generate_seconds, 3),
+            "store_import_seconds": round(self.import_seconds, 3),
+            "index_build_seconds": round(self.index_seconds, 3),
+        }
+
+
+def legacy_score(bundle, features_matrix):
+    """
+    The pandas scaler + model path that served /api/predict/ before the
+    compiled pipeline, kept as the benchmark baseline.
+    """
+    input_data = pd.DataFrame(features_matrix, columns=FEATURE_NAMES).astype(float)
+    plan_columns = [column for column in FEATURE_NAMES if column != "Plan Type"]
+
+    churn_input = input_data.copy()
+    churn_input.loc[:, SCALE_COLUMNS] = bundle.get("churn_scaler").transform(churn_input[SCALE_COLUMNS])
+    churn_probabilities = bundle.get("churn_model").predict_proba(churn_input)[:, 1]
+    churn_mask = churn_probabilities > 0.5
+
+    recommended_plans = input_data["Plan Type"].to_numpy().copy()
+    for mask, scaler, recommender in ((churn_mask, "plan_scaler_churn", "plan_recommender_churn"),
+                                      (~churn_mask, "plan_scaler", "plan_recommender")):
+        if not mask.any():
+            continue
+        plan_input = input_data.loc[mask].copy()
+        plan_input.loc[:, SCALE_COLUMNS] = bundle.get(scaler).transform(plan_input[SCALE_COLUMNS])
+        recommended_plans[mask] = bundle.get(recommender).predict(plan_input[plan_columns])
+    return churn_probabilities, recommended_plans
+
+
+def latency_summary(samples):
+    samples = np.asarray(samples) * 1000.0
+    return {
+        "calls": int(len(samples)),
+        "p50_ms": round(float(np.percentile(samples, 50)), 4),
+        "p99_ms": round(float(np.percentile(samples, 99)), 4),
+        "mean_ms": round(float(samples.mean()), 4),
+    }
+
+
+def time_calls(fn, inputs, warmup=20):
+    for row in inputs[:warmup]:
+        fn(row)
+    samples = []
+    for row in inputs:
+        started = time.perf_counter()
+        fn(row)
+        samples.append(time.perf_counter() - started)
+    return latency_summary(samples)
+
+
+# Run in a fresh interpreter: time and peak memory to import the loader and load a bundle
+COLD_LOAD_SCRIPT = """
+import json, os, resource, sys, time
+started = time.perf_counter()
+directory, native = sys.argv[1], sys.argv[2] == "1"
+if native:
+    from churn.native import load_model, read_manifest
+    manifest = read_manifest(directory)
+    loaded = [load_model(os.path.join(directory, "native"), entry) for entry in manifest.values()]
+else:
+    import joblib
+    loaded = [joblib.load(os.path.join(directory, name), mmap_mode="r")
+              for name in sys.argv[3:] if os.path.exists(os.path.join(directory, name))]
+# ru_maxrss survives exec (it would report the benchmark's own peak); VmHWM doesn't
+try:
+    with open("/proc/self/status") as f:
+        peak_kb = next(int(line.split()[1]) for line in f if line.startswith("VmHWM:"))
+except (OSError, StopIteration):
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({"seconds": time.perf_counter() - started, "artifacts": len(loaded), "max_rss_mb": peak_kb / 1024,
+                  "xgboost_imported": "xgboost" in sys.modules, "sklearn_imported": "sklearn" in sys.modules}))
+"""
+
+
+def cold_load(directory, native):
+    result = subprocess.run([sys.executable, "-c", COLD_LOAD_SCRIPT, directory, "1" if native else "0",
+                             *ARTIFACTS.values()],
+                            capture_output=True, text=True, cwd=settings.BASE_DIR, check=True)
+    summary = json.loads(result.stdout)
+    summary["seconds"] = round(summary["seconds"], 3)
+    summary["max_rss_mb"] = round(summary["max_rss_mb"], 1)
+    return summary
+
+
+def bench_inference(options):
+    """
+    Per-call latency of scaling + churn model + plan recommender for single
+    rows: legacy pandas path vs compiled NumPy pipeline on the pickled models,
+    and, if the bundle has a native export, on the native models, plus the
+    cold-start cost of loading either kind in a fresh process.
+    """
+    bundle = models.current()
+    pipeline = InferencePipeline(ModelBundle(bundle.version, bundle.directory, prefer_native=False))
+    rows = synthetic_features(options["calls"], seed=options["seed"])
+    single_rows = [row.reshape(1, -1) for row in rows]
+
+    # Both paths must agree before their timings mean anything
+    legacy_probs, legacy_plans = legacy_score(bundle, rows)
+    probs, plans = pipeline.score(rows)
+    max_diff = float(np.max(np.abs(legacy_probs - probs)))
+
+    before = time_calls(lambda row: legacy_score(bundle, row), single_rows)
+    after = time_calls(pipeline.score, single_rows)
+    results = {
+        "model_version": bundle.version,
+        "max_probability_diff": max_diff,
+        "plans_match": bool(np.array_equal(legacy_plans, plans)),
+        "legacy_pandas": before,
+        "compiled_numpy": after,
+        "p50_speedup": round(before["p50_ms"] / after["p50_ms"], 2),
+        "p99_speedup": round(before["p99_ms"] / after["p99_ms"], 2),
+    }
+
+    if bundle.native_manifest():
+        native_pipeline = InferencePipeline(ModelBundle(bundle.version, bundle.directory, prefer_native=True))
+        native_probs, native_plans = native_pipeline.score(rows)
+        native = time_calls(native_pipeline.score, single_rows)
+        results["native"] = {
+            "artifacts": sorted(bundle.native_manifest()),
+            "max_probability_diff": float(np.max(np.abs(legacy_probs - native_probs))),
+            "plans_match": bool(np.array_equal(legacy_plans, native_plans)),
+            "latency": native,
+            "p50_speedup_vs_pickled": round(after["p50_ms"] / native["p50_ms"], 2),
+            "cold_load_pickled": cold_load(bundle.directory, native=False),
+            "cold_load_native": cold_load(bundle.directory, native=True),
+        }
+    return results
+
+
+def bench_explain(options):
+    """
+    Cost of TreeSHAP explanations (XGBoost pred_contribs) relative to plain
+    churn scoring, per single row and for one --calls-row batch, uncached
+    and cached, plus a check that the contributions add up to the served
+    churn probability.
+    """
+    bundle = models.current()
+    pipeline = get_pipeline(bundle)
+    rows = synthetic_features(options["calls"], seed=options["seed"] + 400)
+    single_rows = [row.reshape(1, -1) for row in rows]
+
+    probabilities, _ = pipeline.score(rows)
+    contributions = feature_contributions(rows, bundle)
+    explained = 1.0 / (1.0 + np.exp(-contributions.sum(axis=1)))
+
+    score = time_calls(pipeline.score, single_rows)
+    explain = time_calls(lambda row: explain_batch(row, bundle, use_cache=False), single_rows)
+    explain_top3 = time_calls(lambda row: explain_batch(row, bundle, top_k=3, use_cache=False), single_rows)
+    for row in single_rows:
+        explain_batch(row, bundle)
+    cached = time_calls(lambda row: explain_batch(row, bundle), single_rows)
+
+    def batch_seconds(fn, repeats=5):
+        fn()
+        started = time.perf_counter()
+        for _ in range(repeats):
+            fn()
+        return (time.perf_counter() - started) / repeats
+
+    batch_score = batch_seconds(lambda: pipeline.score(rows))
+    batch_explain = batch_seconds(lambda: explain_batch(rows, bundle, use_cache=False))
+    return {
+        "model_version": bundle.version,
+        "max_probability_diff": float(np.max(np.abs(explained - probabilities))),
+        "single_row": {
+            "score": score,
+            "explain": explain,
+            "explain_top_3": explain_top3,
+            "explain_cached": cached,
+            "p50_cost_vs_score": round(explain["p50_ms"] / score["p50_ms"], 2),
+        },
+        "batch": {
+            "rows": len(rows),
+            "score_ms": round(batch_score * 1000, 3),
+            "explain_ms": round(batch_explain * 1000, 3),
+            "cost_vs_score": round(batch_explain / batch_score, 2),
+        },
+    }
+
+
+def bench_analysis(options):
+    """
+    Per-call latency of the similarity search, the recommendation rules and
+    the full get_comprehensive_analysis for single customers against a
+    training set of --rows rows.
+    """
+    rows = synthetic_features(options["calls"], seed=options["seed"] + 100)
+    return {
+        "dataset": options["workspace"].summary(),
+        "get_similar_customers": time_calls(utils.get_similar_customers, rows),
+        "generate_recommendations": time_calls(utils.generate_recommendations, rows),
+        "get_comprehensive_analysis": time_calls(lambda row: utils.get_comprehensive_analysis(list(row)), rows),
+    }
+
+
+def _post_test_client():
+    # Django's test client isn't thread-safe; one per worker thread
+    local = threading.local()
+
+    def post(payload):
+        if not hasattr(local, "client"):
+            local.client = Client()
+        response = local.client.post("/api/predict/", payload, content_type="application/json")
+        return response.status_code
+
+    return post
+
+
+def _post_live(url):
+    def post(payload):
+        request = urllib.request.Request(url, data=json.dumps(payload).encode(),
+                                         headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(request) as response:
+            return response.status
+    return post
+
+
+def bench_endpoint(options):
+    """
+    Requests per second and latency percentiles of /api/predict/ under
+    --clients concurrent clients: in-process through Django's test client,
+    or against a running server (e.g. gunicorn) given with --url.
+    """
+    rows = synthetic_features(options["calls"], seed=options["seed"] + 200)
+    # A live server scores against (and logs into) its own data, not the synthetic workspace
+    dataset = "target server's own data" if options["url"] else options["workspace"].summary()
+    payloads = [{"features": [float(value) for value in row], "raw_data": dict(SAMPLE_RAW_DATA)} for row in rows]
+
+    if options["url"]:
+        post, environment = _post_live(options["url"]), nullcontext()
+    else:
+        # The test client sends Host: testserver
+        post = _post_test_client()
+        environment = override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"])
+
+    def timed_post(payload):
+        started = time.perf_counter()
+        status = post(payload)
+        return time.perf_counter() - started, status
+
+    with environment, ThreadPoolExecutor(max_workers=options["clients"]) as pool:
+        list(pool.map(timed_post, payloads[:options["clients"] * 5]))  # warm up every client
+        started = time.perf_counter()
+        outcomes = list(pool.map(timed_post, payloads))
+        elapsed = time.perf_counter() - started
+
+    latencies = [seconds for seconds, _ in outcomes]
+    errors = sum(1 for _, status in outcomes if status != 200)
+    return {
+        "dataset": dataset,
+        "target": options["url"] or "django test client",
+        "clients": options["clients"],
+        "requests_per_second": round(len(outcomes) / elapsed, 1),
+        "errors": errors,
+        "latency": latency_summary(latencies),
+    }
+
+
+def bench_retrain(options):
+    """
+    Wall time of retrain_model on the synthetic feature store, for
+    each mode in --retrain-modes. Versions are published into a scratch
+    registry, never the live one. Incremental runs continue the previous
+    model on 10% freshly appended rows.
+    """
+    workspace = options["workspace"]
+    # Scratch registry seeded with the live artifacts, which stay untouched
+    registry_dir = os.path.join(workspace.directory, "models")
+    os.makedirs(registry_dir)
+    for filename in ARTIFACTS.values():
+        source = os.path.join(models.current().directory, filename)
+        if os.path.exists(source):
+            shutil.copy2(source, registry_dir)
+    # Switched synchronously after each publish; no background reloads to outlive the scratch dir
+    registry = ModelRegistry(registry_dir, check_interval=float("inf"))
+    results = {"dataset": workspace.summary()}
+    for mode in options["retrain_modes"]:
+        if mode == "incremental":
+            features = synthetic_features(max(workspace.n_rows // 10, 1), seed=options["seed"] + 300)
+            workspace.store.append(np.column_stack([features, synthetic_labels(features, options["seed"] + 300)]))
+
+        started = time.perf_counter()
+        result = retrain_model(StoreSource(workspace.store), registry=registry, mode=mode)
+        registry.reload()
+        results[mode] = {
+            "seconds": round(time.perf_counter() - started, 3),
+            "mode": result["mode"],
+            "metrics": result["metrics"],
+        }
+    return results
+
+
+SUITES = {
+    "inference": bench_inference,
+    "explain": bench_explain,
+    "analysis": bench_analysis,
+    "endpoint": bench_endpoint,
+    "retrain": bench_retrain,
+}
+
+# Suites that run against the synthetic training set
+DATASET_SUITES = {"analysis", "endpoint", "retrain"}
+
+
+class Command(BaseCommand):
+    help = ("Run churn service benchmarks against a synthetic training set and print (or save) "
+            "the results as JSON, e.g. `manage.py benchmark analysis endpoint --rows 1000000 --output bench.json`.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("suites", nargs="*", default=list(SUITES), choices=list(SUITES),
+                            help="Benchmark suites to run (default: all)")
+        parser.add_argument("--calls", type=int, default=2000, help="Timed calls per latency benchmark")
+        parser.add_argument("--seed", type=int, default=0, help="Seed for synthetic customer rows")
+        parser.add_argument("--rows", type=int, default=10000,
+                            help="Rows in the synthetic training set (e.g. 10000 to 10000000)")
+        parser.add_argument("--clients", type=int, default=8, help="Concurrent clients for the endpoint benchmark")
+        parser.add_argument("--url", help="Benchmark a running server at this predict URL instead of the test client")
+        parser.add_argument("--scratch-server", action="store_true",
+                            help="Confirm that --url is a disposable server: every request is logged into its "
+                                 "feature store and database")
+        parser.add_argument("--retrain-modes", nargs="+", default=["full", "incremental"],
+                            choices=["full", "incremental", "streaming"], help="Training modes to time")
+        parser.add_argument("--output", help="Write the JSON report to this file")
+
+    def handle(self, *args, **options):
+        suites = options["suites"] or list(SUITES)
+        if options["url"] and not options["scratch_server"]:
+            raise CommandError(f"--url sends {options['calls']} synthetic predictions to {options['url']}, which logs "
+                               "them into that server's feature store and database. Only point it at a scratch "
+                               "deployment and confirm with --scratch-server.")
+        report = {
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "commit": _git_commit(),
+            "options": {key: options[key] for key in ("calls", "seed", "rows", "clients", "url", "retrain_modes")},
+            "results": {},
+        }
+
+        workspace = nullcontext()
+        if DATASET_SUITES.intersection(suites):
+            self.stderr.write(f"Generating {options['rows']} synthetic training rows...")
+            workspace = SyntheticWorkspace(options["rows"], seed=options["seed"])
+        with workspace as options["workspace"]:
+            for suite in suites:
+                self.stderr.write(f"Running {suite} benchmark...")
+                report["results"][suite] = SUITES[suite](options)
+
+        payload = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(payload)
+        self.stdout.write(payload)
+
+
+def _git_commit():
+    # Lets reports from different commits be told apart when compared
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(__file__)).stdout.strip() or None
+    except OSError:
+        return None
@@ -0,0 +1,36 @@
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from churn.native import export_bundle
+from churn.registry import ARTIFACTS, ModelBundle, models
+
+
+class Command(BaseCommand):
+    help = ("Export a model version's pickled artifacts to native formats (XGBoost JSON, NumPy arrays) "
+            "under <version>/native/, which serving workers load instead of the pickles. "
+            "New versions are exported when published; use this for older versions and the legacy models/ directory.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--model-version", help="Version to export (default: the current one; 'legacy' for models/*.pkl)")
+
+    def handle(self, *args, **options):
+        version = options["model_version"] or models.current().version
+        if version == "legacy":
+            directory = models.models_dir
+        elif version in models.versions():
+            directory = os.path.join(models.versions_dir, version)
+        else:
+            raise CommandError(f"Unknown model version '{version}'")
+
+        bundle = ModelBundle(version, directory)
+        try:
+            exported, skipped = export_bundle(directory, {
+                name: bundle.get(name) for name, filename in ARTIFACTS.items()
+                if os.path.exists(os.path.join(directory, filename))
+            })
+        except OSError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(json.dumps({"version": version, "exported": exported, "skipped": skipped}, indent=2))
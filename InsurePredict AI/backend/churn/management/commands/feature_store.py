@@ -0,0 +1,50 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from churn.registry import feature_store, training_data
+
+
+class Command(BaseCommand):
+    help = "Inspect and maintain the feature store under logs/feature_store/."
+
+    def add_arguments(self, parser):
+        subcommands = parser.add_subparsers(dest="action", required=True)
+        subcommands.add_parser("info", help="Print row/segment counts and the time range as JSON")
+        import_csv = subcommands.add_parser("import-csv", help="Append a CSV in the training_data.csv layout")
+        import_csv.add_argument("path")
+        import_csv.add_argument("--timestamp", type=float, default=0.0,
+                                help="logged_at for the imported rows (default 0: unknown)")
+        compact = subcommands.add_parser("compact", help="Merge small adjacent segments and the similarity cache's parts")
+        compact.add_argument("--target-rows", type=int, default=1000000)
+        export_csv = subcommands.add_parser("export-csv", help="Write the store in the training_data.csv layout")
+        export_csv.add_argument("path")
+
+    def handle(self, *args, **options):
+        action = options["action"]
+        try:
+            if action == "import-csv":
+                rows = feature_store.import_csv(options["path"], timestamp=options["timestamp"])
+                self.stdout.write(f"Imported {rows} rows from {options['path']}")
+            elif action == "compact":
+                replaced = feature_store.compact(target_rows=options["target_rows"])
+                self.stdout.write(f"Compacted {replaced} segments")
+                if training_data.compact(force=True):
+                    self.stdout.write("Folded the similarity cache's parts into its base")
+            elif action == "export-csv":
+                feature_store.export_csv(options["path"])
+                self.stdout.write(f"Exported {feature_store.rows} rows to {options['path']}")
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        segments = feature_store.segments()
+        times = [segment[key] for segment in segments for key in ("min_time", "max_time") if segment[key]]
+        self.stdout.write(json.dumps({
+            "root": feature_store.root,
+            "columns": feature_store.columns,
+            "rows": sum(segment["rows"] for segment in segments),
+            "segments": len(segments),
+            "generation": feature_store.generation,
+            "first_logged_at": min(times) if times else None,
+            "last_logged_at": max(times) if times else None,
+        }, indent=2))
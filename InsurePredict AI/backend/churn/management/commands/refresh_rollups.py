@@ -0,0 +1,23 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from churn.rollups import rebuild_rollups, refresh_rollups, watermark_status
+
+
+class Command(BaseCommand):
+    help = ("Fold saved predictions newer than the watermark into the daily churn-risk rollups "
+            "(run periodically, e.g. from cron, when REFRESH_ON_FLUSH is off).")
+
+    def add_arguments(self, parser):
+        rollup_settings = getattr(settings, "CHURN_ROLLUPS", {})
+        parser.add_argument("--rebuild", action="store_true", help="Recompute all rollups from scratch")
+        parser.add_argument("--settle-seconds", type=float, default=rollup_settings.get("SETTLE_SECONDS", 5.0))
+        parser.add_argument("--batch-size", type=int, default=rollup_settings.get("BATCH_SIZE", 50000))
+
+    def handle(self, *args, **options):
+        refresh = rebuild_rollups if options["rebuild"] else refresh_rollups
+        rolled_up = refresh(settle_seconds=options["settle_seconds"], batch_size=options["batch_size"])
+        self.stdout.write(f"Rolled up {rolled_up} records")
+        self.stdout.write(json.dumps(watermark_status(), indent=2, default=str))
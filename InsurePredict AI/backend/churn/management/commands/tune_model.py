@@ -0,0 +1,45 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from churn.model_utils import CsvSource, retrain_model
+from churn.tuning import SEARCH_STRATEGIES
+
+
+class Command(BaseCommand):
+    help = ("Retrain the churn model with a parallel hyperparameter search and publish it if it beats the "
+            "current model, e.g. `manage.py tune_model --strategy random --candidates 40 --output tuning.json`.")
+
+    def add_arguments(self, parser):
+        defaults = {key.lower(): value for key, value in getattr(settings, "CHURN_TUNING", {}).items()}
+        parser.add_argument("--csv", help="Train on this CSV (training_data.csv layout) instead of the feature store")
+        parser.add_argument("--strategy", choices=SEARCH_STRATEGIES, default=defaults.get("strategy", "halving"))
+        parser.add_argument("--candidates", type=int, default=defaults.get("n_candidates", 27),
+                            help="Parameter sets to evaluate")
+        parser.add_argument("--jobs", type=int, default=defaults.get("n_jobs"),
+                            help="Worker processes (default: all cores)")
+        parser.add_argument("--max-rounds", type=int, default=defaults.get("max_rounds", 500))
+        parser.add_argument("--early-stopping-rounds", type=int, default=defaults.get("early_stopping_rounds", 20))
+        parser.add_argument("--output", help="Also write the JSON report to this file")
+
+    def handle(self, *args, **options):
+        tuning = {
+            "strategy": options["strategy"],
+            "n_candidates": options["candidates"],
+            "n_jobs": options["jobs"],
+            "max_rounds": options["max_rounds"],
+            "early_stopping_rounds": options["early_stopping_rounds"],
+        }
+        source = CsvSource(options["csv"]) if options["csv"] else None
+        try:
+            result = retrain_model(source, mode="tune", tuning=tuning,
+                                   progress=lambda fraction, message: self.stderr.write(message))
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        payload = json.dumps(result, indent=2, default=str)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(payload)
+        self.stdout.write(payload)
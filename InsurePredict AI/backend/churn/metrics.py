@@ -0,0 +1,169 @@
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds (seconds) of the latency histogram buckets, 50µs to 10s
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Stage timings of the request being handled, for the Server-Timing header
+_request_timings = contextvars.ContextVar("churn_request_timings", default=None)
+
+
+class Histogram:
+    """
+    Cumulative-bucket latency histogram in the Prometheus layout. observe()
+    is a bisect and three additions under a lock, cheap enough to leave on.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        position = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[position] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self):
+        """
+        (cumulative bucket counts including +Inf, sum, count)
+        """
+        with self._lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        cumulative, running = [], 0
+        for value in counts:
+            running += value
+            cumulative.append(running)
+        return cumulative, total, count
+
+
+class MetricsRegistry:
+    """
+    In-process metrics for the prediction service: one latency histogram per
+    pipeline stage, plus gauges/counters read from callbacks when scraped.
+    Values are per worker process; Prometheus sums them across targets.
+    """
+
+    def __init__(self):
+        self._stages = {}
+        self._histograms = []
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def histogram(self, stage):
+        histogram = self._stages.get(stage)
+        if histogram is None:
+            with self._lock:
+                histogram = self._stages.setdefault(stage, Histogram())
+        return histogram
+
+    def observe(self, stage, seconds):
+        self.histogram(stage).observe(seconds)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings.append((stage, seconds))
+
+    @contextmanager
+    def timer(self, stage):
+        """
+        Time the enclosed block as one observation of stage.
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - started)
+
+    def register_histogram(self, name, help_text, buckets):
+        """
+        A standalone histogram (e.g. of batch sizes) exported under name.
+        """
+        histogram = Histogram(buckets)
+        self._histograms.append((name, help_text, histogram))
+        return histogram
+
+    def register(self, name, metric_type, help_text, callback):
+        """
+        Export callback() as a gauge/counter named name on every scrape.
+        callback returns a number, or a dict of {label value: number} which is
+        exported with a "key" label.
+        """
+        self._callbacks.append((name, metric_type, help_text, callback))
+
+    def render(self):
+        """
+        All metrics in the Prometheus text exposition format (version 0.0.4).
+        """
+        lines = [
+            "# HELP churn_stage_seconds Time spent in each stage of the prediction pipeline",
+            "# TYPE churn_stage_seconds histogram",
+        ]
+        for stage, histogram in sorted(self._stages.items()):
+            cumulative, total, count = histogram.snapshot()
+            bounds = [repr(float(bound)) for bound in histogram.buckets] + ["+Inf"]
+            for bound, value in zip(bounds, cumulative):
+                lines.append(f'churn_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {value}')
+            lines.append(f'churn_stage_seconds_sum{{stage="{stage}"}} {total!r}')
+            lines.append(f'churn_stage_seconds_count{{stage="{stage}"}} {count}')
+
+        for name, help_text, histogram in self._histograms:
+            cumulative, total, count = histogram.snapshot()
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} histogram")
+            bounds = [repr(float(bound)) for bound in histogram.buckets] + ["+Inf"]
+            for bound, value in zip(bounds, cumulative):
+                lines.append(f'{name}_bucket{{le="{bound}"}} {value}')
+            lines.append(f"{name}_sum {total!r}")
+            lines.append(f"{name}_count {count}")
+
+        for name, metric_type, help_text, callback in self._callbacks:
+            try:
+                value = callback()
+            except Exception as e:
+                print(f"Error collecting metric {name}: {str(e)}")
+                continue
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            if isinstance(value, dict):
+                for key, item in value.items():
+                    lines.append(f'{name}{{key="{key}"}} {float(item)!r}')
+            elif value is not None:
+                lines.append(f"{name} {float(value)!r}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+timer = metrics.timer
+
+
+@contextmanager
+def collect_request_timings():
+    """
+    Collect the stage timings observed while handling one request.
+    Yields the list of (stage, seconds) pairs.
+    """
+    timings = []
+    token = _request_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _request_timings.reset(token)
+
+
+def server_timing_header(timings):
+    """
+    Format (stage, seconds) pairs as a Server-Timing header value (durations in ms).
+    Repeated stages are summed.
+    """
+    totals = {}
+    for stage, seconds in timings:
+        totals[stage] = totals.get(stage, 0.0) + seconds
+    return ", ".join(f"{stage};dur={seconds * 1000:.3f}" for stage, seconds in totals.items())
@@ -0,0 +1,47 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from .metrics import collect_request_timings, metrics, server_timing_header
+
+
+class StageTimingMiddleware:
+    """
+    Times every request as a "request.<url name>" stage and, when
+    CHURN_SERVER_TIMING is enabled, reports the stages observed while handling
+    it in a Server-Timing response header (visible in browser dev tools).
+    Runs natively under both WSGI and ASGI, so async views stay async.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.server_timing = getattr(settings, "CHURN_SERVER_TIMING", False)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with collect_request_timings() as timings:
+            started = time.perf_counter()
+            response = self.get_response(request)
+            self._finish(request, response, timings, started)
+        return response
+
+    async def __acall__(self, request):
+        with collect_request_timings() as timings:
+            started = time.perf_counter()
+            response = await self.get_response(request)
+            self._finish(request, response, timings, started)
+        return response
+
+    def _finish(self, request, response, timings, started):
+        match = getattr(request, "resolver_match", None)
+        name = match.url_name if match is not None and match.url_name else "unmatched"
+        metrics.observe(f"request.{name}", time.perf_counter() - started)
+        if self.server_timing:
+            response["Server-Timing"] = server_timing_header(timings)
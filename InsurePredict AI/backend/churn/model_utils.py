@@ -1,34 +1,349 @@
 # churn_app/utils/model_utils.py
 
+import time
+
+import joblib
 import pandas as pd
 import xgboost as xgb
-import pickle
+from sklearn.metrics import log_loss, roc_auc_score
 from sklearn.model_selection import train_test_split
 
-def retrain_model_from_csv(csv_path, model_output_path):
-    import pandas as pd
-    import xgboost as xgb
-    import pickle
-    from sklearn.model_selection import train_test_split
-
-    data = pd.read_csv(csv_path)
-    X = data.iloc[:, :-1]
-    y = data.iloc[:, -1]
-
-    X_train, X_val, y_train, y_val = train_test_split(X, y, test_size=0.2, random_state=42)
-
-    model = xgb.XGBClassifier(
-        n_estimators=100,
-        learning_rate=0.1,
-        max_depth=5,
-        random_state=42,
-        use_label_encoder=False,
-        eval_metric='logloss'
-    )
+from .feature_store import churn_labels
+from .registry import models, feature_store, complete_csv_size, read_csv_range
+from .streaming import CsvChunkIter, StoreChunkIter, train_streaming
+from .training import apply_scaler, train_bundle
+from .tuning import beats
+
+
+class ProgressCallback(xgb.callback.TrainingCallback):
+    """
+    Reports boosting progress as a fraction between start and end.
+    """
+
+    def __init__(self, progress, n_rounds, start=0.2, end=0.8):
+        super().__init__()
+        self.progress = progress
+        self.n_rounds = n_rounds
+        self.start = start
+        self.end = end
+
+    def after_iteration(self, model, epoch, evals_log):
+        if epoch % 10 == 0 or epoch + 1 == self.n_rounds:
+            done = (epoch + 1) / self.n_rounds
+            self.progress(self.start + done * (self.end - self.start), f"Boosting round {epoch + 1}/{self.n_rounds}")
+        return False
+
+
+def validation_metrics(model, X_val, y_val):
+    probabilities = model.predict_proba(X_val)[:, 1]
+    metrics = {"logloss": float(log_loss(y_val, probabilities, labels=[0, 1])), "validation_rows": len(y_val)}
+    if len(set(y_val)) > 1:
+        metrics["auc"] = float(roc_auc_score(y_val, probabilities))
+    return metrics
+
+
+def classifier_from_booster(booster):
+    """
+    Wrap a Booster trained with xgb.train in an XGBClassifier so it serves
+    through the same predict_proba interface as the other churn models.
+    """
+    model = xgb.XGBClassifier()
+    model.load_model(bytearray(booster.save_raw("ubj")))
+    return model
+
+
+class CsvSource:
+    """
+    Training rows from a CSV file in the logs/training_data.csv layout.
+    High-water marks are byte offsets of complete lines.
+    """
+
+    mark = "trained_bytes"
+
+    def __init__(self, csv_path):
+        self.name = csv_path
+        self.csv_path = csv_path
+
+    def high_water(self):
+        return complete_csv_size(self.csv_path)
+
+    def size_bytes(self, high_water):
+        return high_water
+
+    def read(self, start, end):
+        return read_csv_range(self.csv_path, start, end)
+
+    def chunk_iter(self, end, chunk_rows, scaler=None):
+        return lambda validation, fraction, cache_prefix: CsvChunkIter(
+            self.csv_path, end, chunk_rows, validation, fraction, cache_prefix, scaler=scaler)
+
+
+class StoreSource:
+    """
+    Training rows from a FeatureStore. High-water marks are row offsets,
+    which stay valid across compaction.
+    """
+
+    mark = "trained_store_rows"
+
+    def __init__(self, store):
+        self.name = store.root
+        self.store = store
+
+    def high_water(self):
+        return self.store.rows
+
+    def size_bytes(self, high_water):
+        return high_water * len(self.store.columns) * 8
+
+    def read(self, start, end):
+        return self.store.read_frame(start_row=start, end_row=end)
+
+    def chunk_iter(self, end, chunk_rows, scaler=None):
+        return lambda validation, fraction, cache_prefix: StoreChunkIter(
+            self.store, end, chunk_rows, validation, fraction, cache_prefix, scaler=scaler)
+
+
+TRAINING_MODES = ("auto", "full", "incremental", "streaming", "tune")
 
-    model.fit(X_train, y_train, eval_set=[(X_val, y_val)],  verbose=False)
+# Hyperparameters shared by every training mode, until a "tune" run replaces them
+CHURN_MODEL_PARAMS = {"learning_rate": 0.1, "max_depth": 5, "random_state": 42}
+CHURN_MODEL_ROUNDS = 100
 
-    with open(model_output_path, "wb") as f:
-        pickle.dump(model, f)
 
-    return f"Model retrained and saved at: {model_output_path}"
+def model_params(parent_meta):
+    """
+    (XGBoost parameters, boosting rounds) for a full refit: the defaults,
+    overridden by the parameters the last promoted "tune" run found.
+    """
+    tuned = dict(parent_meta.get("tuned_params") or {})
+    n_rounds = tuned.pop("n_estimators", CHURN_MODEL_ROUNDS)
+    return {**CHURN_MODEL_PARAMS, **tuned}, n_rounds
+
+
+def scaled_frame(X, scaler):
+    """
+    X (a DataFrame in FEATURE_NAMES order) with scaler applied, as the serving pipeline does.
+    """
+    return pd.DataFrame(apply_scaler(X.to_numpy(), scaler), columns=X.columns, index=X.index)
+
+
+def best_iteration_only(model, feature_names):
+    """
+    The model cut down to the trees up to its early-stopping best iteration,
+    so later incremental updates continue from the model that was evaluated.
+    """
+    booster = model.get_booster()[: model.best_iteration + 1]
+    booster.set_attr(best_iteration=None, best_score=None)
+    booster.feature_names = list(feature_names)
+    return classifier_from_booster(booster)
+
+
+def choose_training_mode(mode, parent_meta, churn_model, full_refit_interval, drift_detected,
+                         data_bytes=0, streaming_threshold=float("inf"), mark="trained_bytes"):
+    """
+    Resolve "auto" to "full" or "incremental". Incremental training continues
+    the current booster, so it needs an XGBoost model with a recorded
+    high-water mark of the same kind (mark); otherwise, on schedule, or on
+    drift a full refit runs. A requested "incremental" without an XGBoost
+    model to continue also becomes a full refit. Full refits of
+    streaming_threshold bytes or more run out-of-core.
+    """
+    if mode == "auto":
+        if drift_detected:
+            mode = "full"
+        elif mark not in parent_meta or not isinstance(churn_model, xgb.XGBClassifier):
+            mode = "full"
+        # Versions from before the field existed, or continued from one, may hold None
+        elif time.time() - (parent_meta.get("last_full_refit") or 0) > full_refit_interval:
+            mode = "full"
+        else:
+            mode = "incremental"
+    elif mode == "incremental" and not isinstance(churn_model, xgb.XGBClassifier):
+        mode = "full"
+    if mode == "full" and data_bytes >= streaming_threshold:
+        mode = "streaming"
+    return mode
+
+
+def retrain_model_from_csv(csv_path, **options):
+    """
+    retrain_model() on a CSV file in the logs/training_data.csv layout,
+    e.g. an exported or externally prepared training set.
+    """
+    return retrain_model(CsvSource(csv_path), **options)
+
+
+def retrain_model(source=None, registry=models, progress=None, mode="auto",
+                  incremental_rounds=20, full_refit_interval=7 * 24 * 3600, drift_detected=False,
+                  streaming_threshold=512 * 1024 * 1024, chunk_rows=100000, tuning=None):
+    """
+    Retrain the models and publish them as a new model version.
+    Running workers pick the new version up on their next request.
+
+    Each version records a high-water mark (rows trained on, and the
+    source's row offset or CSV byte offset). Incremental mode reads only the
+    rows past that mark and continues boosting the current model for
+    incremental_rounds trees; full mode refits from scratch on all rows;
+    streaming mode is a full refit that reads the data in chunks into an
+    external-memory DMatrix, for training sets larger than RAM. Tune mode is
+    a full refit with a parallel hyperparameter search (see churn/tuning.py);
+    its model is only published if it beats the current model on a test
+    split held out from the search, and later full refits reuse the
+    parameters it found.
+
+    Full and tune mode retrain all six artifacts together (churn model,
+    both plan recommenders and their scalers, see churn/training.py), so a
+    version never mixes models fitted on different data. Incremental and
+    streaming mode only update the churn model and keep the current scalers.
+
+    Parameters:
+    - source: StoreSource or CsvSource (default: the feature store)
+    - registry: ModelRegistry to publish into
+    - progress: optional callable(fraction, message) for status reporting
+    - mode: "auto", "full", "incremental", "streaming" or "tune"
+    - incremental_rounds: boosting rounds added per incremental update
+    - full_refit_interval: seconds after which "auto" forces a full refit
+    - drift_detected: force a full refit in "auto" mode
+    - streaming_threshold: CSV size in bytes from which full refits stream
+    - chunk_rows: rows per chunk in streaming mode
+    - tuning: keyword arguments for tune_hyperparameters() in tune mode
+
+    Labels go through churn_labels(): logged churn probabilities count as
+    churn above 0.5, the same rule streaming mode applies chunk by chunk.
+
+    Returns:
+    - Dictionary with the message, published version, training mode, validation
+      metrics and whether the model was promoted
+
+    Raises:
+    - ValueError for an unknown mode or labels outside [0, 1]
+    """
+    if mode not in TRAINING_MODES:
+        raise ValueError(f"Unknown training mode '{mode}', expected one of {TRAINING_MODES}")
+    progress = progress or (lambda fraction, message: None)
+    source = source or StoreSource(feature_store)
+
+    parent = registry.current()
+    parent_meta = parent.metadata
+    current_model = parent.get("churn_model")
+    high_water = source.high_water()
+    requested_mode = mode
+    mode = choose_training_mode(mode, parent_meta, current_model, full_refit_interval, drift_detected,
+                                source.size_bytes(high_water), streaming_threshold, source.mark)
+    params, n_rounds = model_params(parent_meta)
+    tuned_params = parent_meta.get("tuned_params")
+
+    if mode == "streaming":
+        # Chunks are scaled with the current churn scaler, which the new model is published with
+        progress(0.05, "Streaming training data")
+        booster, metrics, stats = train_streaming(
+            source.chunk_iter(high_water, chunk_rows, parent.get("churn_scaler")), params, n_rounds,
+            callbacks=[ProgressCallback(progress, n_rounds)]
+        )
+        metrics["streaming"] = stats
+        artifacts = {"churn_model": classifier_from_booster(booster)}
+        trained_rows = metrics["training_rows"] + metrics["validation_rows"]
+    else:
+        progress(0.05, "Loading training data")
+        start = parent_meta.get(source.mark, 0) if mode == "incremental" else 0
+        data = source.read(start, high_water)
+        trained_rows = len(data) + (parent_meta.get("trained_rows", 0) if mode == "incremental" else 0)
+
+        if data.empty:
+            return {
+                "message": f"No new rows since version {parent.version}; nothing to train.",
+                "version": parent.version,
+                "mode": mode,
+                "metrics": parent_meta.get("metrics", {}),
+            }
+
+        X = data.iloc[:, :-1]
+        # Binarized once; every split, fit and metric below uses these labels
+        y = pd.Series(churn_labels(data.iloc[:, -1]), index=data.index, name=data.columns[-1])
+
+        if mode == "incremental" and y.nunique() < 2:
+            # Too little signal to continue boosting on; fall back to a full refit
+            return retrain_model(source, registry, progress, mode="full",
+                                 streaming_threshold=streaming_threshold, chunk_rows=chunk_rows)
+
+        X_test = y_test = None
+        if mode == "tune":
+            # Test rows the search never sees, neither for early stopping nor for
+            # picking a candidate; promotion is judged on these alone
+            X, X_test, y, y_test = train_test_split(X, y, test_size=0.2, random_state=7)
+        X_train, X_val, y_train, y_val = train_test_split(X, y, test_size=0.2, random_state=42)
+
+        if mode == "incremental":
+            # The booster keeps seeing features scaled the way it was trained and is served
+            churn_scaler = parent.get("churn_scaler")
+            model = xgb.XGBClassifier(
+                n_estimators=incremental_rounds,
+                use_label_encoder=False,
+                eval_metric='logloss',
+                callbacks=[ProgressCallback(progress, incremental_rounds)],
+                **params
+            )
+            progress(0.2, f"Continuing churn model {parent.version} on {len(X_train)} new rows")
+            model.fit(scaled_frame(X_train, churn_scaler), y_train,
+                      eval_set=[(scaled_frame(X_val, churn_scaler), y_val)], verbose=False,
+                      xgb_model=current_model.get_booster())
+            # Callbacks hold a reference to the job; they don't belong in the artifact
+            model.set_params(callbacks=None)
+            artifacts, metrics = {"churn_model": model}, {}
+        else:
+            # Scalers, churn model and both plan recommenders, trained together
+            artifacts, metrics = train_bundle(X_train, y_train, X_val, y_val, params, n_rounds,
+                                              tuning=(tuning or {}) if mode == "tune" else None,
+                                              progress=progress)
+            churn_scaler = artifacts["churn_scaler"]
+            if mode == "tune":
+                artifacts["churn_model"] = best_iteration_only(artifacts["churn_model"], X.columns)
+                tuned_params = {**metrics["tuning"]["best_params"],
+                                "n_estimators": metrics["tuning"]["best_iteration"] + 1}
+            model = artifacts["churn_model"]
+
+        progress(0.85, "Evaluating on validation split")
+        metrics.update(validation_metrics(model, scaled_frame(X_val, churn_scaler), y_val))
+        metrics["training_rows"] = len(X_train)
+
+        if mode == "tune":
+            # The validation metrics above are optimistic (the search selected on them)
+            progress(0.88, "Comparing tuned and current model on the held-out test split")
+            metrics["test"] = validation_metrics(model, scaled_frame(X_test, churn_scaler), y_test)
+            # The current model may have seen these rows in training, which only makes promotion harder
+            current_metrics = None
+            if current_model is not None:
+                current_metrics = validation_metrics(current_model, scaled_frame(X_test, parent.get("churn_scaler")), y_test)
+            metrics["current_model"] = current_metrics
+            if not beats(metrics["test"], current_metrics):
+                return {
+                    "message": f"Tuned model did not beat version {parent.version}; not published.",
+                    "version": parent.version,
+                    "mode": mode,
+                    "metrics": metrics,
+                    "promoted": False,
+                }
+
+    progress(0.9, "Publishing model version")
+    version = registry.publish(
+        {name: (lambda path, artifact=artifact: joblib.dump(artifact, path)) for name, artifact in artifacts.items()},
+        metadata={
+            "trained_on": source.name,
+            "training_mode": mode,
+            "trained_rows": trained_rows,
+            source.mark: high_water,
+            "last_full_refit": (parent_meta.get("last_full_refit") or 0) if mode == "incremental" else time.time(),
+            "tuned_params": tuned_params,
+            "metrics": metrics,
+        }
+    )
+
+    return {
+        "message": f"Model retrained ({mode}) and published as version {version}",
+        "version": version,
+        "mode": mode,
+        "requested_mode": requested_mode,
+        "metrics": metrics,
+        "promoted": True,
+    }
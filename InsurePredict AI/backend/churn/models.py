@@ -57,7 +57,89 @@ class CustomerRecord(models.Model):
     
 
     created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        # Serve the records/ listing and aggregates (churn/queries.py) without full table scans
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='churn_record_created_idx'),
+            models.Index(fields=['churn_probability', 'id'], name='churn_record_risk_idx'),
+            models.Index(fields=['plan_type', 'churn_probability'], name='churn_record_plan_risk_idx'),
+            models.Index(fields=['plan_type', 'type_of_insurance', 'created_at'], name='churn_record_segment_idx'),
+        ]
+
     def __str__(self):
         return f"Customer {self.id} - {self.age} yrs"
 
 
+class RetrainJob(models.Model):
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed'),
+    ]
+
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    progress = models.FloatField(default=0.0)
+    message = models.CharField(max_length=200, blank=True, default='')
+    options = models.JSONField(default=dict, blank=True)
+
+    metrics = models.JSONField(null=True, blank=True)
+    model_version = models.CharField(max_length=64, null=True, blank=True)
+    error = models.TextField(null=True, blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)  # Doubles as a heartbeat while running
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    # "<host>:<pid>" of the worker process that queued and runs the job
+    owner = models.CharField(max_length=100, blank=True, default='')
+
+    class Meta:
+        constraints = [
+            # At most one queued or running job across all worker processes:
+            # every active row indexes the same constant
+            models.UniqueConstraint(models.Value(True), condition=models.Q(status__in=('queued', 'running')),
+                                    name='churn_retrainjob_one_active'),
+        ]
+
+    def __str__(self):
+        return f"RetrainJob {self.id} - {self.status}"
+
+
+class ChurnRollup(models.Model):
+    """
+    Daily aggregate of saved predictions for one value of one dimension
+    (e.g. plan_type = 'premium'), maintained incrementally by churn/rollups.py.
+    Sums are stored rather than averages so new rows can be added in.
+    """
+
+    day = models.DateField()
+    dimension = models.CharField(max_length=32)
+    value = models.CharField(max_length=32)
+
+    customers = models.IntegerField(default=0)
+    scored = models.IntegerField(default=0)  # Rows with a churn probability
+    at_risk = models.IntegerField(default=0)
+    probability_sum = models.FloatField(default=0.0)
+
+    refreshed_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['dimension', 'day', 'value'], name='churn_rollup_unique_key'),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.dimension}={self.value}: {self.customers}"
+
+
+class RollupWatermark(models.Model):
+    # Highest CustomerRecord id already folded into the rollups
+    name = models.CharField(max_length=50, unique=True)
+    last_record_id = models.BigIntegerField(default=0)
+    refreshed_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.name} @ {self.last_record_id}"
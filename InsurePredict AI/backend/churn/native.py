@@ -0,0 +1,312 @@
+import json
+import os
+
+import numpy as np
+
+# Version of the native/manifest.json layout
+NATIVE_FORMAT = 1
+NATIVE_DIR = "native"
+MANIFEST = "manifest.json"
+
+
+class AffineScaler:
+    """
+    A StandardScaler reduced to the vectors its transform() applies: mean_ is
+    None when it does not center (with_mean=False), scale_ is None when it
+    does not scale (with_std=False).
+    """
+
+    def __init__(self, mean_=None, scale_=None):
+        self.mean_ = mean_
+        self.scale_ = scale_
+
+    def transform(self, X):
+        X = np.asarray(X, dtype=float)
+        if self.mean_ is not None:
+            X = X - self.mean_
+        if self.scale_ is not None:
+            X = X / self.scale_
+        return X
+
+
+class TreeEnsemble:
+    """
+    Tree classifier evaluated with NumPy over flattened node arrays.
+
+    All trees share one set of arrays; roots holds each tree's first node.
+    Internal nodes send a row to left when its feature is below threshold
+    (XGBoost, strict) or at most threshold (scikit-learn); missing values
+    follow default_left. Leaves (feature == -1) hold one value per output.
+
+    combine="margin" sums the leaves on top of base_margin and applies the
+    sigmoid (one output) or softmax, as XGBoost does; combine="mean" averages
+    per-leaf class distributions, as a random forest does.
+    """
+
+    def __init__(self, left, right, feature, threshold, default_left, value, roots, max_depth,
+                 classes, combine, strict=False, base_margin=None):
+        self.left = left
+        self.right = right
+        self.feature = feature
+        self.threshold = threshold
+        self.default_left = default_left
+        self.value = value
+        self.roots = roots
+        self.max_depth = int(max_depth)
+        self.classes_ = np.asarray(classes)
+        self.combine = combine
+        self.strict = strict
+        self.base_margin = np.zeros(value.shape[1]) if base_margin is None else np.asarray(base_margin, dtype=float)
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    def _leaves(self, X):
+        # Models see float32 inputs; the float64 comparison is exact for float32 values
+        X = np.asarray(X, dtype=np.float32).astype(np.float64)
+        rows = np.arange(len(X))[:, None]
+        nodes = np.broadcast_to(self.roots, (len(X), len(self.roots))).copy()
+        for _ in range(self.max_depth):
+            feature = self.feature[nodes]
+            internal = feature >= 0
+            if not internal.any():
+                break
+            values = X[rows, np.maximum(feature, 0)]
+            threshold = self.threshold[nodes]
+            go_left = values < threshold if self.strict else values <= threshold
+            go_left = np.where(np.isnan(values), self.default_left[nodes], go_left)
+            nodes = np.where(internal, np.where(go_left, self.left[nodes], self.right[nodes]), nodes)
+        return nodes
+
+    def predict_proba(self, X):
+        leaf_values = self.value[self._leaves(X)]
+        if self.combine == "mean":
+            return leaf_values.mean(axis=1)
+
+        margin = leaf_values.sum(axis=1) + self.base_margin
+        if margin.shape[1] == 1:
+            positive = 1.0 / (1.0 + np.exp(-margin[:, 0]))
+            return np.column_stack([1.0 - positive, positive])
+        margin -= margin.max(axis=1, keepdims=True)
+        np.exp(margin, out=margin)
+        return margin / margin.sum(axis=1, keepdims=True)
+
+    def predict(self, X):
+        return self.classes_[self.predict_proba(X).argmax(axis=1)]
+
+    def save(self, path):
+        np.savez(path, left=self.left, right=self.right, feature=self.feature, threshold=self.threshold,
+                 default_left=self.default_left, value=self.value, roots=self.roots,
+                 max_depth=self.max_depth, classes=self.classes_, combine=self.combine,
+                 strict=self.strict, base_margin=self.base_margin)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as arrays:
+            return cls(arrays["left"], arrays["right"], arrays["feature"], arrays["threshold"],
+                       arrays["default_left"], arrays["value"], arrays["roots"], arrays["max_depth"],
+                       arrays["classes"], str(arrays["combine"]), bool(arrays["strict"]), arrays["base_margin"])
+
+
+def _concatenate(trees):
+    """
+    Stack per-tree (left, right, feature, threshold, default_left, value, depth)
+    tuples into one node array, offsetting child indices by each tree's start.
+    """
+    offsets = np.cumsum([0] + [len(tree[0]) for tree in trees])
+    left, right = [], []
+    for (tree_left, tree_right, *_), offset in zip(trees, offsets):
+        left.append(np.where(tree_left >= 0, tree_left + offset, -1))
+        right.append(np.where(tree_right >= 0, tree_right + offset, -1))
+    return dict(
+        left=np.concatenate(left).astype(np.int64),
+        right=np.concatenate(right).astype(np.int64),
+        feature=np.concatenate([tree[2] for tree in trees]).astype(np.int64),
+        threshold=np.concatenate([tree[3] for tree in trees]).astype(np.float64),
+        default_left=np.concatenate([tree[4] for tree in trees]).astype(bool),
+        value=np.concatenate([tree[5] for tree in trees]).astype(np.float64),
+        roots=offsets[:-1].astype(np.int64),
+        max_depth=max(tree[6] for tree in trees),
+    )
+
+
+def _tree_depth(left, right):
+    depth, frontier = 0, [0]
+    while frontier:
+        frontier = [child for node in frontier for child in (left[node], right[node]) if child >= 0]
+        depth += 1 if frontier else 0
+    return depth
+
+
+def _parse_float_list(text):
+    # base_score is stored as "[5E-1]" (or a plain number in older models)
+    return [float(item) for item in str(text).strip("[]").split(",") if item.strip()]
+
+
+def ensemble_from_xgboost_json(model, classes):
+    """
+    A TreeEnsemble from an XGBoost model saved with Booster.save_model(*.json).
+    Only gbtree models with numerical splits and logistic/softmax objectives are
+    supported. best_iteration, when recorded, limits the trees used, as the
+    scikit-learn wrapper's predict does.
+    """
+    learner = model["learner"]
+    objective = learner["objective"]["name"]
+    booster = learner["gradient_booster"]
+    if booster["name"] != "gbtree":
+        raise ValueError(f"Unsupported XGBoost booster '{booster['name']}'")
+    if objective not in ("binary:logistic", "multi:softprob", "multi:softmax"):
+        raise ValueError(f"Unsupported XGBoost objective '{objective}'")
+
+    params = learner["learner_model_param"]
+    n_outputs = max(int(params.get("num_class", 0)), 1)
+    trees = booster["model"]["trees"]
+    tree_info = booster["model"]["tree_info"]
+    best_iteration = learner.get("attributes", {}).get("best_iteration")
+    if best_iteration is not None:
+        indptr = booster["model"].get("iteration_indptr")
+        n_trees = indptr[int(best_iteration) + 1] if indptr else (int(best_iteration) + 1) * n_outputs
+        trees, tree_info = trees[:n_trees], tree_info[:n_trees]
+
+    flattened = []
+    for tree, output in zip(trees, tree_info):
+        if any(tree.get("split_type", [])):
+            raise ValueError("Categorical XGBoost splits are not supported")
+        left = np.asarray(tree["left_children"], dtype=np.int64)
+        right = np.asarray(tree["right_children"], dtype=np.int64)
+        conditions = np.asarray(tree["split_conditions"], dtype=np.float32)
+        leaf = left < 0
+        value = np.zeros((len(left), n_outputs))
+        # Leaves keep their (learning-rate scaled) weight in split_conditions
+        value[leaf, output] = conditions[leaf]
+        flattened.append((left, right, np.where(leaf, -1, tree["split_indices"]), conditions,
+                          tree["default_left"], value, _tree_depth(left, right)))
+
+    base_score = np.asarray(_parse_float_list(params["base_score"]))
+    if objective == "binary:logistic":
+        # Stored as a probability; the trees add to its logit
+        base_margin = np.log(base_score / (1.0 - base_score))
+    else:
+        base_margin = np.broadcast_to(base_score, (n_outputs,))
+    return TreeEnsemble(**_concatenate(flattened), classes=classes, combine="margin", strict=True,
+                        base_margin=base_margin)
+
+
+def ensemble_from_sklearn(model):
+    """
+    A TreeEnsemble from a fitted scikit-learn DecisionTreeClassifier or
+    RandomForestClassifier (single-output).
+    """
+    estimators = model.estimators_ if hasattr(model, "estimators_") else [model]
+    flattened = []
+    for estimator in estimators:
+        tree = estimator.tree_
+        if tree.n_outputs != 1:
+            raise ValueError("Multi-output tree models are not supported")
+        value = np.asarray(tree.value[:, 0, :], dtype=np.float64)
+        value = value / np.maximum(value.sum(axis=1, keepdims=True), 1e-300)
+        left = np.asarray(tree.children_left)
+        missing_left = getattr(tree, "missing_go_to_left", np.zeros(len(left), dtype=bool))
+        flattened.append((left, np.asarray(tree.children_right), np.where(left < 0, -1, tree.feature),
+                          tree.threshold, missing_left, value, tree.max_depth))
+    return TreeEnsemble(**_concatenate(flattened), classes=model.classes_, combine="mean")
+
+
+def export_model(model, stem):
+    """
+    Write model in a native format next to stem (a path without extension):
+    XGBoost classifiers as <stem>.json (XGBoost's own JSON model format),
+    scikit-learn trees/forests as <stem>.npz node arrays and StandardScalers
+    as <stem>.npz mean/scale vectors. None of these files are pickles.
+
+    Returns:
+    - Manifest entry {"kind", "file", ...} for load_model()
+
+    Raises:
+    - ValueError for model types without a native format
+    """
+    if hasattr(model, "get_booster"):
+        path = stem + ".json"
+        model.get_booster().save_model(path)
+        ensemble_from_xgboost_json(_read_json(path), model.classes_)  # fail now, not when serving
+        return {"kind": "xgboost", "file": os.path.basename(path), "classes": np.asarray(model.classes_).tolist()}
+    if hasattr(model, "tree_") or all(hasattr(e, "tree_") for e in getattr(model, "estimators_", [None])):
+        path = stem + ".npz"
+        ensemble_from_sklearn(model).save(path)
+        return {"kind": "trees", "file": os.path.basename(path)}
+    from sklearn.preprocessing import StandardScaler
+
+    if isinstance(model, StandardScaler):
+        # mean_ is fitted even with with_mean=False, but transform() does not subtract it
+        vectors = {"mean_": model.mean_ if model.with_mean else None,
+                   "scale_": model.scale_ if model.with_std else None}
+        path = stem + ".npz"
+        np.savez(path, **{key: np.asarray(value, dtype=float) for key, value in vectors.items() if value is not None})
+        return {"kind": "scaler", "file": os.path.basename(path)}
+    raise ValueError(f"No native format for {type(model).__name__}")
+
+
+def _read_json(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def load_model(directory, entry):
+    """
+    Load one artifact written by export_model() using NumPy only.
+    """
+    path = os.path.join(directory, entry["file"])
+    if entry["kind"] == "xgboost":
+        return ensemble_from_xgboost_json(_read_json(path), entry["classes"])
+    if entry["kind"] == "trees":
+        return TreeEnsemble.load(path)
+    if entry["kind"] == "scaler":
+        with np.load(path, allow_pickle=False) as arrays:
+            return AffineScaler(arrays["mean_"] if "mean_" in arrays else None,
+                                arrays["scale_"] if "scale_" in arrays else None)
+    raise ValueError(f"Unknown native artifact kind '{entry['kind']}'")
+
+
+def read_manifest(directory):
+    """
+    {artifact name: entry} of the native export inside a bundle directory,
+    or {} if it has none.
+    """
+    try:
+        manifest = _read_json(os.path.join(directory, NATIVE_DIR, MANIFEST))
+    except (FileNotFoundError, ValueError):
+        return {}
+    if manifest.get("format") != NATIVE_FORMAT:
+        return {}
+    return manifest.get("artifacts", {})
+
+
+def export_bundle(directory, artifacts):
+    """
+    Export every artifact with a native format into <directory>/native/ and
+    write its manifest last, so a partial export is never picked up.
+
+    Parameters:
+    - directory: bundle directory
+    - artifacts: dict of artifact name -> loaded model (None entries are skipped)
+
+    Returns:
+    - (exported names, {skipped name: reason})
+    """
+    native_dir = os.path.join(directory, NATIVE_DIR)
+    os.makedirs(native_dir, exist_ok=True)
+    entries, skipped = {}, {}
+    for name, model in artifacts.items():
+        if model is None:
+            continue
+        try:
+            entries[name] = export_model(model, os.path.join(native_dir, name))
+        except ValueError as e:
+            skipped[name] = str(e)
+
+    tmp_path = os.path.join(native_dir, f"{MANIFEST}.{os.getpid()}.tmp")
+    with open(tmp_path, "w") as f:
+        json.dump({"format": NATIVE_FORMAT, "artifacts": entries}, f, indent=2)
+    os.replace(tmp_path, os.path.join(native_dir, MANIFEST))
+    return sorted(entries), skipped
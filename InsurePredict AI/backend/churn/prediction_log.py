@@ -0,0 +1,168 @@
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+from .metrics import metrics, timer
+from .models import CustomerRecord
+from .registry import feature_store, training_data
+from .rollups import refresh_rollups_if_due
+
+logger = logging.getLogger(__name__)
+
+
+class PredictionLogWriter:
+    """
+    Buffers logged predictions in memory and writes them out in bulk.
+
+    Training rows go to the feature store as one segment per flush, and
+    CustomerRecord rows are saved with bulk_create. A flush happens as soon as
+    max_rows are buffered, otherwise every max_delay seconds, and at
+    interpreter shutdown. Once the store holds more than compact_segments
+    segments, the flusher thread compacts it; after_flush (e.g. the rollup
+    refresh) also runs on the flusher thread, off the request path.
+
+    Training rows and database records are written independently. Whatever
+    fails to be written (full disk, locked database, ...) goes back to the
+    front of its buffer for the next flush; at most max_pending items of
+    each kind are kept, the oldest beyond that are dropped and counted.
+    """
+
+    def __init__(self, store, max_rows=500, max_delay=2.0, compact_segments=64, after_flush=None,
+                 max_pending=100000):
+        self.store = store
+        self.max_rows = max_rows
+        self.max_delay = max_delay
+        self.compact_segments = compact_segments
+        self.after_flush = after_flush
+        self.max_pending = max_pending
+        self.dropped_rows = 0
+        self.dropped_records = 0
+        self._rows = []
+        self._timestamps = []
+        self._records = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def log(self, rows, records=()):
+        """
+        Queue training rows (features + churn probability) and unsaved
+        CustomerRecord instances for the next flush.
+        """
+        now = time.time()
+        with self._lock:
+            self._rows.extend(rows)
+            self._timestamps.extend([now] * len(rows))
+            self._records.extend(records)
+            full = len(self._rows) >= self.max_rows or len(self._records) >= self.max_rows
+        self._ensure_thread()
+        if full:
+            self._wakeup.set()
+
+    def _ensure_thread(self):
+        # Started lazily so forked workers each get their own flusher thread
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name="prediction-log", daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.max_delay)
+            self._wakeup.clear()
+            try:
+                self.flush()
+                if len(self.store.segments()) > self.compact_segments:
+                    with timer("log.compact"):
+                        self.store.compact()
+                if self.after_flush is not None:
+                    with timer("log.after_flush"):
+                        self.after_flush()
+            except Exception:
+                logger.exception("Error in prediction log maintenance")
+            finally:
+                close_old_connections()
+
+    def flush(self):
+        """
+        Write everything buffered so far. Returns the number of training rows
+        written; rows or records that could not be written are requeued.
+        """
+        with self._flush_lock:
+            with self._lock:
+                rows, self._rows = self._rows, []
+                timestamps, self._timestamps = self._timestamps, []
+                records, self._records = self._records, []
+
+            written = 0
+            if rows:
+                try:
+                    with timer("log.store_append"):
+                        self.store.append(rows, timestamps)
+                    written = len(rows)
+                except Exception:
+                    logger.exception("Error writing %d logged predictions to the feature store; requeued", len(rows))
+                    self._requeue(rows=rows, timestamps=timestamps)
+            if records:
+                try:
+                    # All or nothing, so a retry never inserts a record twice
+                    with timer("log.db_insert"), transaction.atomic():
+                        CustomerRecord.objects.bulk_create(records, batch_size=500)
+                except Exception:
+                    logger.exception("Error saving %d customer records; requeued", len(records))
+                    self._requeue(records=records)
+            return written
+
+    def _requeue(self, rows=(), timestamps=(), records=()):
+        # Unwritten items go before anything logged meanwhile, keeping order
+        with self._lock:
+            self._rows[:0] = rows
+            self._timestamps[:0] = timestamps
+            self._records[:0] = records
+            excess_rows = len(self._rows) - self.max_pending
+            if excess_rows > 0:
+                del self._rows[:excess_rows], self._timestamps[:excess_rows]
+                self.dropped_rows += excess_rows
+            excess_records = len(self._records) - self.max_pending
+            if excess_records > 0:
+                del self._records[:excess_records]
+                self.dropped_records += excess_records
+        if excess_rows > 0 or excess_records > 0:
+            logger.error("Prediction log buffer full: dropped %d oldest rows and %d oldest records",
+                         max(excess_rows, 0), max(excess_records, 0))
+
+
+_rollup_settings = getattr(settings, "CHURN_ROLLUPS", {})
+
+
+def _after_flush():
+    # The similarity cache's parts are folded into its base here, off the request path
+    training_data.compact()
+    if _rollup_settings.get("REFRESH_ON_FLUSH", True):
+        refresh_rollups_if_due(min_interval=_rollup_settings.get("MIN_INTERVAL", 10.0),
+                               settle_seconds=_rollup_settings.get("SETTLE_SECONDS", 5.0),
+                               batch_size=_rollup_settings.get("BATCH_SIZE", 50000))
+
+
+prediction_log = PredictionLogWriter(
+    feature_store,
+    max_rows=getattr(settings, "CHURN_LOG_FLUSH_ROWS", 500),
+    max_delay=getattr(settings, "CHURN_LOG_FLUSH_SECONDS", 2.0),
+    compact_segments=getattr(settings, "CHURN_FEATURE_STORE_MAX_SEGMENTS", 64),
+    after_flush=_after_flush,
+    max_pending=getattr(settings, "CHURN_LOG_MAX_PENDING", 100000),
+)
+
+metrics.register("churn_prediction_log_pending_rows", "gauge", "Logged predictions waiting for the next flush",
+                 lambda: len(prediction_log._rows))
+metrics.register("churn_prediction_log_dropped_total", "counter",
+                 "Logged predictions dropped after failed flushes overflowed the buffer",
+                 lambda: {"rows": prediction_log.dropped_rows, "records": prediction_log.dropped_records})
+
+atexit.register(prediction_log.flush)
@@ -0,0 +1,213 @@
+import base64
+import json
+from datetime import datetime, time
+
+from django.db.models import Avg, Count, F, IntegerField, Q
+from django.db.models.functions import Cast, Floor, Least
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from .models import CustomerRecord
+
+# Same cut-off as is_churn_risk in the prediction responses
+CHURN_RISK_THRESHOLD = 0.5
+
+# ?ordering= values for the record listing; each is served by one of the
+# CustomerRecord.Meta indexes and ends on the primary key so pages are stable
+RECORD_ORDERINGS = {
+    "-created_at": ("-created_at", "-id"),
+    "created_at": ("created_at", "id"),
+    "-churn_probability": ("-churn_probability", "-id"),
+    "churn_probability": ("churn_probability", "id"),
+}
+
+MAX_HISTOGRAM_BINS = 100
+
+
+def _parse_probability(params, name):
+    value = params.get(name)
+    if value in (None, ""):
+        return None
+    try:
+        value = float(value)
+    except ValueError:
+        raise ValueError(f"'{name}' should be a number between 0 and 1")
+    if not 0.0 <= value <= 1.0:
+        raise ValueError(f"'{name}' should be a number between 0 and 1")
+    return value
+
+
+def _parse_choices(params, name, choices):
+    # Comma-separated, e.g. ?plan_type=basic,premium
+    value = params.get(name)
+    if not value:
+        return None
+    values = [item.strip() for item in value.split(",") if item.strip()]
+    valid = {choice for choice, _ in choices}
+    unknown = [item for item in values if item not in valid]
+    if unknown:
+        raise ValueError(f"'{name}' should be one of {', '.join(sorted(valid))}")
+    return values
+
+
+def _parse_timestamp(params, name):
+    value = params.get(name)
+    if not value:
+        return None
+    parsed = parse_datetime(value)
+    if parsed is None:
+        date = parse_date(value)
+        if date is None:
+            raise ValueError(f"'{name}' should be an ISO 8601 date or datetime")
+        parsed = datetime.combine(date, time.min)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed, timezone.get_current_timezone())
+    return parsed
+
+
+def filter_records(queryset, params):
+    """
+    Apply the record filters in params (request query parameters):
+    min_probability / max_probability (inclusive), plan_type and
+    type_of_insurance (comma-separated choices), and created_after
+    (inclusive) / created_before (exclusive) as ISO dates or datetimes.
+
+    Raises:
+    - ValueError describing the first invalid parameter
+    """
+    min_probability = _parse_probability(params, "min_probability")
+    max_probability = _parse_probability(params, "max_probability")
+    if min_probability is not None:
+        queryset = queryset.filter(churn_probability__gte=min_probability)
+    if max_probability is not None:
+        queryset = queryset.filter(churn_probability__lte=max_probability)
+
+    plan_types = _parse_choices(params, "plan_type", CustomerRecord.PLAN_TYPE_CHOICES)
+    if plan_types:
+        queryset = queryset.filter(plan_type__in=plan_types)
+    insurance_types = _parse_choices(params, "type_of_insurance", CustomerRecord.INSURANCE_TYPE_CHOICES)
+    if insurance_types:
+        queryset = queryset.filter(type_of_insurance__in=insurance_types)
+
+    created_after = _parse_timestamp(params, "created_after")
+    created_before = _parse_timestamp(params, "created_before")
+    if created_after is not None:
+        queryset = queryset.filter(created_at__gte=created_after)
+    if created_before is not None:
+        queryset = queryset.filter(created_at__lt=created_before)
+    return queryset
+
+
+class RecordKeysetPagination:
+    """
+    Keyset (cursor) pagination over CustomerRecord. A page continues after
+    the (sort key, id) of the previous page's last row:
+
+        WHERE key < :key OR (key = :key AND id < :id) ORDER BY key DESC, id DESC LIMIT n
+
+    which one of the CustomerRecord.Meta indexes answers directly, so the
+    millionth page costs the same as the first (no OFFSET scan) and rows
+    inserted meanwhile never shift a page. Cursors are opaque tokens; pages
+    are forward-only.
+    """
+
+    page_size = 100
+    max_page_size = 1000
+
+    def paginate_queryset(self, queryset, request):
+        """
+        The requested page as a list. Raises ValueError for bad parameters.
+        """
+        params = request.query_params
+        self.request = request
+        self.ordering = params.get("ordering", "-created_at")
+        if self.ordering not in RECORD_ORDERINGS:
+            raise ValueError(f"'ordering' should be one of {', '.join(RECORD_ORDERINGS)}")
+        page_size = params.get("page_size", str(self.page_size))
+        if not page_size.isdigit() or not 1 <= int(page_size) <= self.max_page_size:
+            raise ValueError(f"'page_size' should be between 1 and {self.max_page_size}")
+
+        key = self.ordering.lstrip("-")
+        queryset = queryset.exclude(**{f"{key}__isnull": True}).order_by(*RECORD_ORDERINGS[self.ordering])
+        if params.get("cursor"):
+            value, last_id = self._decode_cursor(params["cursor"])
+            after = "lt" if self.ordering.startswith("-") else "gt"
+            queryset = queryset.filter(Q(**{f"{key}__{after}": value}) | Q(**{key: value, f"id__{after}": last_id}))
+
+        rows = list(queryset[:int(page_size) + 1])
+        self.next_cursor = None
+        if len(rows) > int(page_size):
+            rows = rows[:int(page_size)]
+            self.next_cursor = self._encode_cursor(getattr(rows[-1], key), rows[-1].id)
+        return rows
+
+    def get_paginated_response(self, data):
+        next_url = None
+        if self.next_cursor is not None:
+            next_url = replace_query_param(self.request.build_absolute_uri(), "cursor", self.next_cursor)
+        return Response({"next": next_url, "cursor": self.next_cursor, "results": data})
+
+    def _encode_cursor(self, value, last_id):
+        if isinstance(value, datetime):
+            value = value.isoformat()
+        payload = json.dumps([self.ordering, value, last_id]).encode()
+        return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+    def _decode_cursor(self, cursor):
+        try:
+            ordering, value, last_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+            last_id = int(last_id)
+        except (ValueError, TypeError):
+            raise ValueError("Invalid cursor")
+        if ordering != self.ordering:
+            raise ValueError("The cursor belongs to a different ordering")
+        if self.ordering.lstrip("-") == "created_at":
+            value = parse_datetime(value) if isinstance(value, str) else None
+            if value is None:
+                raise ValueError("Invalid cursor")
+        elif isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ValueError("Invalid cursor")
+        return value, last_id
+
+
+def risk_histogram(queryset, bins=10):
+    """
+    Number of records per churn-probability bin, counted by the database.
+    Records without a probability are left out.
+
+    Returns:
+    - List of {"lower", "upper", "count"} for all bins, including empty ones
+    """
+    if not 1 <= bins <= MAX_HISTOGRAM_BINS:
+        raise ValueError(f"'bins' should be between 1 and {MAX_HISTOGRAM_BINS}")
+    # Probability 1.0 belongs to the last bin, not a bin of its own
+    bucket = Least(Cast(Floor(F("churn_probability") * bins), IntegerField()), bins - 1)
+    counts = dict(
+        queryset.filter(churn_probability__isnull=False)
+        .annotate(bucket=bucket).order_by().values("bucket")
+        .annotate(count=Count("id")).values_list("bucket", "count")
+    )
+    return [{"lower": i / bins, "upper": (i + 1) / bins, "count": counts.get(i, 0)} for i in range(bins)]
+
+
+def churn_rate_by(queryset, field, threshold=CHURN_RISK_THRESHOLD):
+    """
+    Per value of field: record count, average churn probability and the
+    share of records above threshold, grouped in SQL.
+    """
+    rows = (
+        queryset.order_by().values(field)
+        .annotate(customers=Count("id"),
+                  at_risk=Count("id", filter=Q(churn_probability__gt=threshold)),
+                  average_churn_probability=Avg("churn_probability"))
+        .order_by(field)
+    )
+    return [{
+        field: row[field],
+        "customers": row["customers"],
+        "at_risk": row["at_risk"],
+        "churn_rate": row["at_risk"] / row["customers"] if row["customers"] else None,
+        "average_churn_probability": row["average_churn_probability"],
+    } for row in rows]
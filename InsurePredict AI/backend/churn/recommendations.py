@@ -0,0 +1,99 @@
+import numpy as np
+
+from .inference import FEATURE_NAMES
+
+# Neighbour columns the rules aggregate over, in STAT_COLUMNS order
+STAT_COLUMNS = ['Automobile Insurance', 'Health Insurance', 'Life Insurance', 'Claim Amount ($)', 'Credit Score']
+STAT_INDICES = [FEATURE_NAMES.index(column) for column in STAT_COLUMNS]
+AUTO, HEALTH, LIFE, CLAIM, CREDIT = range(len(STAT_COLUMNS))
+
+
+def _feature(name):
+    return FEATURE_NAMES.index(name)
+
+
+# Rule table: (category, condition, messages). A condition receives the target
+# rows (n, n_features) and the non-churned neighbour means (n, len(STAT_COLUMNS))
+# and returns a boolean mask. Messages of matching rules are appended to their
+# category in table order.
+RULES = [
+    # 1. Insurance types common among similar non-churned customers
+    ("Insurance_Options",
+     lambda target, means: (means[:, AUTO] > 0.5) & (target[:, _feature('Automobile Insurance')] == 0),
+     ["Add automobile insurance - popular among similar customers who stay with us"]),
+    ("Insurance_Options",
+     lambda target, means: (means[:, HEALTH] > 0.5) & (target[:, _feature('Health Insurance')] == 0),
+     ["Include health insurance coverage - common among customers with your profile"]),
+    ("Insurance_Options",
+     lambda target, means: (means[:, LIFE] > 0.5) & (target[:, _feature('Life Insurance')] == 0),
+     ["Consider life insurance protection - beneficial for customers similar to you"]),
+
+    # 2. Claim behaviour compared to similar customers
+    ("Claim_Optimization",
+     lambda target, means: target[:, _feature('Claim Amount ($)')] < means[:, CLAIM] - 0.5,
+     ["You may be under-utilizing your benefits compared to similar customers",
+      "Schedule a coverage review to ensure you're getting the most from your plan"]),
+    ("Claim_Optimization",
+     lambda target, means: target[:, _feature('Claim Amount ($)')] > means[:, CLAIM] + 0.5,
+     ["Your claim pattern differs from similar satisfied customers",
+      "Consider our premium protection plan with higher claim limits"]),
+
+    # 3. Credit score-based recommendations
+    ("Credit_Improvement",
+     lambda target, means: target[:, _feature('Credit Score')] < means[:, CREDIT] - 0.1,
+     ["Our credit improvement program can help enhance your insurance terms",
+      "Customers with improved credit scores often receive better rates"]),
+
+    # 4. Additional demographic insights
+    ("Young_Customer",
+     lambda target, means: target[:, _feature('Age')] < 30,
+     ["Short-term flexible coverage plans for young professionals",
+      "Digital service with mobile app benefits"]),
+    ("Senior_Customer",
+     lambda target, means: target[:, _feature('Age')] > 55,
+     ["Fixed premium rates for long-term loyalty",
+      "Priority human customer support"]),
+]
+
+NO_NEIGHBOURS = {"General": ["We don't have enough similar customers to provide personalized recommendations."]}
+PLAN_OPTIMAL = {"General": ["Based on similar customers, your current plan appears optimal."]}
+
+
+def neighbour_statistics(index, neighbours):
+    """
+    Means of STAT_COLUMNS over the non-churned neighbours of every target, in
+    one gather and one weighted reduction over the (n_targets, k) neighbours.
+
+    Returns:
+    - (counts, means): non-churned neighbours per target and their column means
+    """
+    n_targets, k = neighbours.shape
+    flat = neighbours.reshape(-1)
+    values = index.get_rows(flat)[:, STAT_INDICES].reshape(n_targets, k, len(STAT_INDICES))
+    keep = (index.get_labels(flat) == 0).reshape(n_targets, k)
+
+    counts = keep.sum(axis=1)
+    sums = np.einsum('tk,tkc->tc', keep.astype(float), values)
+    means = sums / np.maximum(counts, 1)[:, None]
+    return counts, means
+
+
+def evaluate_rules(targets, counts, means):
+    """
+    Evaluate every rule over the whole batch at once and assemble one
+    recommendation dictionary per target.
+    """
+    matches = [(category, condition(targets, means), messages) for category, condition, messages in RULES]
+
+    results = []
+    for i in range(len(targets)):
+        if not counts[i]:
+            results.append({key: list(value) for key, value in NO_NEIGHBOURS.items()})
+            continue
+
+        recommendations = {}
+        for category, mask, messages in matches:
+            if mask[i]:
+                recommendations.setdefault(category, []).extend(messages)
+        results.append(recommendations or {key: list(value) for key, value in PLAN_OPTIMAL.items()})
+    return results
@@ -0,0 +1,535 @@
+import io
+import json
+import os
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+
+import joblib
+import numpy as np
+import pandas as pd
+from django.conf import settings
+
+from .feature_store import FeatureStore, churn_labels
+from .native import NATIVE_DIR, export_bundle, load_model, read_manifest
+from .similarity import normalize_rows
+
+try:
+    import fcntl
+except ImportError:  # Windows development machines; single process there
+    fcntl = None
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))  # Current script's directory
+PARENT_DIR = os.path.dirname(BASE_DIR)  # Moves one level up
+MODELS_DIR = os.path.join(PARENT_DIR, "models")
+LOGS_DIR = os.path.join(PARENT_DIR, "logs")
+
+# Artifact name -> file inside MODELS_DIR
+ARTIFACTS = {
+    "churn_model": "churn_model.pkl",
+    "plan_recommender": "plan_type_recommender.pkl",
+    "plan_recommender_churn": "plan_type_recommender_churn.pkl",
+    "churn_scaler": "churn_scaler.pkl",
+    "plan_scaler": "plan_type_scaler.pkl",
+    "plan_scaler_churn": "plan_type_scaler_churn.pkl",
+}
+
+# Scalers may be absent; callers fall back to unscaled features
+OPTIONAL_ARTIFACTS = {"churn_scaler", "plan_scaler", "plan_scaler_churn"}
+
+N_FEATURES = 12
+
+
+class ModelBundle:
+    """
+    One immutable set of artifacts (a version directory, or the legacy flat
+    models/ directory). Artifacts are loaded lazily, on first use, and kept for
+    the life of the bundle. joblib.load runs with mmap_mode="r" so the numpy
+    arrays inside joblib-dumped models are mapped from disk and shared between
+    forked workers instead of being copied into every process.
+
+    serving() returns the artifacts used for inference: the NumPy-only models
+    of the bundle's native/ export when there is one (see churn/native.py), so
+    serving workers never unpickle or import scikit-learn/XGBoost; get()
+    always returns the original pickled objects, e.g. for continued training.
+    """
+
+    def __init__(self, version, directory, prefer_native=True):
+        self.version = version
+        self.directory = directory
+        self.prefer_native = prefer_native
+        self._artifacts = {}
+        self._serving = {}
+        self._native_manifest = None
+        self._derived = {}
+        self._lock = threading.RLock()
+
+    def get(self, name):
+        try:
+            return self._artifacts[name]
+        except KeyError:
+            pass
+
+        with self._lock:
+            if name not in self._artifacts:
+                self._artifacts[name] = self._load(name)
+        return self._artifacts[name]
+
+    def _load(self, name):
+        path = os.path.join(self.directory, ARTIFACTS[name])
+        try:
+            return joblib.load(path, mmap_mode="r")
+        except FileNotFoundError:
+            if name in OPTIONAL_ARTIFACTS:
+                return None
+            raise
+
+    def serving(self, name):
+        try:
+            return self._serving[name]
+        except KeyError:
+            pass
+
+        with self._lock:
+            if name not in self._serving:
+                entry = self.native_manifest().get(name) if self.prefer_native else None
+                if entry is None:
+                    self._serving[name] = self.get(name)
+                else:
+                    self._serving[name] = load_model(os.path.join(self.directory, NATIVE_DIR), entry)
+        return self._serving[name]
+
+    def native_manifest(self):
+        if self._native_manifest is None:
+            self._native_manifest = read_manifest(self.directory)
+        return self._native_manifest
+
+    def preload(self):
+        for name in ARTIFACTS:
+            self.serving(name)
+        return self
+
+    def derived(self, key, factory):
+        """
+        Per-bundle cache for objects computed from the artifacts (e.g. the
+        compiled inference pipeline); built once with factory(bundle).
+        """
+        try:
+            return self._derived[key]
+        except KeyError:
+            pass
+
+        with self._lock:
+            if key not in self._derived:
+                self._derived[key] = factory(self)
+        return self._derived[key]
+
+    @property
+    def metadata(self):
+        try:
+            with open(os.path.join(self.directory, "meta.json")) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"version": self.version}
+
+
+class ModelRegistry:
+    """
+    Versioned model registry with hot reload.
+
+    Published versions live in immutable directories under models/versions/
+    and models/CURRENT names the live one. CURRENT is replaced atomically, so a
+    reader sees either the old or the new version, never a partial write.
+
+    current() stats the pointer at most once every check_interval seconds.
+    When it moves, the new bundle is loaded on a background thread and swapped
+    in once ready; requests keep using the bundle they started with, so
+    in-flight predictions are never blocked or mixed across versions. Without a
+    CURRENT file the legacy flat models/*.pkl files are served.
+    """
+
+    def __init__(self, models_dir=MODELS_DIR, check_interval=1.0, prefer_native=True):
+        self.models_dir = models_dir
+        self.prefer_native = prefer_native
+        self.versions_dir = os.path.join(models_dir, "versions")
+        self.pointer_path = os.path.join(models_dir, "CURRENT")
+        self.check_interval = check_interval
+        self._bundle = None
+        self._pointer_stat = None
+        self._next_check = 0.0
+        self._reloading = False
+        self._lock = threading.Lock()
+
+    def _read_pointer(self):
+        try:
+            stat = os.stat(self.pointer_path)
+            with open(self.pointer_path) as f:
+                version = f.read().strip()
+        except FileNotFoundError:
+            return None, None
+        return version or None, (stat.st_mtime_ns, stat.st_ino, stat.st_size)
+
+    def _bundle_for(self, version):
+        if version is None:
+            return ModelBundle("legacy", self.models_dir, self.prefer_native)
+        return ModelBundle(version, os.path.join(self.versions_dir, version), self.prefer_native)
+
+    def current(self):
+        """
+        The live ModelBundle. Hold on to the returned bundle for the duration of
+        a request so every artifact comes from the same version.
+        """
+        if self._bundle is None:
+            with self._lock:
+                if self._bundle is None:
+                    version, self._pointer_stat = self._read_pointer()
+                    self._bundle = self._bundle_for(version)
+                    self._next_check = time.monotonic() + self.check_interval
+            return self._bundle
+
+        now = time.monotonic()
+        if now >= self._next_check and not self._reloading:
+            self._next_check = now + self.check_interval
+            self._check_for_update()
+        return self._bundle
+
+    def _check_for_update(self):
+        try:
+            stat = os.stat(self.pointer_path)
+            pointer_stat = (stat.st_mtime_ns, stat.st_ino, stat.st_size)
+        except FileNotFoundError:
+            pointer_stat = None
+        if pointer_stat == self._pointer_stat:
+            return
+
+        with self._lock:
+            if self._reloading:
+                return
+            self._reloading = True
+        threading.Thread(target=self._reload, daemon=True).start()
+
+    def _reload(self):
+        try:
+            version, pointer_stat = self._read_pointer()
+            if version != self._bundle.version:
+                # Load everything before the swap so no request pays the cold start
+                self._bundle = self._bundle_for(version).preload()
+            self._pointer_stat = pointer_stat
+        except Exception as e:
+            print(f"Error loading model version: {str(e)}")
+        finally:
+            self._reloading = False
+
+    def reload(self):
+        """
+        Synchronously switch to whatever CURRENT points at.
+        """
+        with self._lock:
+            version, self._pointer_stat = self._read_pointer()
+            if self._bundle is None or self._bundle.version != version:
+                self._bundle = self._bundle_for(version)
+        return self._bundle
+
+    def get(self, name):
+        return self.current().get(name)
+
+    def publish(self, writers, metadata=None):
+        """
+        Publish a new immutable version and make it current.
+
+        Parameters:
+        - writers: dict of artifact name -> callable(path) that writes the artifact.
+          Artifacts not listed are carried over from the current version.
+        - metadata: extra fields stored in the version's meta.json
+
+        Returns:
+        - The new version string
+        """
+        unknown = set(writers) - set(ARTIFACTS)
+        if unknown:
+            raise ValueError(f"Unknown artifacts: {sorted(unknown)}")
+
+        parent = self.current()
+        now = time.time()
+        # Sortable by publish time; pid + microseconds keep concurrent publishers apart
+        version = time.strftime("%Y%m%d-%H%M%S", time.gmtime(now)) + f"-{int(now * 1e6) % 10**6:06d}-{os.getpid()}"
+        os.makedirs(self.versions_dir, exist_ok=True)
+        staging_dir = os.path.join(self.versions_dir, f".staging-{version}")
+        os.makedirs(staging_dir)
+
+        try:
+            for name, filename in ARTIFACTS.items():
+                target = os.path.join(staging_dir, filename)
+                if name in writers:
+                    writers[name](target)
+                    continue
+                source = os.path.join(parent.directory, filename)
+                if not os.path.exists(source):
+                    continue
+                try:
+                    os.link(source, target)
+                except OSError:
+                    shutil.copy2(source, target)
+
+            # Serving workers load these instead of the pickles
+            staged = ModelBundle(version, staging_dir)
+            exported, skipped = export_bundle(staging_dir, {
+                name: staged.get(name) for name, filename in ARTIFACTS.items()
+                if os.path.exists(os.path.join(staging_dir, filename))
+            })
+
+            meta = {"version": version, "parent": parent.version, "created_at": time.time(),
+                    "native_artifacts": exported}
+            if skipped:
+                meta["native_skipped"] = skipped
+            meta.update(metadata or {})
+            with open(os.path.join(staging_dir, "meta.json"), "w") as f:
+                json.dump(meta, f, indent=2)
+        except Exception:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+            raise
+
+        # The version directory appears complete or not at all
+        os.rename(staging_dir, os.path.join(self.versions_dir, version))
+
+        tmp_pointer = f"{self.pointer_path}.{os.getpid()}.tmp"
+        with open(tmp_pointer, "w") as f:
+            f.write(version)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_pointer, self.pointer_path)
+        return version
+
+    def versions(self):
+        if not os.path.isdir(self.versions_dir):
+            return []
+        return sorted(v for v in os.listdir(self.versions_dir) if not v.startswith("."))
+
+
+def complete_csv_size(csv_path):
+    """
+    Size in bytes of the CSV up to its last complete line. A row that is still
+    being appended is left for the next reader.
+    """
+    size = os.path.getsize(csv_path)
+    with open(csv_path, "rb") as f:
+        f.seek(max(size - 1, 0))
+        if size == 0 or f.read(1) == b"\n":
+            return size
+        f.seek(max(size - 65536, 0))
+        tail = f.read()
+    return size - len(tail) + tail.rfind(b"\n") + 1
+
+
+def read_csv_range(csv_path, start, end, n_columns=N_FEATURES + 1):
+    """
+    Parse only the rows between two byte offsets of the CSV. Offsets must sit on
+    line boundaries; column names always come from the header line.
+    """
+    with open(csv_path, "rb") as f:
+        header = f.readline()
+        f.seek(max(start, len(header)))
+        chunk = f.read(end - max(start, len(header)))
+    columns = pd.read_csv(io.BytesIO(header)).columns[:n_columns]
+    if not chunk.strip():
+        return pd.DataFrame(columns=columns, dtype=np.float64)
+    frame = pd.read_csv(io.BytesIO(chunk), header=None).iloc[:, :n_columns]
+    frame.columns = columns
+    return frame
+
+
+class TrainingDataset:
+    """
+    Training matrix for similarity search, derived from the feature store.
+
+    The cache is a base part, <stem>.npy (float64 features + label, row-major)
+    and <stem>.vectors.npy (L2-normalized float32 features), followed by
+    smaller parts <stem>.part-<first>-<end>.npy / .vectors.npy holding the
+    store rows appended since. Every file is written once and opened with
+    mmap_mode="r", so every worker maps the same pages. The label column is
+    stored as churn_labels() (0/1, NaN for invalid labels) rather than the
+    logged probability, so neighbour statistics and retraining agree.
+
+    refresh() only reads and normalizes store rows past the last part and
+    writes them as a new part (store offsets are stable across compaction);
+    existing files are never rewritten on that path. compact() folds the
+    parts into a new base, streaming them through a memory-mapped output
+    file; the prediction-log flusher calls it in the background once the
+    parts reach max_parts files or max_part_ratio of the base rows.
+    """
+
+    def __init__(self, store, stem=os.path.join(LOGS_DIR, "training_data"), max_parts=8, max_part_ratio=0.25):
+        self.store = store
+        self.stem = stem
+        self.data_path = stem + ".npy"
+        self.vectors_path = stem + ".vectors.npy"
+        self.manifest_path = stem + ".manifest.json"
+        self.max_parts = max_parts
+        self.max_part_ratio = max_part_ratio
+        self._loaded = None
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _file_lock(self):
+        # One process (re)writes the cache at a time; the others then find it up to date
+        with open(self.stem + ".lock", "a") as f:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def _load_manifest(self):
+        try:
+            with open(self.manifest_path) as f:
+                manifest = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        # Single-file caches from before parts existed
+        manifest.setdefault("base_rows", manifest.get("rows", 0))
+        manifest.setdefault("parts", [])
+        return manifest
+
+    def _write_manifest(self, manifest):
+        manifest["labels"] = "binary"
+        manifest["rows"] = manifest["base_rows"] + sum(part["rows"] for part in manifest["parts"])
+        tmp_path = f"{self.manifest_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _part_path(self, part, key):
+        return os.path.join(os.path.dirname(self.stem), part[key])
+
+    def refresh(self):
+        """
+        Bring the cache up to date with the store. Returns True if anything was written.
+        """
+        with self._file_lock():
+            manifest = self._load_manifest()
+            total_rows = self.store.rows
+            # Caches written before the feature store have no store_rows, and
+            # older ones hold raw probabilities as labels; both are rebuilt
+            if (manifest is None or "store_rows" not in manifest or manifest["store_rows"] > total_rows
+                    or manifest.get("labels") != "binary"
+                    or not os.path.exists(self.data_path) or not os.path.exists(self.vectors_path)):
+                data = self._read_store(0, total_rows)
+                self._atomic_save(self.data_path, data)
+                self._atomic_save(self.vectors_path, normalize_rows(data[:, :N_FEATURES]))
+                self._write_manifest({"store_rows": total_rows, "base_rows": len(data), "parts": []})
+                return True
+            first = manifest["store_rows"]
+            if first == total_rows:
+                return False
+
+            data = self._read_store(first, total_rows)
+            name = f"{os.path.basename(self.stem)}.part-{first}-{total_rows}"
+            part = {"data": name + ".npy", "vectors": name + ".vectors.npy", "rows": len(data)}
+            self._atomic_save(self._part_path(part, "data"), data)
+            self._atomic_save(self._part_path(part, "vectors"), normalize_rows(data[:, :N_FEATURES]))
+            manifest["parts"].append(part)
+            manifest["store_rows"] = total_rows
+            self._write_manifest(manifest)
+            return True
+
+    def compact(self, force=False):
+        """
+        Fold the parts into a new base, once they reach max_parts files or
+        max_part_ratio of the base rows (always with force). Returns True if
+        it did. Readers holding the old files keep their maps.
+        """
+        with self._file_lock():
+            manifest = self._load_manifest()
+            if manifest is None or not manifest["parts"]:
+                return False
+            part_rows = manifest["rows"] - manifest["base_rows"]
+            if not force and (len(manifest["parts"]) < self.max_parts
+                              and part_rows < self.max_part_ratio * manifest["base_rows"]):
+                return False
+
+            for path, key in ((self.data_path, "data"), (self.vectors_path, "vectors")):
+                blocks = [np.load(path, mmap_mode="r")[:manifest["base_rows"]]]
+                blocks += [np.load(self._part_path(part, key), mmap_mode="r") for part in manifest["parts"]]
+                tmp_path = f"{path}.{os.getpid()}.tmp.npy"
+                out = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=blocks[0].dtype,
+                                                shape=(manifest["rows"],) + blocks[0].shape[1:])
+                offset = 0
+                for block in blocks:
+                    out[offset:offset + len(block)] = block
+                    offset += len(block)
+                out.flush()
+                del out
+                os.replace(tmp_path, path)
+
+            retired = manifest["parts"]
+            self._write_manifest({"store_rows": manifest["store_rows"], "base_rows": manifest["rows"], "parts": []})
+            for part in retired:
+                for key in ("data", "vectors"):
+                    try:
+                        os.remove(self._part_path(part, key))
+                    except FileNotFoundError:
+                        pass
+            return True
+
+    def _read_store(self, start_row, end_row):
+        data = self.store.read(start_row=start_row, end_row=end_row)
+        data[:, N_FEATURES] = churn_labels(data[:, N_FEATURES], strict=False)
+        return data
+
+    @staticmethod
+    def _atomic_save(path, array):
+        # Write-then-rename so concurrent readers never map a partial file
+        tmp_path = f"{path}.{os.getpid()}.tmp.npy"
+        np.save(tmp_path, array)
+        os.replace(tmp_path, path)
+
+    def _map_parts(self):
+        for attempt in range(3):
+            manifest = self._load_manifest()
+            try:
+                # A base compacted after the manifest was read starts with the same rows
+                files = [(self.data_path, self.vectors_path, manifest["base_rows"])]
+                files += [(self._part_path(part, "data"), self._part_path(part, "vectors"), part["rows"])
+                          for part in manifest["parts"]]
+                parts = []
+                for data_path, vectors_path, rows in files:
+                    data = np.load(data_path, mmap_mode="r")[:rows]
+                    vectors = np.load(vectors_path, mmap_mode="r")[:rows]
+                    parts.append((data[:, :N_FEATURES], data[:, N_FEATURES], vectors))
+                return parts
+            except FileNotFoundError:
+                # Parts removed by a compaction after the manifest was read
+                if attempt == 2:
+                    raise
+
+    def load_parts(self):
+        """
+        Returns [(X, y, vectors), ...] per cache part, base first, as
+        read-only memory-mapped arrays.
+        """
+        if self._loaded is None:
+            with self._lock:
+                if self._loaded is None:
+                    self.refresh()
+                    self._loaded = self._map_parts()
+        return self._loaded
+
+    def load(self):
+        """
+        Returns (X, y, vectors) over every cached row: memory-mapped when the
+        cache is a single part, otherwise copied together from the parts.
+        """
+        parts = self.load_parts()
+        if len(parts) == 1:
+            return parts[0]
+        return tuple(np.concatenate(arrays) for arrays in zip(*parts))
+
+
+models = ModelRegistry(prefer_native=getattr(settings, "CHURN_NATIVE_MODELS", True))
+# logs/training_data.csv, if present, is imported into the store on first use
+feature_store = FeatureStore(os.path.join(LOGS_DIR, "feature_store"),
+                             legacy_csv=os.path.join(LOGS_DIR, "training_data.csv"))
+training_data = TrainingDataset(feature_store)
@@ -0,0 +1,161 @@
+import threading
+import time
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count, Max, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import ChurnRollup, CustomerRecord, RollupWatermark
+from .queries import CHURN_RISK_THRESHOLD
+
+# CustomerRecord fields rolled up per day; "all" is the whole portfolio
+ROLLUP_DIMENSIONS = ("all", "plan_type", "gender", "type_of_insurance")
+WATERMARK_NAME = "customer_records"
+
+_refresh_lock = threading.Lock()
+_next_refresh = 0.0
+
+
+def _deltas(records):
+    """
+    {(day, dimension, value): [customers, scored, at_risk, probability_sum]}
+    for a queryset of new records, aggregated by the database.
+    """
+    deltas = {}
+    records = records.annotate(day=TruncDate("created_at")).order_by()
+    for dimension in ROLLUP_DIMENSIONS:
+        group_by = ("day",) if dimension == "all" else ("day", dimension)
+        rows = records.values(*group_by).annotate(
+            customers=Count("id"),
+            scored=Count("churn_probability"),
+            at_risk=Count("id", filter=Q(churn_probability__gt=CHURN_RISK_THRESHOLD)),
+            probability_sum=Sum("churn_probability"),
+        )
+        for row in rows:
+            value = "all" if dimension == "all" else row[dimension]
+            deltas[(row["day"], dimension, value)] = [row["customers"], row["scored"], row["at_risk"],
+                                                      row["probability_sum"] or 0.0]
+    return deltas
+
+
+def _merge(deltas, refreshed_at):
+    existing = {
+        (rollup.day, rollup.dimension, rollup.value): rollup
+        for rollup in ChurnRollup.objects.filter(day__in={key[0] for key in deltas})
+    }
+    updated, created = [], []
+    for (day, dimension, value), (customers, scored, at_risk, probability_sum) in deltas.items():
+        rollup = existing.get((day, dimension, value))
+        if rollup is None:
+            created.append(ChurnRollup(day=day, dimension=dimension, value=value, customers=customers,
+                                       scored=scored, at_risk=at_risk, probability_sum=probability_sum,
+                                       refreshed_at=refreshed_at))
+            continue
+        rollup.customers += customers
+        rollup.scored += scored
+        rollup.at_risk += at_risk
+        rollup.probability_sum += probability_sum
+        rollup.refreshed_at = refreshed_at
+        updated.append(rollup)
+    ChurnRollup.objects.bulk_update(updated, ["customers", "scored", "at_risk", "probability_sum", "refreshed_at"],
+                                    batch_size=500)
+    ChurnRollup.objects.bulk_create(created, batch_size=500)
+
+
+def refresh_rollups(settle_seconds=5.0, batch_size=50000):
+    """
+    Fold CustomerRecord rows newer than the watermark into the daily rollups.
+
+    Rows are processed in id order, batch_size at a time, each batch in one
+    transaction that also advances the watermark, so a crash never counts a
+    row twice or skips one. Rows younger than settle_seconds are left for the
+    next refresh: ids are handed out before a transaction commits, so a
+    lower id can still become visible after a higher one.
+
+    Returns:
+    - Number of records rolled up
+    """
+    total = 0
+    while True:
+        with transaction.atomic():
+            # Row lock: concurrent refreshers (flush threads, the cron job) take turns
+            watermark, _ = RollupWatermark.objects.get_or_create(name=WATERMARK_NAME)
+            watermark = RollupWatermark.objects.select_for_update().get(pk=watermark.pk)
+            cutoff = timezone.now() - timedelta(seconds=settle_seconds)
+            ids = list(
+                CustomerRecord.objects.filter(id__gt=watermark.last_record_id, created_at__lt=cutoff)
+                .order_by("id").values_list("id", flat=True)[:batch_size]
+            )
+            if not ids:
+                return total
+
+            refreshed_at = timezone.now()
+            _merge(_deltas(CustomerRecord.objects.filter(id__gt=watermark.last_record_id, id__lte=ids[-1])),
+                   refreshed_at)
+            watermark.last_record_id = ids[-1]
+            watermark.refreshed_at = refreshed_at
+            watermark.save(update_fields=["last_record_id", "refreshed_at"])
+            total += len(ids)
+
+
+def refresh_rollups_if_due(min_interval=10.0, **options):
+    """
+    refresh_rollups() at most once every min_interval seconds per process;
+    called by the prediction log flusher after each flush.
+    """
+    global _next_refresh
+    now = time.monotonic()
+    if now < _next_refresh or not _refresh_lock.acquire(blocking=False):
+        return 0
+    try:
+        _next_refresh = now + min_interval
+        return refresh_rollups(**options)
+    finally:
+        _refresh_lock.release()
+
+
+def rebuild_rollups(**options):
+    """
+    Drop every rollup and recompute them from all records.
+    """
+    with transaction.atomic():
+        ChurnRollup.objects.all().delete()
+        RollupWatermark.objects.filter(name=WATERMARK_NAME).delete()
+    return refresh_rollups(**options)
+
+
+def rollup_rows(dimension, start=None, end=None):
+    """
+    Rollups of one dimension for days in [start, end], with derived rates.
+    Reads only the rollup table, so the cost doesn't grow with the number of
+    saved predictions.
+    """
+    rollups = ChurnRollup.objects.filter(dimension=dimension)
+    if start is not None:
+        rollups = rollups.filter(day__gte=start)
+    if end is not None:
+        rollups = rollups.filter(day__lte=end)
+    return [{
+        "day": rollup.day,
+        "value": rollup.value,
+        "customers": rollup.customers,
+        "at_risk": rollup.at_risk,
+        "churn_rate": rollup.at_risk / rollup.scored if rollup.scored else None,
+        "average_churn_probability": rollup.probability_sum / rollup.scored if rollup.scored else None,
+        "refreshed_at": rollup.refreshed_at,
+    } for rollup in rollups.order_by("day", "value")]
+
+
+def watermark_status():
+    """
+    How far the rollups have got: the last record folded in, when, and the
+    newest record id (both id lookups are primary-key index reads).
+    """
+    watermark = RollupWatermark.objects.filter(name=WATERMARK_NAME).first()
+    return {
+        "last_record_id": watermark.last_record_id if watermark else 0,
+        "latest_record_id": CustomerRecord.objects.aggregate(latest=Max("id"))["latest"] or 0,
+        "refreshed_at": watermark.refreshed_at if watermark else None,
+    }
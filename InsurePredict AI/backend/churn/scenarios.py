@@ -0,0 +1,111 @@
+import math
+
+import numpy as np
+
+from .inference import FEATURE_NAMES, PLAN_TYPE_INDEX, get_pipeline
+
+# Upper bound on scenarios scored by a single /api/what-if/ call
+MAX_SCENARIOS = 5000
+
+PLAN_TYPES = {1: "Basic", 2: "Standard", 3: "Premium"}
+FLAG_FEATURES = ("Automobile Insurance", "Health Insurance", "Life Insurance")
+
+
+def _grid_values(name, values):
+    if name not in FEATURE_NAMES:
+        raise ValueError(f"Unknown feature '{name}' in 'grid'")
+    if not isinstance(values, list) or not values:
+        raise ValueError(f"'grid' values for '{name}' should be a non-empty list")
+    try:
+        values = [float(value) for value in values]
+    except (TypeError, ValueError):
+        raise ValueError(f"'grid' values for '{name}' should be numbers")
+    if not all(math.isfinite(value) for value in values):
+        raise ValueError(f"'grid' values for '{name}' should be finite")
+    if name == "Plan Type" and not set(values) <= set(PLAN_TYPES):
+        raise ValueError(f"'Plan Type' values should be among {sorted(PLAN_TYPES)}")
+    if name in FLAG_FEATURES and not set(values) <= {0.0, 1.0}:
+        raise ValueError(f"'{name}' values should be 0 or 1")
+    # Duplicates would only repeat scenarios
+    return list(dict.fromkeys(values))
+
+
+def expand_scenarios(features, grid):
+    """
+    The cartesian product of grid applied to one customer, as one matrix.
+
+    Parameters:
+    - features: the customer's features in FEATURE_NAMES order
+    - grid: dict of feature name -> list of values to try
+
+    Returns:
+    - (matrix, columns): row 0 is the unchanged customer, the other rows one
+      scenario each (those identical to the customer are left out); columns
+      are the FEATURE_NAMES indices the grid varies
+
+    Raises:
+    - ValueError for unknown features, invalid values or too many scenarios
+    """
+    baseline = np.asarray(features, dtype=float)
+    if baseline.shape != (len(FEATURE_NAMES),):
+        raise ValueError(f"'features' should hold the {len(FEATURE_NAMES)} features in feature_names order")
+    if not isinstance(grid, dict) or not grid:
+        raise ValueError("'grid' should map feature names to lists of values")
+
+    values = [_grid_values(name, grid[name]) for name in grid]
+    columns = [FEATURE_NAMES.index(name) for name in grid]
+    n_scenarios = math.prod(len(column_values) for column_values in values)
+    if n_scenarios > MAX_SCENARIOS:
+        raise ValueError(f"The grid expands to {n_scenarios} scenarios; at most {MAX_SCENARIOS} are allowed")
+
+    # Every combination of the grid values, one row per scenario
+    combinations = np.stack(np.meshgrid(*values, indexing="ij"), axis=-1).reshape(-1, len(columns))
+    matrix = np.repeat(baseline[None, :], len(combinations) + 1, axis=0)
+    matrix[1:, columns] = combinations
+    changed = np.any(matrix[1:, columns] != baseline[columns], axis=1)
+    return matrix[np.concatenate([[True], changed])], columns
+
+
+def score_scenarios(features, grid, bundle, limit=None):
+    """
+    Score every scenario of expand_scenarios() in one pass of the bundle's
+    inference pipeline: one churn model call and one call per plan
+    recommender for the whole matrix. Nothing is logged or cached.
+
+    Returns:
+    - Dictionary with the baseline result and the scenarios ranked by churn
+      probability (lowest first), each with the features it changes and the
+      change in churn probability against the baseline; limit keeps the
+      first limit scenarios
+    """
+    matrix, columns = expand_scenarios(features, grid)
+    churn_probabilities, recommended_plans = get_pipeline(bundle).score(matrix)
+    order = 1 + np.argsort(churn_probabilities[1:], kind="stable")
+    if limit is not None:
+        order = order[:limit]
+
+    # Plain Python values from here on; per-element NumPy indexing would dominate
+    probabilities, plans = churn_probabilities.tolist(), recommended_plans.astype(int).tolist()
+    varied, names = matrix[:, columns].tolist(), [FEATURE_NAMES[column] for column in columns]
+    baseline_probability, baseline_values = probabilities[0], varied[0]
+
+    def result(i):
+        return {
+            "churn_probability": probabilities[i],
+            "is_churn_risk": probabilities[i] > 0.5,
+            "recommended_plan": plans[i],
+            "recommended_plan_name": PLAN_TYPES.get(plans[i]),
+        }
+
+    scenarios = [{
+        "changes": {name: value for name, value, original in zip(names, varied[i], baseline_values)
+                    if value != original},
+        **result(i),
+        "churn_probability_change": probabilities[i] - baseline_probability,
+    } for i in order.tolist()]
+    return {
+        "model_version": bundle.version,
+        "baseline": {"plan_type": PLAN_TYPES.get(int(matrix[0, PLAN_TYPE_INDEX])), **result(0)},
+        "scenario_count": len(matrix) - 1,
+        "scenarios": scenarios,
+    }
@@ -1,7 +1,12 @@
 from rest_framework import serializers
-from .models import CustomerRecord
+from .models import CustomerRecord, RetrainJob
 
 class CustomerRecordSerializer(serializers.ModelSerializer):
     class Meta:
         model = CustomerRecord
         fields = '__all__'
+
+class RetrainJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = RetrainJob
+        fields = '__all__'
@@ -0,0 +1,258 @@
+import threading
+
+import numpy as np
+
+BACKENDS = ("exact", "balltree", "hnsw")
+
+
+def normalize_rows(rows):
+    """
+    L2-normalize every row into a contiguous float32 matrix.
+    Zero vectors stay zero, matching sklearn's cosine_similarity.
+    """
+    vectors = np.ascontiguousarray(rows, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class SimilarityIndex:
+    """
+    Cosine-similarity index over customer profiles.
+
+    Rows are L2-normalized once and stored in a contiguous float32 matrix, so a
+    query is a single matrix product followed by an argpartition top-k instead
+    of a cosine_similarity call and a full sort. The raw profiles and their
+    churn labels are kept alongside the vectors so callers can aggregate over
+    the neighbours that a query returns.
+
+    Storage is split in two blocks: a read-only base (typically memory-mapped
+    from the training data cache and shared between worker processes) and a
+    private tail that grows geometrically as rows are appended with add().
+
+    Backends:
+    - "exact": brute-force dot products (default, exact results)
+    - "balltree": sklearn BallTree over the unit vectors; rows inserted after
+      the last build are scanned exactly until a background thread has
+      rebuilt the tree and swapped it in
+    - "hnsw": approximate search with hnswlib (optional dependency)
+    """
+
+    def __init__(self, rows=None, labels=None, vectors=None, backend="exact", rebuild_ratio=0.1):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown similarity backend '{backend}', expected one of {BACKENDS}")
+
+        self.backend = backend
+        self.rebuild_ratio = rebuild_ratio
+        self._lock = threading.Lock()
+
+        # Read-only base block
+        if rows is not None and len(rows):
+            self._base_rows = rows
+            self._base_labels = np.full(len(rows), np.nan) if labels is None else labels
+            self._base_vectors = normalize_rows(rows) if vectors is None else vectors
+            self._n_features = rows.shape[1]
+        else:
+            self._base_rows = self._base_labels = self._base_vectors = None
+            self._n_features = None
+        self._base_size = 0 if self._base_rows is None else len(self._base_rows)
+
+        # Growable private tail
+        self._tail_size = 0
+        self._tail_vectors = None
+        self._tail_rows = None
+        self._tail_labels = None
+
+        # Backend specific state
+        self._tree = None
+        self._tree_size = 0
+        self._rebuild_thread = None
+        self._hnsw = None
+
+        if self._base_size:
+            if backend == "balltree":
+                self._tree, self._tree_size = self._build_tree(self._base_vectors), self._base_size
+            elif backend == "hnsw":
+                self._hnsw_add(self._base_vectors, 0)
+
+    def __len__(self):
+        return self._base_size + self._tail_size
+
+    def get_rows(self, indices):
+        """Raw (unnormalized) customer profiles at the given index positions."""
+        return self._take(indices, self._base_rows, self._tail_rows)
+
+    def get_labels(self, indices):
+        """Churn labels at the given index positions."""
+        return self._take(indices, self._base_labels, self._tail_labels)
+
+    def _take(self, indices, base, tail):
+        indices = np.asarray(indices, dtype=np.intp)
+        in_base = indices < self._base_size
+        if in_base.all():
+            return np.asarray(base[indices])
+        if not in_base.any():
+            return tail[indices - self._base_size]
+        out = np.empty((len(indices),) + tail.shape[1:], dtype=tail.dtype)
+        out[in_base] = base[indices[in_base]]
+        out[~in_base] = tail[indices[~in_base] - self._base_size]
+        return out
+
+    def _reserve(self, n_rows):
+        capacity = 0 if self._tail_vectors is None else self._tail_vectors.shape[0]
+        if n_rows <= capacity:
+            return
+
+        new_capacity = max(n_rows, 2 * capacity, 1024)
+        vectors = np.empty((new_capacity, self._n_features), dtype=np.float32)
+        rows = np.empty((new_capacity, self._n_features), dtype=np.float64)
+        labels = np.empty(new_capacity, dtype=np.float64)
+        if self._tail_size:
+            vectors[:self._tail_size] = self._tail_vectors[:self._tail_size]
+            rows[:self._tail_size] = self._tail_rows[:self._tail_size]
+            labels[:self._tail_size] = self._tail_labels[:self._tail_size]
+        self._tail_vectors, self._tail_rows, self._tail_labels = vectors, rows, labels
+
+    def add(self, rows, labels=None):
+        """
+        Append customers to the index.
+
+        Parameters:
+        - rows: 2D array-like of customer features
+        - labels: churn label for every row (defaults to NaN)
+
+        Returns:
+        - np.ndarray with the index positions assigned to the new rows
+        """
+        rows = np.asarray(rows, dtype=np.float64)
+        if rows.ndim == 1:
+            rows = rows.reshape(1, -1)
+        labels = np.full(len(rows), np.nan) if labels is None else np.asarray(labels, dtype=np.float64).reshape(-1)
+        if len(labels) != len(rows):
+            raise ValueError("labels must have one entry per row")
+
+        rebuild = None
+        with self._lock:
+            if self._n_features is None:
+                self._n_features = rows.shape[1]
+            elif rows.shape[1] != self._n_features:
+                raise ValueError(f"Expected {self._n_features} features per row, got {rows.shape[1]}")
+
+            start, end = self._tail_size, self._tail_size + len(rows)
+            self._reserve(end)
+            vectors = normalize_rows(rows)
+            self._tail_vectors[start:end] = vectors
+            self._tail_rows[start:end] = rows
+            self._tail_labels[start:end] = labels
+            self._tail_size = end
+
+            if self.backend == "balltree":
+                if (self._rebuild_thread is None
+                        and len(self) - self._tree_size > self.rebuild_ratio * max(self._tree_size, 1)):
+                    # Rows below _tail_size are never written again (a resize
+                    # copies them elsewhere), so the rebuild can read this
+                    # view without holding the lock
+                    blocks = [block for block in (self._base_vectors, self._tail_vectors[:end]) if block is not None]
+                    rebuild = self._rebuild_thread = threading.Thread(
+                        target=self._rebuild_tree, args=(blocks, len(self)), name="similarity-rebuild", daemon=True)
+            elif self.backend == "hnsw":
+                self._hnsw_add(vectors, self._base_size + start)
+
+        if rebuild is not None:
+            rebuild.start()
+        return np.arange(self._base_size + start, self._base_size + end)
+
+    @staticmethod
+    def _build_tree(vectors):
+        from sklearn.neighbors import BallTree
+
+        # Euclidean distance between unit vectors is monotonic in cosine similarity
+        return BallTree(vectors)
+
+    def _rebuild_tree(self, blocks, size):
+        # Queries keep using the old tree plus an exact scan of the newer rows
+        # until the new tree is swapped in
+        try:
+            tree = self._build_tree(blocks[0] if len(blocks) == 1 else np.vstack(blocks))
+        except Exception as e:
+            print(f"Error rebuilding similarity tree: {str(e)}")
+            tree = None
+        with self._lock:
+            if tree is not None:
+                self._tree, self._tree_size = tree, size
+            self._rebuild_thread = None
+
+    def _hnsw_add(self, vectors, offset):
+        try:
+            import hnswlib
+        except ImportError:
+            raise ImportError("The 'hnsw' similarity backend requires the hnswlib package")
+
+        end = offset + len(vectors)
+        if self._hnsw is None:
+            self._hnsw = hnswlib.Index(space="cosine", dim=self._n_features)
+            self._hnsw.init_index(max_elements=max(end, 1024), ef_construction=200, M=16)
+            self._hnsw.set_ef(64)
+        elif end > self._hnsw.get_max_elements():
+            self._hnsw.resize_index(max(end, 2 * self._hnsw.get_max_elements()))
+        self._hnsw.add_items(vectors, np.arange(offset, end))
+
+    @staticmethod
+    def _top_k(similarities, n):
+        # argpartition selects the top n in O(N), only those n get sorted
+        if similarities.shape[1] > n:
+            candidates = np.argpartition(-similarities, n - 1, axis=1)[:, :n]
+        else:
+            candidates = np.tile(np.arange(similarities.shape[1]), (similarities.shape[0], 1))
+        order = np.argsort(-np.take_along_axis(similarities, candidates, axis=1), axis=1, kind="stable")
+        return np.take_along_axis(candidates, order, axis=1)
+
+    def query(self, targets, n=10):
+        """
+        Find the n most similar indexed customers for every target.
+
+        Parameters:
+        - targets: 1D or 2D array-like of customer features
+        - n: number of neighbours per target
+
+        Returns:
+        - np.ndarray of shape (n_targets, min(n, len(index))) holding index
+          positions ordered by decreasing cosine similarity
+        """
+        targets = np.asarray(targets, dtype=np.float32)
+        targets = targets.reshape(1, -1) if targets.ndim == 1 else targets
+
+        with self._lock:
+            size = len(self)
+            tail_vectors = self._tail_vectors[:self._tail_size] if self._tail_size else None
+            tree, tree_size = self._tree, self._tree_size
+
+        n = min(n, size)
+        if n == 0:
+            return np.empty((len(targets), 0), dtype=np.intp)
+        queries = normalize_rows(targets)
+
+        if self.backend == "hnsw":
+            neighbours, _ = self._hnsw.knn_query(queries, k=n)
+            return neighbours.astype(np.intp)
+
+        if self.backend == "balltree" and tree is not None:
+            distances, tree_neighbours = tree.query(queries, k=min(n, tree_size))
+            similarities = [1.0 - distances ** 2 / 2.0]
+            candidates = [tree_neighbours]
+            if size > tree_size:
+                # Rows appended since the last rebuild are scanned exactly
+                recent = tail_vectors[tree_size - self._base_size:]
+                similarities.append(queries @ recent.T)
+                candidates.append(np.broadcast_to(np.arange(tree_size, size), (len(queries), size - tree_size)))
+            similarities = np.hstack(similarities)
+            best = self._top_k(similarities, n)
+            return np.take_along_axis(np.hstack(candidates), best, axis=1)
+
+        blocks = []
+        if self._base_size:
+            blocks.append(queries @ self._base_vectors.T)
+        if tail_vectors is not None:
+            blocks.append(queries @ tail_vectors.T)
+        similarities = blocks[0] if len(blocks) == 1 else np.hstack(blocks)
+        return self._top_k(similarities, n)
@@ -0,0 +1,207 @@
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+
+from .feature_store import churn_labels
+from .training import apply_scaler
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+
+class _LimitedReader:
+    """
+    File wrapper that stops at a byte limit, so rows appended while training
+    runs are left for the next high-water mark.
+    """
+
+    def __init__(self, f, limit):
+        self._f = f
+        self._remaining = limit
+
+    def read(self, size=-1):
+        if self._remaining <= 0:
+            return b""
+        if size is None or size < 0 or size > self._remaining:
+            size = self._remaining
+        data = self._f.read(size)
+        self._remaining -= len(data)
+        return data
+
+    def readline(self, size=-1):
+        line = self._f.readline(self._remaining)
+        self._remaining -= len(line)
+        return line
+
+    def __iter__(self):
+        return iter(self.readline, b"")
+
+
+def is_validation_row(chunk, validation_fraction):
+    """
+    Deterministic train/validation assignment from a hash of each row's
+    contents: the same row always lands in the same split, across chunks,
+    runs and machines, without holding the dataset in memory.
+    """
+    hashes = pd.util.hash_pandas_object(chunk, index=False).to_numpy()
+    return (hashes % 10000) < validation_fraction * 10000
+
+
+class CsvChunkIter(xgb.DataIter):
+    """
+    Feeds one side of the hashed split to XGBoost chunk by chunk. XGBoost
+    caches each chunk in its external-memory format under cache_prefix, so
+    only one CSV chunk is held in memory at a time.
+    """
+
+    def __init__(self, csv_path, csv_size, chunk_rows, validation, validation_fraction, cache_prefix,
+                 n_columns=13, scaler=None):
+        self.csv_path = csv_path
+        self.scaler = scaler
+        self.csv_size = csv_size
+        self.chunk_rows = chunk_rows
+        self.validation = validation
+        self.validation_fraction = validation_fraction
+        self.n_columns = n_columns
+        self._file = None
+        self._reader = None
+        super().__init__(cache_prefix=cache_prefix)
+
+    def reset(self):
+        if self._file is not None:
+            self._file.close()
+        self._file = open(self.csv_path, "rb")
+        self._reader = pd.read_csv(_LimitedReader(self._file, self.csv_size), chunksize=self.chunk_rows,
+                                   usecols=range(self.n_columns))
+
+    def next(self, input_data):
+        if self._reader is None:
+            self.reset()
+        chunk = next(self._reader, None)
+        if chunk is None:
+            self._file.close()
+            self._file = self._reader = None
+            return False
+
+        mask = is_validation_row(chunk, self.validation_fraction)
+        part = chunk[mask] if self.validation else chunk[~mask]
+        input_data(data=_scaled_features(part, self.scaler), label=churn_labels(part.iloc[:, -1]))
+        return True
+
+
+def _scaled_features(part, scaler):
+    # Hashing above uses the raw rows, so the split doesn't depend on the scaler
+    if scaler is None:
+        return part.iloc[:, :-1]
+    return pd.DataFrame(apply_scaler(part.iloc[:, :-1].to_numpy(), scaler), columns=part.columns[:-1])
+
+
+class StoreChunkIter(xgb.DataIter):
+    """
+    Feeds one side of the hashed split from the first end_row rows of a
+    FeatureStore, chunk_rows rows at a time. Column files are memory-mapped,
+    so at most one segment is resident while XGBoost builds its cache.
+    """
+
+    def __init__(self, store, end_row, chunk_rows, validation, validation_fraction, cache_prefix, scaler=None):
+        self.store = store
+        self.scaler = scaler
+        self.end_row = end_row
+        self.chunk_rows = chunk_rows
+        self.validation = validation
+        self.validation_fraction = validation_fraction
+        self._chunks = None
+        super().__init__(cache_prefix=cache_prefix)
+
+    def _iter_chunks(self):
+        for _, block in self.store.iter_segments(end_row=self.end_row):
+            for start in range(0, len(block), self.chunk_rows):
+                yield block[start:start + self.chunk_rows]
+
+    def reset(self):
+        self._chunks = self._iter_chunks()
+
+    def next(self, input_data):
+        if self._chunks is None:
+            self.reset()
+        block = next(self._chunks, None)
+        if block is None:
+            self._chunks = None
+            return False
+
+        chunk = pd.DataFrame(block, columns=self.store.columns)
+        mask = is_validation_row(chunk, self.validation_fraction)
+        part = chunk[mask] if self.validation else chunk[~mask]
+        input_data(data=_scaled_features(part, self.scaler), label=churn_labels(part.iloc[:, -1]))
+        return True
+
+
+def _peak_rss_mb():
+    if resource is None:
+        return None
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if os.uname().sysname == "Darwin" else 1024), 1)
+
+
+def train_streaming(make_iter, params, num_boost_round, callbacks=(), validation_fraction=0.2, cache_dir=None):
+    """
+    Out-of-core training over the chunks produced by make_iter(validation,
+    validation_fraction, cache_prefix), e.g. a CsvChunkIter or StoreChunkIter.
+
+    Returns:
+    - (booster, metrics, stats) where metrics holds the final validation
+      logloss/AUC and stats the row count, throughput and peak memory
+    """
+    started = time.perf_counter()
+    cache_root = tempfile.mkdtemp(prefix="churn-train-", dir=cache_dir)
+    try:
+        train_iter = make_iter(False, validation_fraction, os.path.join(cache_root, "train"))
+        val_iter = make_iter(True, validation_fraction, os.path.join(cache_root, "validation"))
+
+        # ExtMemQuantileDMatrix (XGBoost >= 3.0) builds hist quantiles straight from the iterator
+        if hasattr(xgb, "ExtMemQuantileDMatrix"):
+            dtrain = xgb.ExtMemQuantileDMatrix(train_iter)
+            dval = xgb.ExtMemQuantileDMatrix(val_iter, ref=dtrain)
+        else:
+            dtrain = xgb.DMatrix(train_iter)
+            dval = xgb.DMatrix(val_iter)
+
+        evals_result = {}
+        booster = xgb.train(
+            dict(params, objective="binary:logistic", tree_method="hist", eval_metric=["logloss", "auc"]),
+            dtrain,
+            num_boost_round=num_boost_round,
+            evals=[(dval, "validation")],
+            evals_result=evals_result,
+            callbacks=list(callbacks),
+            verbose_eval=False,
+        )
+        training_rows, validation_rows = dtrain.num_row(), dval.num_row()
+    finally:
+        shutil.rmtree(cache_root, ignore_errors=True)
+
+    elapsed = time.perf_counter() - started
+    history = evals_result.get("validation", {})
+    metrics = {
+        "logloss": float(history["logloss"][-1]),
+        "training_rows": int(training_rows),
+        "validation_rows": int(validation_rows),
+    }
+    auc = history.get("auc", [float("nan")])[-1]
+    if not np.isnan(auc):
+        metrics["auc"] = float(auc)
+
+    stats = {
+        "seconds": round(elapsed, 3),
+        "rows_per_second": round((training_rows + validation_rows) / elapsed, 1) if elapsed else None,
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+    return booster, metrics, stats
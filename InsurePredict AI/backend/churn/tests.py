@@ -1,3 +1,574 @@
-from django.test import TestCase
+import base64
+import copy
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+from django.core.cache import caches
+from django.db import IntegrityError, OperationalError, transaction
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+from django.utils import timezone
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.metrics.pairwise import cosine_similarity
+from sklearn.preprocessing import MinMaxScaler, StandardScaler
+
+from . import cache as cache_module
+from . import feature_store as feature_store_module
+from . import jobs, utils, views
+from .cache import PredictionCache
+from .feature_store import COLUMNS, FeatureStore, churn_labels
+from .inference import FEATURE_NAMES, PLAN_TYPE_INDEX, SCALE_COLUMNS, SCALE_INDEX, InferencePipeline
+from .model_utils import StoreSource
+from .models import CustomerRecord, RetrainJob
+from .prediction_log import PredictionLogWriter
+from .recommendations import neighbour_statistics
+from .registry import TrainingDataset
+from .similarity import SimilarityIndex
+from .native import export_model, load_model
+
+
+def customer_record(**fields):
+    """
+    An unsaved CustomerRecord with valid defaults for every required field.
+    """
+    return CustomerRecord(**{
+        "age": 35, "gender": "M", "earnings": 50000, "claim_amount": 6000, "insurance_plan_amount": 1200,
+        "credit_score": True, "marital_status": "S", "days_passed": 300, "type_of_insurance": "health",
+        "plan_type": "basic", "churn_probability": 0.5, **fields,
+    })
+
+
+class NativeExportTests(SimpleTestCase):
+    """
+    Models exported by churn/native.py score like the fitted originals.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+
+        rng = np.random.default_rng(0)
+        self.X = rng.normal(size=(400, 6)) * [1.0, 10.0, 100.0, 1.0, 0.1, 1000.0]
+        self.y_binary = (self.X[:, 0] + self.X[:, 1] / 10 > 0).astype(int)
+        self.y_multiclass = np.digitize(self.X[:, 0] - self.X[:, 3], [-0.5, 0.5]) + 1
+        # Missing values take each split's default direction
+        self.X_missing = self.X.copy()
+        self.X_missing[rng.random(self.X.shape) < 0.15] = np.nan
+
+    def roundtrip(self, model, name="model"):
+        entry = export_model(model, f"{self.directory}/{name}")
+        return load_model(self.directory, entry)
+
+    def assert_same_predictions(self, model, X):
+        native = self.roundtrip(model)
+        np.testing.assert_allclose(native.predict_proba(X), model.predict_proba(X), rtol=0, atol=1e-6)
+        np.testing.assert_array_equal(native.predict(X), model.predict(X))
+
+    def test_xgboost_binary(self):
+        model = xgb.XGBClassifier(n_estimators=40, max_depth=4).fit(self.X_missing, self.y_binary)
+        self.assert_same_predictions(model, self.X_missing)
+        self.assert_same_predictions(model, self.X)
+
+    def test_xgboost_multiclass(self):
+        labels = self.y_multiclass - 1
+        model = xgb.XGBClassifier(n_estimators=30, max_depth=3).fit(self.X_missing, labels)
+        self.assert_same_predictions(model, self.X_missing)
+
+    def test_xgboost_best_iteration(self):
+        # Twelve columns, so the serving pipeline can score it as a churn model
+        X = np.hstack([self.X, self.X_missing])
+        model = xgb.XGBClassifier(n_estimators=200, learning_rate=0.5, early_stopping_rounds=5)
+        model.fit(X[:300], self.y_binary[:300], eval_set=[(X[300:], self.y_binary[300:])], verbose=False)
+        self.assertLess(model.best_iteration, 199)
+        self.assert_same_predictions(model, X)
+
+        # No scalers or plan recommenders: score() sees the raw features
+        bundle = mock.Mock(version="test")
+        bundle.serving.side_effect = lambda name: model if name == "churn_model" else None
+        probabilities, _ = InferencePipeline(bundle).score(X)
+        np.testing.assert_allclose(probabilities, model.predict_proba(X)[:, 1], rtol=0, atol=1e-6)
+
+    def test_random_forest(self):
+        model = RandomForestClassifier(n_estimators=20, max_depth=6, random_state=0)
+        model.fit(self.X_missing, self.y_multiclass)
+        self.assert_same_predictions(model, self.X_missing)
+
+    def test_standard_scaler(self):
+        for options in ({}, {"with_mean": False}, {"with_std": False}):
+            with self.subTest(**options):
+                scaler = StandardScaler(**options).fit(self.X)
+                native = self.roundtrip(scaler)
+                np.testing.assert_allclose(native.transform(self.X_missing), scaler.transform(self.X_missing),
+                                           rtol=0, atol=1e-6)
+
+    def test_other_scalers_are_not_exported(self):
+        with self.assertRaises(ValueError):
+            export_model(MinMaxScaler().fit(self.X), f"{self.directory}/scaler")
+
+
+class FeatureStoreTests(SimpleTestCase):
+    """
+    Row offsets, snapshots, schema and bootstrap guarantees of FeatureStore.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.root = os.path.join(self.directory, "store")
+        self.rows = np.random.default_rng(0).random((300, len(COLUMNS)))
+
+    def store_with_segments(self, n_segments=10, **options):
+        store = FeatureStore(self.root, **options)
+        for block in np.array_split(self.rows, n_segments):
+            store.append(block)
+        return store
+
+    def test_compaction_keeps_row_offsets(self):
+        store = self.store_with_segments()
+        before = store.read(start_row=45, end_row=215)
+        self.assertGreater(store.compact(target_rows=100), 0)
+        self.assertLess(len(store.segments()), 10)
+        np.testing.assert_array_equal(store.read(), self.rows)
+        np.testing.assert_array_equal(store.read(start_row=45, end_row=215), before)
+
+    def test_compaction_keeps_high_water_marks(self):
+        store = self.store_with_segments()
+        source = StoreSource(store)
+        mark = source.high_water()
+        new_rows = np.random.default_rng(1).random((20, len(COLUMNS)))
+        store.append(new_rows)
+        store.compact(target_rows=1000)
+        self.assertEqual(len(store.segments()), 1)
+        # The rows past a version's trained_store_rows are exactly the new ones
+        np.testing.assert_array_equal(source.read(mark, source.high_water()).to_numpy(), new_rows)
+        np.testing.assert_array_equal(source.read(0, mark).to_numpy(), self.rows)
+
+    def test_iter_segments_reads_its_snapshot_after_purge(self):
+        store = self.store_with_segments()
+        snapshot = store.iter_segments(["Age", "Churn"], start_row=5, end_row=295)
+        first_row, block = next(snapshot)
+        with mock.patch.object(feature_store_module, "RETIRED_GRACE_SECONDS", -1):
+            store.compact(target_rows=1000)
+        # The retired segments are gone from disk
+        self.assertEqual(len(os.listdir(store.segments_dir)), 1)
+        blocks = [block] + [block for _, block in snapshot]
+        self.assertEqual(first_row, 5)
+        np.testing.assert_array_equal(np.concatenate(blocks), self.rows[5:295][:, [0, len(COLUMNS) - 1]])
+
+    def test_schema_mismatch_is_rejected(self):
+        self.store_with_segments(n_segments=1)
+        with open(os.path.join(self.root, "schema.json")) as f:
+            schema = json.load(f)
+        schema["columns"] = schema["columns"][::-1]
+        with open(os.path.join(self.root, "schema.json"), "w") as f:
+            json.dump(schema, f)
+        with self.assertRaises(ValueError):
+            FeatureStore(self.root).segments()
+
+    def test_csv_bootstrap_imports_once(self):
+        csv_path = os.path.join(self.directory, "training_data.csv")
+        pd.DataFrame(self.rows, columns=COLUMNS).to_csv(csv_path, index=False)
+        store = FeatureStore(self.root, legacy_csv=csv_path)
+        np.testing.assert_allclose(store.read(), self.rows)
+        store.append(self.rows[:3])
+        # Another worker (a new instance on the same root) must not import it again
+        self.assertEqual(FeatureStore(self.root, legacy_csv=csv_path).rows, len(self.rows) + 3)
+
+
+class TrainingDatasetTests(SimpleTestCase):
+    """
+    The similarity cache grows by parts and never rewrites its base on refresh.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.store = FeatureStore(os.path.join(self.directory, "store"))
+        self.stem = os.path.join(self.directory, "training_data")
+        self.rows = np.random.default_rng(0).random((400, len(COLUMNS)))
+
+    def assert_cached(self, dataset, rows):
+        X, y, vectors = dataset.load()
+        np.testing.assert_array_equal(X, rows[:, :-1])
+        # Logged probabilities are cached as the 0/1 labels training uses
+        np.testing.assert_array_equal(y, churn_labels(rows[:, -1]))
+        np.testing.assert_allclose(np.linalg.norm(vectors, axis=1), 1.0, rtol=1e-5)
+
+    def test_refresh_appends_parts(self):
+        self.store.append(self.rows[:300])
+        self.assert_cached(TrainingDataset(self.store, self.stem), self.rows[:300])
+        base = os.stat(self.stem + ".npy")
+
+        self.store.append(self.rows[300:])
+        dataset = TrainingDataset(self.store, self.stem)
+        self.assertEqual([len(X) for X, _, _ in dataset.load_parts()], [300, 100])
+        self.assert_cached(dataset, self.rows)
+        after = os.stat(self.stem + ".npy")
+        self.assertEqual((after.st_ino, after.st_mtime_ns), (base.st_ino, base.st_mtime_ns))
+        self.assertFalse(dataset.refresh())
+
+    def test_compact_folds_parts_into_base(self):
+        self.store.append(self.rows[:350])
+        TrainingDataset(self.store, self.stem).load()
+        self.store.append(self.rows[350:])
+        dataset = TrainingDataset(self.store, self.stem)
+        dataset.load()
+        # One part of 50 rows is below both thresholds
+        self.assertFalse(dataset.compact())
+        self.assertTrue(dataset.compact(force=True))
+        compacted = TrainingDataset(self.store, self.stem)
+        self.assertEqual(len(compacted.load_parts()), 1)
+        self.assert_cached(compacted, self.rows)
+        self.assertFalse(any(".part-" in name for name in os.listdir(self.directory)))
+
+    def test_raw_label_cache_is_rebuilt(self):
+        self.store.append(self.rows)
+        dataset = TrainingDataset(self.store, self.stem)
+        dataset.refresh()
+        # A cache written before labels were binarized: raw probabilities, no "labels" flag
+        np.save(self.stem + ".npy", self.rows)
+        with open(self.stem + ".manifest.json") as f:
+            manifest = json.load(f)
+        del manifest["labels"]
+        with open(self.stem + ".manifest.json", "w") as f:
+            json.dump(manifest, f)
+
+        self.assertTrue(dataset.refresh())
+        self.assert_cached(TrainingDataset(self.store, self.stem), self.rows)
+
+    def test_recommendations_count_low_probabilities_as_retained(self):
+        self.store.append(self.rows)
+        X, y, vectors = TrainingDataset(self.store, self.stem).load()
+        index = SimilarityIndex(X, y, vectors=vectors)
+        with mock.patch.object(utils, "_similarity_index", index):
+            utils.add_customers(self.rows[:2, :-1], [0.2, 0.9])
+        counts, _ = neighbour_statistics(index, np.array([[len(self.rows), len(self.rows) + 1]]))
+        self.assertEqual(counts.tolist(), [1])
+
+
+class ComprehensiveAnalysisTests(SimpleTestCase):
+    """
+    Batch analysis returns exactly what per-customer analysis does.
+    """
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        n = 300
+        insurance = np.eye(3)[rng.integers(0, 3, n)]
+        self.features = np.column_stack([
+            rng.integers(18, 70, n), rng.integers(0, 2, n), rng.normal(60000, 20000, n),
+            rng.normal(5000, 2000, n), rng.normal(1500, 500, n), rng.integers(0, 2, n), rng.integers(0, 2, n),
+            rng.integers(0, 700, n), insurance, rng.integers(1, 4, n),
+        ]).astype(float)
+        churned = (self.features[:, 0] < 35) ^ (rng.random(n) < 0.2)
+        columns = pd.DataFrame(self.features[:, SCALE_INDEX], columns=SCALE_COLUMNS)
+        plan_features = np.delete(self.features, PLAN_TYPE_INDEX, axis=1)
+        artifacts = {
+            "churn_model": xgb.XGBClassifier(n_estimators=20, max_depth=3).fit(self.features, churned),
+            "plan_recommender": RandomForestClassifier(n_estimators=10, random_state=0).fit(
+                plan_features, self.features[:, PLAN_TYPE_INDEX]),
+            "plan_recommender_churn": RandomForestClassifier(n_estimators=10, random_state=1).fit(
+                plan_features, self.features[:, PLAN_TYPE_INDEX]),
+            "churn_scaler": StandardScaler().fit(columns),
+            "plan_scaler": StandardScaler().fit(columns),
+            "plan_scaler_churn": StandardScaler().fit(columns),
+        }
+        bundle = mock.Mock(version="test")
+        bundle.serving.side_effect = artifacts.get
+        bundle.derived.side_effect = lambda key, factory: factory(bundle)
+        self.bundle = bundle
+
+        registry = mock.Mock(current=mock.Mock(return_value=bundle))
+        patches = [(utils, "models", registry), (views, "models", registry),
+                   (utils, "_similarity_index", SimilarityIndex(self.features[:200], churned[:200].astype(float))),
+                   (utils, "micro_batcher", None), (utils, "prediction_cache", PredictionCache(max_size=1000)),
+                   (utils.drift_monitor, "observe", mock.Mock())]
+        for target, name, value in patches:
+            patcher = mock.patch.object(target, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_batch_matches_single_rows(self):
+        rows = self.features[200:]
+        single = [utils.get_comprehensive_analysis(row.tolist()) for row in rows]
+        batch = utils.get_comprehensive_analysis_batch(rows, use_cache=False, bundle=self.bundle)
+        self.assertEqual(len(batch), len(single))
+        for expected, result in zip(single, batch):
+            self.assertAlmostEqual(result["churn_analysis"].pop("churn_probability"),
+                                   expected["churn_analysis"].pop("churn_probability"), places=6)
+            self.assertEqual(result, expected)
+        # Both sides really routed rows to either recommender and churn class
+        self.assertEqual({result["churn_analysis"]["is_churn_risk"] for result in batch}, {True, False})
+
+    def test_predict_batch_rejects_malformed_features(self):
+        width = len(FEATURE_NAMES)
+        for features in ("abc", [1.0] * width, [[1.0] * 3], [[1.0] * width, [1.0] * (width - 1)], [["a"] * width]):
+            with self.subTest(features=features):
+                response = self.client.post(reverse("predict_batch"), {"features": features},
+                                            content_type="application/json")
+                self.assertEqual(response.status_code, 400)
+                self.assertIn("error", response.json())
+
+
+class PredictionCacheTests(SimpleTestCase):
+    """
+    Entries miss after a model change, expiry or eviction, and are copied in and out.
+    """
+
+    def setUp(self):
+        self.rows = [[35.0, 1.0, 50000.0 + i] for i in range(4)]
+        self.result = {"churn_analysis": {"churn_probability": 0.25}, "customer_recommendations": {"General": ["a"]}}
+
+    def test_model_version_change_misses(self):
+        cache = PredictionCache(max_size=10)
+        cache.set(self.rows[0], "v1", self.result)
+        self.assertEqual(cache.get(self.rows[0], "v1"), self.result)
+        self.assertIsNone(cache.get(self.rows[0], "v2"))
+        # The in-process entries of the old version are dropped, not just hidden
+        self.assertIsNone(cache.get(self.rows[0], "v1"))
+
+    def test_ttl_expiry_misses(self):
+        cache = PredictionCache(max_size=10, ttl=60)
+        with mock.patch.object(cache_module.time, "monotonic", return_value=1000.0):
+            cache.set(self.rows[0], "v1", self.result)
+        with mock.patch.object(cache_module.time, "monotonic", return_value=1059.0):
+            self.assertEqual(cache.get(self.rows[0], "v1"), self.result)
+        with mock.patch.object(cache_module.time, "monotonic", return_value=1061.0):
+            self.assertIsNone(cache.get(self.rows[0], "v1"))
+        self.assertEqual(cache.stats()["size"], 0)
+
+    def test_least_recently_used_is_evicted(self):
+        cache = PredictionCache(max_size=3)
+        for row in self.rows[:3]:
+            cache.set(row, "v1", self.result)
+        cache.get(self.rows[0], "v1")
+        cache.set(self.rows[3], "v1", self.result)
+        self.assertIsNone(cache.get(self.rows[1], "v1"))
+        for row in (self.rows[0], self.rows[2], self.rows[3]):
+            self.assertEqual(cache.get(row, "v1"), self.result)
+        self.assertEqual(cache.stats()["size"], 3)
+
+    def test_results_are_copied(self):
+        for backend in (None, "default"):
+            with self.subTest(backend=backend):
+                cache = PredictionCache(max_size=10, backend=backend, namespace="test")
+                if backend:
+                    self.addCleanup(caches[backend].clear)
+                result = copy.deepcopy(self.result)
+                cache.set(self.rows[0], "v1", result)
+                result["churn_analysis"]["churn_probability"] = 0.9
+
+                served = cache.get(self.rows[0], "v1")
+                served["customer_recommendations"]["General"].append("b")
+                self.assertEqual(cache.get(self.rows[0], "v1"), self.result)
+
+
+class SimilarityIndexTests(SimpleTestCase):
+    """
+    Every backend returns the brute-force cosine_similarity ranking.
+    """
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.rows = rng.random((260, 12))
+        self.targets = rng.random((20, 12))
+
+    def assert_matches_brute_force(self, index, n_rows, n=10):
+        expected = np.argsort(-cosine_similarity(self.targets, self.rows[:n_rows]), axis=1, kind="stable")[:, :n]
+        np.testing.assert_array_equal(index.query(self.targets, n=n), expected)
+
+    def test_query_matches_brute_force(self):
+        for backend in ("exact", "balltree"):
+            with self.subTest(backend=backend):
+                index = SimilarityIndex(self.rows[:200], np.zeros(200), backend=backend, rebuild_ratio=0.1)
+                self.assert_matches_brute_force(index, 200)
+
+                # 40 new rows are past rebuild_ratio: queries scan them exactly
+                # while the tree is rebuilt in the background, then use the new tree
+                index.add(self.rows[200:240], np.zeros(40))
+                self.assert_matches_brute_force(index, 240)
+                thread = index._rebuild_thread
+                if thread is not None:
+                    thread.join()
+                if backend == "balltree":
+                    self.assertEqual(index._tree_size, 240)
+                self.assert_matches_brute_force(index, 240)
+
+                # Below rebuild_ratio: the tail is scanned next to the tree
+                index.add(self.rows[240:], np.zeros(20))
+                self.assertIsNone(index._rebuild_thread)
+                self.assert_matches_brute_force(index, 260)
+
+
+@mock.patch.object(jobs, "_executor")
+class RetrainJobTests(TestCase):
+    """
+    Retrain submissions coalesce in the database; abandoned jobs are failed.
+    """
+
+    def setUp(self):
+        # Orphan recovery runs once per process; every test starts before it
+        patcher = mock.patch.object(jobs, "_recovered", False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_second_submit_returns_active_job(self, executor):
+        job, created = jobs.submit_retrain(mode="full")
+        self.assertTrue(created)
+        self.assertEqual(job.owner, f"{jobs.HOSTNAME}:{os.getpid()}")
+        again, created = jobs.submit_retrain(mode="incremental")
+        self.assertFalse(created)
+        self.assertEqual(again.pk, job.pk)
+        self.assertEqual(RetrainJob.objects.count(), 1)
+
+    def test_database_allows_one_active_job(self, executor):
+        RetrainJob.objects.create(status="running")
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            RetrainJob.objects.create(status="queued")
+        RetrainJob.objects.create(status="failed")
+
+    def test_lost_race_returns_winning_job(self, executor):
+        lookups = []
+
+        def racing_lookup():
+            # Another worker inserts between this process's lookup and insert
+            lookups.append(None)
+            if len(lookups) == 1:
+                RetrainJob.objects.create(owner="otherhost:1")
+                return None
+            return RetrainJob.objects.get(status="queued")
+
+        with mock.patch.object(jobs, "_active_job", racing_lookup):
+            job, created = jobs.submit_retrain()
+        self.assertFalse(created)
+        self.assertEqual(job.owner, "otherhost:1")
+
+    def test_job_of_dead_process_is_failed(self, executor):
+        exited = subprocess.Popen([sys.executable, "-c", "pass"])
+        exited.wait()
+        orphan = RetrainJob.objects.create(status="running", owner=f"{jobs.HOSTNAME}:{exited.pid}")
+        job, created = jobs.submit_retrain()
+        orphan.refresh_from_db()
+        self.assertEqual(orphan.status, "failed")
+        self.assertIn("exited", orphan.error)
+        self.assertTrue(created)
+
+    def test_job_of_other_host_is_kept(self, executor):
+        other = RetrainJob.objects.create(status="running", owner="otherhost:1")
+        job, created = jobs.submit_retrain()
+        self.assertFalse(created)
+        self.assertEqual(job.pk, other.pk)
+
+    def test_job_without_heartbeat_expires(self, executor):
+        stale = RetrainJob.objects.create(status="running", owner="otherhost:1")
+        RetrainJob.objects.filter(pk=stale.pk).update(updated_at=timezone.now() - timedelta(hours=2))
+        with self.settings(CHURN_RETRAIN_JOB_TIMEOUT=3600):
+            job, created = jobs.submit_retrain()
+        stale.refresh_from_db()
+        self.assertEqual(stale.status, "failed")
+        self.assertTrue(created)
+
+    def test_unknown_job_is_404(self, executor):
+        response = self.client.get(reverse("retrain_job_status", args=[987654]))
+        self.assertEqual(response.status_code, 404)
+
+
+class RecordPaginationTests(TestCase):
+    """
+    Keyset pages visit every record once, ties on the sort key included.
+    """
+
+    def fetch(self, **params):
+        response = self.client.get(reverse("customer_records"), params)
+        return response, response.json()
+
+    def test_pages_through_equal_sort_keys(self):
+        CustomerRecord.objects.bulk_create([customer_record(churn_probability=0.7) for _ in range(25)])
+        expected = list(CustomerRecord.objects.order_by("-id").values_list("id", flat=True))
+
+        seen, params = [], {"ordering": "-churn_probability", "page_size": 1}
+        while True:
+            response, body = self.fetch(**params)
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(body["results"]), 1)
+            seen += [record["id"] for record in body["results"]]
+            if body["cursor"] is None:
+                break
+            params["cursor"] = body["cursor"]
+        self.assertEqual(seen, expected)
+
+    def test_malformed_cursor_is_rejected(self):
+        CustomerRecord.objects.bulk_create([customer_record() for _ in range(3)])
+
+        def encode(payload):
+            return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip("=")
+
+        cursors = ["%%%", "bm90IGpzb24", encode({"a": 1}), encode(["-churn_probability", 0.5]),
+                   encode(["-churn_probability", 0.5, None]), encode(["-churn_probability", "high", 1]),
+                   encode(["-created_at", 0.5, 1])]
+        for cursor in cursors:
+            with self.subTest(cursor=cursor):
+                response, body = self.fetch(ordering="-churn_probability", cursor=cursor)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn("cursor", body["error"])
+
+
+@mock.patch.object(PredictionLogWriter, "_ensure_thread")
+class PredictionLogWriterTests(TestCase):
+    """
+    Failed flushes requeue in order, overflow drops the oldest, and a write
+    that succeeded is never repeated.
+    """
+
+    LOGGER = "churn.prediction_log"
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.store = FeatureStore(os.path.join(self.directory, "store"))
+
+    def rows(self, first, n):
+        return [[float(first + i)] * len(COLUMNS) for i in range(n)]
+
+    def test_failed_store_append_is_requeued_in_order(self, ensure_thread):
+        writer = PredictionLogWriter(self.store)
+        writer.log(self.rows(0, 3))
+        with mock.patch.object(self.store, "append", side_effect=OSError("disk full")), self.assertLogs(self.LOGGER, "ERROR"):
+            self.assertEqual(writer.flush(), 0)
+        writer.log(self.rows(3, 2))
+        self.assertEqual(writer.flush(), 5)
+        np.testing.assert_array_equal(self.store.read()[:, 0], np.arange(5))
+        self.assertEqual(writer.flush(), 0)
+
+    def test_requeue_beyond_max_pending_drops_oldest(self, ensure_thread):
+        writer = PredictionLogWriter(self.store, max_pending=3)
+        writer.log(self.rows(0, 5), [customer_record(age=age) for age in range(5)])
+        with mock.patch.object(self.store, "append", side_effect=OSError("disk full")), \
+                mock.patch.object(CustomerRecord.objects, "bulk_create", side_effect=OperationalError("locked")), \
+                self.assertLogs(self.LOGGER, "ERROR") as logs:
+            writer.flush()
+        self.assertTrue(any("buffer full" in line for line in logs.output))
+        self.assertEqual((writer.dropped_rows, writer.dropped_records), (2, 2))
+        writer.flush()
+        np.testing.assert_array_equal(self.store.read()[:, 0], [2, 3, 4])
+        self.assertEqual(list(CustomerRecord.objects.order_by("id").values_list("age", flat=True)), [2, 3, 4])
+
+    def test_successful_append_is_not_repeated(self, ensure_thread):
+        writer = PredictionLogWriter(self.store)
+        writer.log(self.rows(0, 2), [customer_record(age=20), customer_record(age=21)])
+        with mock.patch.object(CustomerRecord.objects, "bulk_create", side_effect=OperationalError("locked")), \
+                self.assertLogs(self.LOGGER, "ERROR"):
+            self.assertEqual(writer.flush(), 2)
+        self.assertEqual(CustomerRecord.objects.count(), 0)
+        self.assertEqual(writer.flush(), 0)
+        self.assertEqual(self.store.rows, 2)
+        self.assertEqual(list(CustomerRecord.objects.order_by("id").values_list("age", flat=True)), [20, 21])
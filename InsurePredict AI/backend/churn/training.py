@@ -0,0 +1,168 @@
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+from joblib import Parallel, delayed
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.preprocessing import StandardScaler
+
+from .feature_store import churn_labels
+from .inference import FEATURE_NAMES, PLAN_TYPE_INDEX, SCALE_COLUMNS, SCALE_INDEX
+from .tuning import tune_hyperparameters
+
+# Plan recommenders predict "Plan Type" from the other features. Depth is
+# bounded so the forests stay small enough to serve as the data grows.
+PLAN_MODEL_PARAMS = {"n_estimators": 100, "max_depth": 12, "random_state": 42}
+PLAN_FEATURES = [name for name in FEATURE_NAMES if name != "Plan Type"]
+
+
+def fit_scaler(features):
+    """
+    StandardScaler over the SCALE_COLUMNS of a (n_rows, n_features) matrix,
+    the layout InferencePipeline expects.
+    """
+    return StandardScaler().fit(pd.DataFrame(features[:, SCALE_INDEX], columns=SCALE_COLUMNS))
+
+
+def apply_scaler(features, scaler):
+    """
+    A copy of features with scaler applied to the SCALE_COLUMNS (unchanged if scaler is None).
+    """
+    scaled = np.array(features, dtype=np.float64)
+    if scaler is not None:
+        scaled[:, SCALE_INDEX] = scaler.transform(pd.DataFrame(scaled[:, SCALE_INDEX], columns=SCALE_COLUMNS))
+    return scaled
+
+
+class SharedArrays:
+    """
+    Arrays written once to a temporary directory as .npy files, for worker
+    processes to memory-map: every process reads the same page-cache pages
+    instead of receiving its own pickled copy.
+    """
+
+    def __init__(self, directory=None):
+        self.root = tempfile.mkdtemp(prefix="churn-bundle-", dir=directory)
+        self.paths = {}
+
+    def put(self, name, array):
+        path = os.path.join(self.root, f"{name}.npy")
+        np.save(path, np.ascontiguousarray(array))
+        self.paths[name] = path
+        return path
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+
+def _load(path):
+    return np.load(path, mmap_mode="r")
+
+
+def _train_churn_model(paths, params, n_rounds, n_threads):
+    started = time.perf_counter()
+    X_train = pd.DataFrame(_load(paths["churn_X_train"]), columns=FEATURE_NAMES)
+    X_val = pd.DataFrame(_load(paths["churn_X_val"]), columns=FEATURE_NAMES)
+    y_train, y_val = _load(paths["y_train"]), _load(paths["y_val"])
+
+    model = xgb.XGBClassifier(n_estimators=n_rounds, eval_metric="logloss", n_jobs=n_threads, **params)
+    model.fit(X_train, y_train, eval_set=[(X_val, y_val)], verbose=False)
+    model.set_params(n_jobs=None)
+    return "churn_model", model, {"training_rows": len(y_train), "seconds": round(time.perf_counter() - started, 3)}
+
+
+def _train_plan_recommender(name, paths, params, n_threads):
+    started = time.perf_counter()
+    X_train, X_val = _load(paths[f"{name}_X_train"]), _load(paths[f"{name}_X_val"])
+    plan_columns = [i for i in range(len(FEATURE_NAMES)) if i != PLAN_TYPE_INDEX]
+
+    model = RandomForestClassifier(n_jobs=n_threads, **params)
+    model.fit(pd.DataFrame(X_train[:, plan_columns], columns=PLAN_FEATURES), X_train[:, PLAN_TYPE_INDEX].astype(int))
+    metrics = {"training_rows": len(X_train), "validation_rows": len(X_val),
+               "seconds": round(time.perf_counter() - started, 3)}
+    if len(X_val):
+        predicted = model.predict(pd.DataFrame(X_val[:, plan_columns], columns=PLAN_FEATURES))
+        metrics["accuracy"] = float(np.mean(predicted == X_val[:, PLAN_TYPE_INDEX].astype(int)))
+    model.set_params(n_jobs=None)
+    return name, model, metrics
+
+
+def train_bundle(X_train, y_train, X_val, y_val, churn_params, churn_rounds, plan_params=PLAN_MODEL_PARAMS,
+                 tuning=None, n_jobs=None, progress=None):
+    """
+    Train every artifact of a model version from one split of the data.
+
+    The rows are converted and scaled once, in this process: the churn
+    scaler is fitted on all training rows, the plan scalers on the
+    non-churned (plan_scaler) and churned (plan_scaler_churn) training rows.
+    The scaled views are written to shared .npy files and the churn model and
+    both plan recommenders are then fitted in parallel worker processes that
+    memory-map them. With tuning (keyword arguments for
+    tune_hyperparameters), the churn model comes from a hyperparameter search
+    over all cores first, and only the plan recommenders run in parallel.
+
+    Returns:
+    - (artifacts, metrics): artifact name -> fitted object for all six
+      artifacts (a plan recommender and its scaler are omitted when its
+      subset is empty), and per-model training stats (plan recommender
+      validation accuracy) plus a "training" summary and, when tuning, the
+      "tuning" report. The churn model is evaluated by the caller.
+    """
+    progress = progress or (lambda fraction, message: None)
+    started = time.perf_counter()
+    X_train, X_val = np.asarray(X_train, dtype=np.float64), np.asarray(X_val, dtype=np.float64)
+    y_train, y_val = churn_labels(y_train), churn_labels(y_val)
+
+    artifacts = {"churn_scaler": fit_scaler(X_train)}
+    subsets = {"plan_recommender": 0, "plan_recommender_churn": 1}
+    scaler_names = {"plan_recommender": "plan_scaler", "plan_recommender_churn": "plan_scaler_churn"}
+
+    cores = os.cpu_count() or 1
+    metrics = {}
+    with SharedArrays() as shared:
+        progress(0.15, "Scaling training data")
+        shared.put("churn_X_train", apply_scaler(X_train, artifacts["churn_scaler"]))
+        shared.put("churn_X_val", apply_scaler(X_val, artifacts["churn_scaler"]))
+        shared.put("y_train", y_train)
+        shared.put("y_val", y_val)
+        plan_tasks = []
+        for name, label in subsets.items():
+            train_rows, val_rows = X_train[y_train == label], X_val[y_val == label]
+            if not len(train_rows):
+                continue
+            scaler = artifacts[scaler_names[name]] = fit_scaler(train_rows)
+            shared.put(f"{name}_X_train", apply_scaler(train_rows, scaler))
+            shared.put(f"{name}_X_val", apply_scaler(val_rows, scaler))
+            plan_tasks.append(name)
+
+        if tuning is not None:
+            progress(0.2, "Tuning churn model hyperparameters")
+            churn_X_train, churn_X_val = _load(shared.paths["churn_X_train"]), _load(shared.paths["churn_X_val"])
+            model, report = tune_hyperparameters(churn_X_train, y_train, churn_X_val, y_val, churn_params,
+                                                 progress=progress, **tuning)
+            artifacts["churn_model"] = model
+            metrics["tuning"] = report
+            tasks = [delayed(_train_plan_recommender)(name, shared.paths, plan_params, max(1, cores // max(1, len(plan_tasks))))
+                     for name in plan_tasks]
+        else:
+            n_threads = max(1, cores // (1 + len(plan_tasks)))
+            tasks = [delayed(_train_churn_model)(shared.paths, churn_params, churn_rounds, n_threads)]
+            tasks += [delayed(_train_plan_recommender)(name, shared.paths, plan_params, n_threads)
+                      for name in plan_tasks]
+
+        progress(0.6 if tuning is not None else 0.2, f"Training {len(tasks)} models in parallel")
+        workers = max(1, min(n_jobs or cores, len(tasks)))
+        for name, model, model_metrics in Parallel(n_jobs=workers, backend="loky")(tasks):
+            artifacts[name] = model
+            metrics[name] = model_metrics
+
+    metrics["training"] = {"seconds": round(time.perf_counter() - started, 3), "workers": workers,
+                           "models": sorted(name for name in artifacts if "scaler" not in name)}
+    return artifacts, metrics
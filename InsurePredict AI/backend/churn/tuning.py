@@ -0,0 +1,188 @@
+import itertools
+import math
+import os
+import time
+
+import numpy as np
+import xgboost as xgb
+from joblib import Parallel, delayed
+from sklearn.metrics import log_loss, roc_auc_score
+
+SEARCH_STRATEGIES = ("grid", "random", "halving")
+
+# Values tried by the grid search (the full product is 54 candidates)
+PARAM_GRID = {
+    "max_depth": [3, 5, 7],
+    "learning_rate": [0.05, 0.1, 0.2],
+    "min_child_weight": [1, 5],
+    "subsample": [0.8, 1.0],
+    "colsample_bytree": [0.8, 1.0],
+}
+
+
+def _sample_params(rng):
+    # Ranges for random search and successive halving
+    return {
+        "max_depth": int(rng.integers(3, 11)),
+        "learning_rate": float(np.exp(rng.uniform(np.log(0.01), np.log(0.3)))),
+        "min_child_weight": float(rng.uniform(1, 10)),
+        "subsample": float(rng.uniform(0.6, 1.0)),
+        "colsample_bytree": float(rng.uniform(0.6, 1.0)),
+        "reg_lambda": float(np.exp(rng.uniform(np.log(0.1), np.log(10)))),
+    }
+
+
+def candidate_params(strategy, n_candidates, baseline, seed=42):
+    """
+    Up to n_candidates parameter sets for strategy. The first is always
+    baseline (the hand-picked defaults), so tuning never does worse on the
+    validation set than not tuning.
+    """
+    if strategy not in SEARCH_STRATEGIES:
+        raise ValueError(f"Unknown search strategy '{strategy}', expected one of {SEARCH_STRATEGIES}")
+    rng = np.random.default_rng(seed)
+    candidates = [dict(baseline)]
+    if strategy == "grid":
+        grid = [dict(zip(PARAM_GRID, values)) for values in itertools.product(*PARAM_GRID.values())]
+        if len(grid) > n_candidates - 1:
+            # Bounded: an evenly drawn subset of the grid
+            grid = [grid[i] for i in sorted(rng.choice(len(grid), n_candidates - 1, replace=False))]
+        candidates += [{**baseline, **params} for params in grid]
+    else:
+        candidates += [{**baseline, **_sample_params(rng)} for _ in range(n_candidates - 1)]
+    return candidates[:max(n_candidates, 1)]
+
+
+def _fit_candidate(params, X_train, y_train, X_val, y_val, n_rounds, early_stopping_rounds, n_threads):
+    """
+    Fit one candidate with early stopping on the validation set. Runs in a
+    worker process; the arrays arrive memory-mapped, not copied.
+    """
+    started = time.perf_counter()
+    model = xgb.XGBClassifier(n_estimators=n_rounds, early_stopping_rounds=early_stopping_rounds,
+                              eval_metric="logloss", n_jobs=n_threads, **params)
+    model.fit(X_train, y_train, eval_set=[(X_val, y_val)], verbose=False)
+    probabilities = model.predict_proba(X_val)[:, 1]
+    result = {
+        "params": params,
+        "rounds": n_rounds,
+        "best_iteration": int(model.best_iteration),
+        "logloss": float(log_loss(y_val, probabilities, labels=[0, 1])),
+        "seconds": time.perf_counter() - started,
+    }
+    if len(np.unique(y_val)) > 1:
+        result["auc"] = float(roc_auc_score(y_val, probabilities))
+    return result, model
+
+
+def tune_hyperparameters(X_train, y_train, X_val, y_val, baseline, strategy="halving", n_candidates=27,
+                         n_jobs=None, max_rounds=500, early_stopping_rounds=20, eta=3, seed=42, progress=None):
+    """
+    Bounded hyperparameter search for the churn model across local cores.
+
+    Candidates are fitted in parallel worker processes (joblib/loky), each
+    with early stopping on the validation set, and ranked by validation
+    logloss. Both use the same validation set, so the winner's validation
+    score is optimistic: judge it on rows the search never saw. "halving" (successive halving) first fits every candidate with a
+    max_rounds / eta^k round budget and only lets the best 1/eta of each rung
+    continue with eta times the budget, so most of the time goes to
+    promising candidates.
+
+    Parameters:
+    - X_train, y_train, X_val, y_val: training and validation split
+    - baseline: the default parameters, always evaluated as a candidate
+    - strategy: "grid", "random" or "halving"
+    - n_candidates: number of parameter sets to evaluate
+    - n_jobs: worker processes (default: all cores, at most one per candidate)
+    - max_rounds: boosting round limit per fit
+    - early_stopping_rounds: rounds without validation improvement before a fit stops
+    - progress: optional callable(fraction, message)
+
+    Returns:
+    - (best model, report dict with the leaderboard, wall-clock time and
+      speedup over an estimated single-process run; see the
+      speedup_baseline entry)
+    """
+    progress = progress or (lambda fraction, message: None)
+    candidates = candidate_params(strategy, n_candidates, baseline, seed)
+    cores = os.cpu_count() or 1
+    workers = max(1, min(n_jobs or cores, len(candidates)))
+    # Split the cores between concurrent fits instead of oversubscribing them
+    n_threads = max(1, cores // workers)
+    X_train, X_val = np.asarray(X_train, dtype=np.float32), np.asarray(X_val, dtype=np.float32)
+    y_train, y_val = np.asarray(y_train), np.asarray(y_val)
+
+    if strategy == "halving":
+        n_rungs = max(1, math.ceil(math.log(len(candidates), eta)))
+        budgets = [max(early_stopping_rounds, int(max_rounds / eta ** (n_rungs - 1 - rung))) for rung in range(n_rungs)]
+    else:
+        budgets = [max_rounds]
+
+    started = time.perf_counter()
+    fit_seconds = 0.0
+    n_fits = 0
+    remaining = candidates
+    with Parallel(n_jobs=workers, backend="loky") as parallel:
+        for rung, n_rounds in enumerate(budgets):
+            progress(0.2 + 0.6 * rung / len(budgets),
+                     f"Tuning: fitting {len(remaining)} candidates for up to {n_rounds} rounds")
+            fitted = parallel(
+                delayed(_fit_candidate)(params, X_train, y_train, X_val, y_val, n_rounds,
+                                        early_stopping_rounds, n_threads)
+                for params in remaining
+            )
+            if rung == 0:
+                # Timing of the baseline candidate under parallel load, for the speedup estimate
+                calibration = next(result for result, _ in fitted if result["params"] == candidates[0])
+            fitted.sort(key=lambda item: item[0]["logloss"])
+            fit_seconds += sum(result["seconds"] for result, _ in fitted)
+            n_fits += len(fitted)
+            if rung + 1 < len(budgets):
+                remaining = [result["params"] for result, _ in fitted[:max(1, len(fitted) // eta)]]
+
+    wall_seconds = time.perf_counter() - started
+    best_result, best_model = fitted[0]
+
+    # Each parallel fit had only n_threads threads and shared the machine; a
+    # sequential search would give every fit all cores. Refit the baseline
+    # candidate that way once and scale the summed fit time by the ratio.
+    thread_scaling = 1.0
+    if workers > 1:
+        single, _ = _fit_candidate(candidates[0], X_train, y_train, X_val, y_val, budgets[0],
+                                   early_stopping_rounds, cores)
+        thread_scaling = single["seconds"] / calibration["seconds"] if calibration["seconds"] else 1.0
+    estimated_sequential = fit_seconds * thread_scaling
+    report = {
+        "strategy": strategy,
+        "candidates": len(candidates),
+        "fits": n_fits,
+        "workers": workers,
+        "threads_per_fit": n_threads,
+        "wall_seconds": round(wall_seconds, 3),
+        # Summed per-fit time, each at threads_per_fit threads
+        "fit_seconds": round(fit_seconds, 3),
+        "estimated_sequential_seconds": round(estimated_sequential, 3),
+        "parallel_speedup": round(estimated_sequential / wall_seconds, 2) if wall_seconds else None,
+        "speedup_baseline": (f"one process fitting candidates one after another on all {cores} cores; "
+                             f"calibrated by refitting the baseline candidate ({thread_scaling:.2f}x its "
+                             f"parallel fit time)" if workers > 1 else "none: the search ran in one process"),
+        "best_params": best_result["params"],
+        "best_iteration": best_result["best_iteration"],
+        "leaderboard": [{key: value for key, value in result.items() if key != "seconds"}
+                        for result, _ in fitted[:5]],
+    }
+    return best_model, report
+
+
+def beats(candidate_metrics, current_metrics):
+    """
+    True if candidate_metrics has a lower logloss than current_metrics and
+    no lower AUC (when both have one).
+    """
+    if current_metrics is None:
+        return True
+    if candidate_metrics["logloss"] >= current_metrics["logloss"]:
+        return False
+    if "auc" in candidate_metrics and "auc" in current_metrics:
+        return candidate_metrics["auc"] >= current_metrics["auc"]
+    return True
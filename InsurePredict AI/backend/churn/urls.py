@@ -1,11 +1,23 @@
 from django.conf import settings
 from django.urls import path, re_path
-from .views import prediction_form, predict, retrain_model_api
+from .views import prediction_form, predict, predict_async, predict_batch, predict_upload, explain, what_if, customer_records, customer_record_aggregates, churn_rollups, drift_report, prediction_cache_stats, metrics_endpoint, retrain_model_api, retrain_job_status
 
 urlpatterns = [
     path("predict/", predict, name="predict"),  # Your existing API endpoint
+    path("predict/async/", predict_async, name="predict_async"),  # Async variant for ASGI (uvicorn) deployments
+    path("predict/batch/", predict_batch, name="predict_batch"),  # Score many customers in one call
+    path("predict/upload/", predict_upload, name="predict_upload"),  # Score a whole CSV/Parquet customer file
+    path("explain/", explain, name="explain"),  # Per-feature churn contributions (TreeSHAP), single or batch
+    path("what-if/", what_if, name="what_if"),  # Rank plan / coverage scenarios for one customer
+    path("records/", customer_records, name="customer_records"),  # Filtered, cursor-paginated saved predictions
+    path("records/aggregates/", customer_record_aggregates, name="customer_record_aggregates"),  # Risk histogram, churn rate per plan
+    path("rollups/", churn_rollups, name="churn_rollups"),  # Daily churn-risk rollups, refreshed incrementally
+    path("drift/", drift_report, name="drift_report"),  # PSI/KS of live features vs. the training data
     path("prediction-form/", prediction_form, name="prediction_form"),  
+    path("prediction-cache/", prediction_cache_stats, name="prediction_cache_stats"),  # Cache hit/miss counters
+    path("metrics/", metrics_endpoint, name="metrics"),  # Prometheus scrape target
     path("retrain-model/", retrain_model_api, name="retrain_model"),  # New endpoint for retraining
+    path("retrain-model/<int:job_id>/", retrain_job_status, name="retrain_job_status"),  # Poll a retraining job
 ]
 
 # if settings.DEBUG:
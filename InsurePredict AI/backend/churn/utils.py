@@ -1,71 +1,94 @@
-import joblib
-import os
+import threading
 import numpy as np
 import pandas as pd
-from sklearn.metrics.pairwise import cosine_similarity
-
-# Load the pre-trained models
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))  # Current script's directory
-PARENT_DIR = os.path.dirname(BASE_DIR)  # Moves one level up
-MODELS_DIR = os.path.join(PARENT_DIR, "models")
-
-# Load all models
-churn_model_path = os.path.join(MODELS_DIR, "churn_model.pkl")
-churn_model = joblib.load(churn_model_path)
-
-plan_recommender_path = os.path.join(MODELS_DIR, "plan_type_recommender.pkl")
-plan_recommender = joblib.load(plan_recommender_path)
-
-plan_recommender_churn_path = os.path.join(MODELS_DIR, "plan_type_recommender_churn.pkl")
-plan_recommender_churn = joblib.load(plan_recommender_churn_path)
-
-# Load scalers
-churn_scaler_path = os.path.join(MODELS_DIR, "churn_scaler.pkl")
-plan_scaler_path = os.path.join(MODELS_DIR, "plan_type_scaler.pkl")
-plan_scaler_churn_path = os.path.join(MODELS_DIR, "plan_type_scaler_churn.pkl")
-
-try:
-    churn_scaler = joblib.load(churn_scaler_path)
-    plan_scaler = joblib.load(plan_scaler_path)
-    plan_scaler_churn = joblib.load(plan_scaler_churn_path)
-except FileNotFoundError:
-    # Handle the case where scalers aren't needed or available
-    churn_scaler = None
-    plan_scaler = None
-    plan_scaler_churn = None
-
-# Define the feature names as per training data
-feature_names = ['Age', 'Gender', 'Earnings ($)', 'Claim Amount ($)',
-                'Insurance Plan Amount ($)', 'Credit Score', 'Marital Status', 'days_passed',
-                'Automobile Insurance', 'Health Insurance', 'Life Insurance', 'Plan Type']
-
-
-
-# Use the correct path to the training data file
-LOGS_DIR = os.path.join(PARENT_DIR, "logs")
-customer_profiles = pd.read_csv(os.path.join(LOGS_DIR, "training_data.csv"))
-X = customer_profiles.iloc[:,:12]
-y = customer_profiles.iloc[:,12]
+from django.conf import settings
+from .batching import MicroBatcher
+from .cache import PredictionCache
+from .drift import drift_monitor
+from .feature_store import churn_labels
+from .metrics import metrics, timer
+from .inference import FEATURE_NAMES, PLAN_TYPE_INDEX, get_pipeline
+from .recommendations import neighbour_statistics, evaluate_rules
+from .registry import models, training_data
+from .similarity import SimilarityIndex
+
+# Models, scalers and the training matrix are loaded lazily through the registry
+# on first use, so importing this module (and starting a worker) is cheap.
+LAZY_ARTIFACTS = ("churn_model", "plan_recommender", "plan_recommender_churn",
+                  "churn_scaler", "plan_scaler", "plan_scaler_churn")
+
+# Feature names as per training data
+feature_names = FEATURE_NAMES
+
+_similarity_index = None
+_similarity_lock = threading.Lock()
+
+# Results keyed on the normalized feature vector + model version
+_cache_settings = getattr(settings, "CHURN_PREDICTION_CACHE", {})
+prediction_cache = PredictionCache(
+    max_size=_cache_settings.get("MAX_SIZE", 10000),
+    ttl=_cache_settings.get("TTL"),
+    backend=_cache_settings.get("BACKEND"),
+)
+metrics.register("churn_prediction_cache_hits_total", "counter", "Prediction cache hits",
+                 lambda: prediction_cache.hits)
+metrics.register("churn_prediction_cache_misses_total", "counter", "Prediction cache misses",
+                 lambda: prediction_cache.misses)
+metrics.register("churn_prediction_cache_entries", "gauge", "Entries in the in-process prediction cache",
+                 lambda: prediction_cache.stats()["size"])
+
+def get_similarity_index():
+    """
+    Similarity index over the memory-mapped training data, built on first use.
+    New predictions are appended with add_customers().
+    """
+    global _similarity_index
+    if _similarity_index is None:
+        with _similarity_lock:
+            if _similarity_index is None:
+                (X, y, vectors), *recent = training_data.load_parts()
+                index = SimilarityIndex(
+                    X, y, vectors=vectors,
+                    backend=getattr(settings, "CHURN_SIMILARITY_BACKEND", "exact")
+                )
+                # Rows cached since the last compaction go to the private tail
+                for X_recent, y_recent, _ in recent:
+                    index.add(X_recent, y_recent)
+                _similarity_index = index
+    return _similarity_index
+
+def __getattr__(name):
+    # Keep utils.churn_model, utils.X, ... working without loading them at import time
+    if name in LAZY_ARTIFACTS:
+        return models.get(name)
+    if name in ("X", "y"):
+        X, y, _ = training_data.load()
+        return X if name == "X" else y
+    if name == "similarity_index":
+        return get_similarity_index()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 def get_similar_customers(target_customer, n=10):
     """
     Find similar customers based on cosine similarity
     """
     # Convert target_customer to a 2D numpy array with shape (1, n_features)
-    if isinstance(target_customer, pd.Series):
+    if isinstance(target_customer, (pd.Series, pd.DataFrame)):
         target_array = target_customer.values.reshape(1, -1)
     else:
-        target_array = target_customer.values.reshape(1, -1)
+        target_array = np.asarray(target_customer, dtype=float).reshape(1, -1)
 
-    # Convert X to a 2D numpy array
-    X_array = X.values
-    # Calculate similarity directly with numpy arrays
-    similarity_matrix = cosine_similarity(target_array, X_array)
+    # Get indices of most similar customers from the prebuilt index
+    return get_similarity_index().query(target_array, n)[0]
 
-    # Get indices of most similar customers
-    similar_indices = similarity_matrix[0].argsort()[::-1][:n]
+def add_customers(rows, labels):
+    """
+    Make newly logged customers searchable without rebuilding the index.
+    labels are the served churn probabilities; the index holds them as 0/1
+    churn labels, as training does.
+    """
+    return get_similarity_index().add(rows, churn_labels(labels))
 
-    return similar_indices
 # Function to generate personalized recommendations based on similar customers
 def generate_recommendations(target_customer):
     """
@@ -77,80 +100,30 @@ def generate_recommendations(target_customer):
     Returns:
     dict: Dictionary of recommendations
     """
+    if isinstance(target_customer, (pd.Series, pd.DataFrame)):
+        target_customer = target_customer.values
+    return generate_recommendations_batch(np.asarray(target_customer, dtype=float).reshape(1, -1))[0]
+
+def generate_recommendations_batch(targets, n=10):
+    """
+    Recommendations for many customers at once: one similarity query for the
+    batch, one vectorized reduction for the neighbour statistics and a
+    table-driven rule evaluation (see recommendations.RULES).
+
+    Parameters:
+    - targets: 2D array of customer features in feature_names order
+    - n: number of similar customers to consider
+
+    Returns:
+    - List of recommendation dictionaries, in the same order as targets
+    """
+    similarity_index = get_similarity_index()
+    with timer("similarity.query"):
+        neighbours = similarity_index.query(targets, n)
+    with timer("recommendations.rules"):
+        counts, means = neighbour_statistics(similarity_index, neighbours)
+        return evaluate_rules(targets, counts, means)
 
-    # Get similar customers
-    similar_indices = get_similar_customers(target_customer)
-
-    # Ensure target_customer is a Series (not a DataFrame)
-    if hasattr(target_customer, 'iloc') and not isinstance(target_customer, pd.Series):
-        target_customer = target_customer.iloc[0]
-    # Filter to non-churned similar customers
-    non_churned_similar = [idx for idx in similar_indices if y.iloc[idx] == 0]
-
-    if not non_churned_similar:
-        return {"General": ["We don't have enough similar customers to provide personalized recommendations."]}
-
-    similar_customers_data = X.iloc[non_churned_similar]
-
-    recommendations = {}
-
-
-    # 1. Insurance Types comparison
-    # Check which insurance types are common among similar non-churned customers
-    auto_insurance_popular = similar_customers_data['Automobile Insurance'].mean() > 0.5
-    health_insurance_popular = similar_customers_data['Health Insurance'].mean() > 0.5
-    life_insurance_popular = similar_customers_data['Life Insurance'].mean() > 0.5
-
-    insurance_recs = []
-    if auto_insurance_popular and target_customer['Automobile Insurance'] == 0:
-        insurance_recs.append("Add automobile insurance - popular among similar customers who stay with us")
-    if health_insurance_popular and target_customer['Health Insurance'] == 0:
-        insurance_recs.append("Include health insurance coverage - common among customers with your profile")
-    if life_insurance_popular and target_customer['Life Insurance'] == 0:
-        insurance_recs.append("Consider life insurance protection - beneficial for customers similar to you")
-
-    if insurance_recs:
-        recommendations['Insurance_Options'] = insurance_recs
-        print(recommendations["Insurance_Options"])  # Only print if the key exists
-    # 2. Analyze claim behaviors of similar customers
-    avg_claim = similar_customers_data['Claim Amount ($)'].mean()
-    if target_customer['Claim Amount ($)'] < avg_claim - 0.5:
-        recommendations['Claim_Optimization'] = [
-            "You may be under-utilizing your benefits compared to similar customers",
-            "Schedule a coverage review to ensure you're getting the most from your plan"
-        ]
-    elif target_customer['Claim Amount ($)'] > avg_claim + 0.5:
-        recommendations['Claim_Optimization'] = [
-            "Your claim pattern differs from similar satisfied customers",
-            "Consider our premium protection plan with higher claim limits"
-        ]
-
-    # 3. Credit score-based recommendations
-    avg_credit = similar_customers_data['Credit Score'].mean()
-    if target_customer['Credit Score'] < avg_credit - 0.1:
-        recommendations['Credit_Improvement'] = [
-            "Our credit improvement program can help enhance your insurance terms",
-            "Customers with improved credit scores often receive better rates"
-        ]
-
-    # 4. Additional demographic insights
-    age = target_customer['Age']
-    if age < 30:
-        recommendations['Young_Customer'] = [
-            "Short-term flexible coverage plans for young professionals",
-            "Digital service with mobile app benefits"
-        ]
-    elif age > 55:
-        recommendations['Senior_Customer'] = [
-            "Fixed premium rates for long-term loyalty",
-            "Priority human customer support"
-        ]
-
-    # If no specific recommendations were generated, provide a general one
-    if not recommendations:
-        recommendations['General'] = ["Based on similar customers, your current plan appears optimal."]
-
-    return recommendations
 def get_comprehensive_analysis(features):
     """
     Combined function that performs churn prediction, plan recommendation,
@@ -162,25 +135,103 @@ def get_comprehensive_analysis(features):
     Returns:
     - Dictionary with all analysis results
     """
-    # Create DataFrame with all features
-    input_data = pd.DataFrame([features], columns=feature_names).astype(float)
-    temp=input_data.copy()
-    # Define the columns to be scaled
-    scale_columns = ['Age', 'Earnings ($)', 'Claim Amount ($)', 'Insurance Plan Amount ($)']
+    if micro_batcher is None:
+        return get_comprehensive_analysis_batch([features])[0]
+
+    row = _as_feature_matrix([features])[0]
+    cached = prediction_cache.get(row, models.current().version)
+    if cached is not None:
+        return cached
+    # Scored together with whatever other requests arrive within the batching window
+    return micro_batcher.submit(row)
 
-    # 1. CHURN PREDICTION
-    # Create a copy for churn prediction to avoid affecting the original
-    churn_input = input_data.copy()
 
-    # Scale only the selected columns for churn prediction
-    if churn_scaler is not None:
-        churn_input.loc[:, scale_columns] = churn_scaler.transform(churn_input[scale_columns])
+def get_comprehensive_analysis_batch(features_matrix, use_cache=True, bundle=None):
+    """
+    Vectorized version of get_comprehensive_analysis for many customers.
+    All three scalers are applied in one fused NumPy transform and each model is
+    called once for the whole batch; rows are routed to the churn / non-churn
+    plan recommender with boolean masks.
+
+    Parameters:
+    - features_matrix: List of feature lists (or 2D array), one row per customer,
+      each in the same order as feature_names
+    - use_cache: look up and store results in the prediction cache; bulk
+      scoring of one-off files passes False so it doesn't evict hot entries
+    - bundle: ModelBundle to score with (default: the current version)
 
-    # Get churn probability
-    churn_probability = churn_model.predict_proba(churn_input)[0][1]
-    is_churn_risk = churn_probability > 0.5
+    Returns:
+    - List of analysis dictionaries, in the same order as the input rows
+    """
+    features_matrix = _as_feature_matrix(features_matrix)
+    if features_matrix.size == 0:
+        return []
+
+    # Resolve every artifact from one bundle so a hot reload can't mix versions
+    bundle = bundle or models.current()
+    if not use_cache:
+        return _analyze(features_matrix, bundle)
+
+    # Serve repeated feature vectors from the cache; only score the misses
+    with timer("analysis.cache_lookup"):
+        results = [prediction_cache.get(row, bundle.version) for row in features_matrix]
+    missing = [i for i, result in enumerate(results) if result is None]
+    if missing:
+        for i, result in zip(missing, _analyze(features_matrix[missing], bundle)):
+            prediction_cache.set(features_matrix[i], bundle.version, result)
+            results[i] = result
+    return results
+
+
+def _as_feature_matrix(features_matrix):
+    features_matrix = np.asarray(features_matrix, dtype=float)
+    if features_matrix.size and (features_matrix.ndim != 2 or features_matrix.shape[1] != len(feature_names)):
+        raise ValueError(f"Each customer must have {len(feature_names)} features in feature_names order")
+    return features_matrix
+
+
+def _analyze_and_cache(rows):
+    # Micro-batcher callback: rows have already missed the cache
+    features_matrix = np.vstack(rows)
+    bundle = models.current()
+    results = _analyze(features_matrix, bundle)
+    for row, result in zip(features_matrix, results):
+        prediction_cache.set(row, bundle.version, result)
+    return results
+
+
+def _analyze(features_matrix, bundle):
+    # The scalers and models run as the bundle's compiled NumPy pipeline
+    pipeline = get_pipeline(bundle)
+
+    # 1. CHURN PREDICTION + 2. PLAN RECOMMENDATION
+    churn_probabilities, recommended_plans = pipeline.score(features_matrix)
+    current_plans = features_matrix[:, PLAN_TYPE_INDEX]
+    with timer("analysis.drift"):
+        drift_monitor.observe(features_matrix, churn_probabilities, bundle)
 
-    churn_result = {
+    # 3. CUSTOMER SIMILARITY ANALYSIS
+    try:
+        customer_recommendations = generate_recommendations_batch(features_matrix)
+    except Exception as e:
+        print(f"Error generating recommendations: {str(e)}")
+        customer_recommendations = [{"General": ["Unable to generate personalized recommendations."]}
+                                    for _ in range(len(features_matrix))]
+
+    # Return combined results, in input order
+    return [
+        {
+            "churn_analysis": _churn_result(churn_probabilities[i]),
+            "plan_recommendation": _plan_result(current_plans[i], recommended_plans[i]),
+            "customer_recommendations": customer_recommendations[i]
+        }
+        for i in range(len(features_matrix))
+    ]
+
+
+def _churn_result(churn_probability):
+    is_churn_risk = bool(churn_probability > 0.5)
+    return {
         "churn_probability": float(churn_probability),
         "is_churn_risk": is_churn_risk,
         "recommendation": (
@@ -190,50 +241,33 @@ def get_comprehensive_analysis(features):
         )
     }
 
-    # 2. PLAN RECOMMENDATION
-    # Create a copy for plan recommendation
-    plan_input = input_data.copy()
-
-    # Apply appropriate scaling based on churn risk
-    if is_churn_risk and plan_scaler_churn is not None:
-        plan_input.loc[:, scale_columns] = plan_scaler_churn.transform(plan_input[scale_columns])
-        recommended_plan = plan_recommender_churn.predict(plan_input.loc[:, plan_input.columns != "Plan Type"])[0]
-    elif plan_scaler is not None:
-        plan_input.loc[:, scale_columns] = plan_scaler.transform(plan_input[scale_columns])
-        recommended_plan = plan_recommender.predict(plan_input.loc[:, plan_input.columns != "Plan Type"])[0]
-    else:
-        # Handle case where scalers are None
-        recommended_plan = features[11]  # Default to current plan
 
+def _plan_result(current_plan_type, recommended_plan):
     # Convert numeric plan type to descriptive name
     plan_names = {1: "Basic", 2: "Standard", 3: "Premium"}
-    current_plan = plan_names.get(int(features[11]))  # Plan type is at index 11
+    current_plan = plan_names.get(int(current_plan_type))
     recommended_plan_name = plan_names.get(int(recommended_plan))
 
     # Generate recommendation message
-    if int(recommended_plan) == int(features[11]):  # Current plan is already optimal
+    if int(recommended_plan) == int(current_plan_type):  # Current plan is already optimal
         plan_message = f"The customer's current {current_plan} plan is already optimal based on their profile."
     else:
         plan_message = f"Recommend upgrading from {current_plan} to {recommended_plan_name} plan for better value and reduced churn risk."
 
-    plan_result = {
+    return {
         "recommended_plan": int(recommended_plan),
         "recommended_plan_name": recommended_plan_name,
         "current_plan": current_plan,
         "plan_message": plan_message
     }
 
-    # 3. CUSTOMER SIMILARITY ANALYSIS
-    # Generate personalized recommendations based on similar customers
-    try:
-        customer_recommendations = generate_recommendations(temp)
-    except Exception as e:
-        print(f"Error generating recommendations: {str(e)}")
-        customer_recommendations = {"General": ["Unable to generate personalized recommendations."]}
 
-    # Return combined results
-    return {
-        "churn_analysis": churn_result,
-        "plan_recommendation": plan_result,
-        "customer_recommendations": customer_recommendations
-    }
\ No newline at end of file
+# Concurrent single-customer requests are coalesced into one model call
+_batching_settings = getattr(settings, "CHURN_MICRO_BATCHING", {})
+micro_batcher = MicroBatcher(
+    _analyze_and_cache,
+    window_ms=_batching_settings.get("WINDOW_MS", 2.0),
+    max_batch=_batching_settings.get("MAX_BATCH", 64),
+    workers=_batching_settings.get("WORKERS", 1),
+    timeout=_batching_settings.get("TIMEOUT_SECONDS", 10.0),
+) if _batching_settings.get("ENABLED", False) else None
@@ -3,17 +3,31 @@ from rest_framework.decorators import api_view, parser_classes
 from django.shortcuts import render
 from.models import CustomerRecord
 import json
-from .utils import get_comprehensive_analysis
-from .model_utils import retrain_model_from_csv
+from .utils import get_comprehensive_analysis, get_comprehensive_analysis_batch, add_customers, prediction_cache
+from .jobs import submit_retrain
+from .registry import feature_store, models
+from .prediction_log import prediction_log
+from .metrics import metrics, timer
+from .executor import inference_executor
+from .queries import RecordKeysetPagination, churn_rate_by, filter_records, risk_histogram
+from .rollups import ROLLUP_DIMENSIONS, rollup_rows, watermark_status
+from .drift import drift_monitor
+from .scenarios import score_scenarios
+from .explain import explain_batch
+from .inference import FEATURE_NAMES
+from .ingest import (OUTPUT_FORMATS, CSV_RESULT_COLUMNS, READ_ERRORS, iter_feature_chunks, records_from_features,
+                     format_results, format_error)
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
 from rest_framework.parsers import MultiPartParser, FormParser
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
-from .models import CustomerRecord
-from .serializers import CustomerRecordSerializer
+from .models import CustomerRecord, RetrainJob
+from .serializers import CustomerRecordSerializer, RetrainJobSerializer
 import os
-import csv
 from rest_framework import status
 from django.conf import settings
+from django.utils.dateparse import parse_date
 
 # @api_view(['POST'])
 # def predict_and_save(request):
@@ -41,6 +55,29 @@ from django.conf import settings
 #     else:
 #         return Response(serializer.errors, status=400)
 
+def _parse_top_k(data):
+    # None means every feature
+    top_k = data.get("top_k")
+    if top_k is not None and (not isinstance(top_k, int) or not 1 <= top_k <= len(FEATURE_NAMES)):
+        raise ValueError(f"'top_k' should be an integer between 1 and {len(FEATURE_NAMES)}")
+    return top_k
+
+def _add_explanations(results, rows, bundle, top_k):
+    # 🧠 Why: per-feature contributions (TreeSHAP) from the bundle that produced
+    # the scores; a model that can't be explained doesn't fail the prediction
+    try:
+        with timer("explain.batch"):
+            explanations = explain_batch(rows, bundle, top_k=top_k)
+    except Exception as e:
+        print(f"Error explaining predictions: {str(e)}")
+        explanations, error = [None] * len(rows), str(e)
+    else:
+        error = None
+    for result, explanation in zip(results, explanations):
+        result["churn_analysis"]["explanation"] = explanation
+        if error is not None:
+            result["churn_analysis"]["explanation_error"] = error
+
 @api_view(['POST'])
 def predict(request):
     try:
@@ -56,8 +93,19 @@ def predict(request):
         if not raw_data or not isinstance(raw_data, dict):
             return Response({"error": "Missing or invalid 'raw_data'"}, status=400)
 
+        wants_explanation = bool(data.get("explain"))
+        top_k = _parse_top_k(data) if wants_explanation else None
+
         # 🔍 Perform model prediction
-        result = get_comprehensive_analysis(features)
+        with timer("predict.analysis"):
+            if wants_explanation:
+                # Scored outside the micro-batcher, so the explanation comes from the same version
+                bundle = models.current()
+                result = get_comprehensive_analysis_batch([features], bundle=bundle)[0]
+            else:
+                result = get_comprehensive_analysis(features)
+        if wants_explanation:
+            _add_explanations([result], [features], bundle, top_k)
         churn_data = result.get("churn_analysis", {})
         churn_prob = churn_data.get("churn_probability", 0.0)
         recommendation = churn_data.get("recommendation", "No recommendation.")
@@ -65,20 +113,19 @@ def predict(request):
         # ➕ Add prediction data to raw_data
         raw_data["churn_probability"] = churn_prob
         raw_data["recommendation"] = recommendation
-        csv_path = os.path.join(settings.BASE_DIR, 'logs', 'training_data.csv')
-        os.makedirs(os.path.dirname(csv_path), exist_ok=True)  # Create folder if not exists
-
-        with open(csv_path, 'a', newline='') as f:
-            writer = csv.writer(f)
-            writer.writerow(features + [churn_prob]) 
-
-        # ✅ Save raw_data to the database
-        serializer = CustomerRecordSerializer(data=raw_data)
-        if serializer.is_valid():
-            serializer.save()
-        else:
+
+        with timer("predict.validate"):
+            serializer = CustomerRecordSerializer(data=raw_data)
+            valid = serializer.is_valid()
+        if not valid:
             return Response({"error": "Invalid data", "details": serializer.errors}, status=400)
 
+        # ✅ Queue the training row and the database record; both are written in bulk
+        with timer("predict.log_queue"):
+            prediction_log.log([features + [churn_prob]], [CustomerRecord(**serializer.validated_data)])
+        with timer("predict.index_add"):
+            add_customers([features], [churn_prob])
+
         # ✅ Return only prediction result
         return Response(result)
 
@@ -87,6 +134,266 @@ def predict(request):
     except Exception as e:
         return Response({"error": str(e)}, status=400)
 
+def _log_prediction(features, churn_prob, validated_data):
+    prediction_log.log([features + [churn_prob]], [CustomerRecord(**validated_data)])
+    add_customers([features], [churn_prob])
+
+@csrf_exempt
+async def predict_async(request):
+    # ⚡ Same contract as /api/predict/, for ASGI servers (uvicorn): the event
+    # loop only parses and validates; scoring runs on the bounded inference
+    # pool and logging is scheduled after the response
+    if request.method != "POST":
+        return JsonResponse({"error": f'Method "{request.method}" not allowed.'}, status=405)
+    try:
+        data = json.loads(request.body)
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        return JsonResponse({"error": "Invalid JSON format"}, status=400)
+
+    features = data.get("features") if isinstance(data, dict) else None
+    raw_data = data.get("raw_data") if isinstance(data, dict) else None
+
+    if not features or not isinstance(features, list):
+        return JsonResponse({"error": "'features' should be a list"}, status=400)
+
+    if not raw_data or not isinstance(raw_data, dict):
+        return JsonResponse({"error": "Missing or invalid 'raw_data'"}, status=400)
+
+    # 🚦 Backpressure: shed load once the pool's queue is full
+    if not inference_executor.try_acquire():
+        return JsonResponse({"error": "Server is busy, please retry shortly."}, status=503,
+                            headers={"Retry-After": "1"})
+    try:
+        # 🔍 Perform model prediction
+        result = await inference_executor.run(get_comprehensive_analysis, features)
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    finally:
+        inference_executor.release()
+
+    churn_data = result.get("churn_analysis", {})
+    raw_data["churn_probability"] = churn_data.get("churn_probability", 0.0)
+    raw_data["recommendation"] = churn_data.get("recommendation", "No recommendation.")
+
+    serializer = CustomerRecordSerializer(data=raw_data)
+    if not serializer.is_valid():
+        return JsonResponse({"error": "Invalid data", "details": serializer.errors}, status=400)
+
+    # ✅ Log the training row and database record without holding up the response
+    inference_executor.run_in_background(_log_prediction, features, raw_data["churn_probability"],
+                                         serializer.validated_data)
+    return JsonResponse(result)
+
+# Upper bound on customers scored by a single /api/predict/batch/ call
+MAX_BATCH_SIZE = 10000
+
+@api_view(['POST'])
+def predict_batch(request):
+    try:
+        data = request.data
+
+        # Check for required keys
+        features = data.get("features")
+        raw_data = data.get("raw_data")
+
+        if not features or not isinstance(features, list) or not all(isinstance(row, list) for row in features):
+            return Response({"error": "'features' should be a list of feature lists"}, status=400)
+
+        if len(features) > MAX_BATCH_SIZE:
+            return Response({"error": f"At most {MAX_BATCH_SIZE} customers can be scored per request"}, status=400)
+
+        # raw_data is optional here; when given, rows are logged like /api/predict/
+        if raw_data is not None and (not isinstance(raw_data, list) or len(raw_data) != len(features)):
+            return Response({"error": "'raw_data' should be a list with one entry per features row"}, status=400)
+
+        wants_explanation = bool(data.get("explain"))
+        top_k = _parse_top_k(data) if wants_explanation else None
+
+        # 🔍 Perform model prediction for all rows at once
+        bundle = models.current()
+        results = get_comprehensive_analysis_batch(features, bundle=bundle)
+        if wants_explanation:
+            # 🧠 One TreeSHAP pass for every row that isn't cached
+            _add_explanations(results, features, bundle, top_k)
+
+        if raw_data is not None:
+            for record, result in zip(raw_data, results):
+                churn_data = result.get("churn_analysis", {})
+                record["churn_probability"] = churn_data.get("churn_probability", 0.0)
+                record["recommendation"] = churn_data.get("recommendation", "No recommendation.")
+
+            serializer = CustomerRecordSerializer(data=raw_data, many=True)
+            if not serializer.is_valid():
+                return Response({"error": "Invalid data", "details": serializer.errors}, status=400)
+
+            churn_probs = [result["churn_analysis"]["churn_probability"] for result in results]
+            prediction_log.log(
+                [row + [churn_prob] for row, churn_prob in zip(features, churn_probs)],
+                [CustomerRecord(**record) for record in serializer.validated_data]
+            )
+            add_customers(features, churn_probs)
+
+        # ✅ Return prediction results in input order
+        return Response({"results": results})
+
+    except json.JSONDecodeError:
+        return Response({"error": "Invalid JSON format"}, status=400)
+    except Exception as e:
+        return Response({"error": str(e)}, status=400)
+
+@api_view(['POST'])
+def explain(request):
+    # 🧠 Per-feature contributions to the churn probability for one customer
+    # ('features' as a list) or many (a list of lists); nothing is logged
+    data = request.data
+    features = data.get("features")
+    if not features or not isinstance(features, list):
+        return Response({"error": "'features' should be a list"}, status=400)
+    single = not isinstance(features[0], list)
+    rows = [features] if single else features
+    if len(rows) > MAX_BATCH_SIZE:
+        return Response({"error": f"At most {MAX_BATCH_SIZE} customers can be explained per request"}, status=400)
+    bundle = models.current()
+    try:
+        with timer("explain.batch"):
+            explanations = explain_batch(rows, bundle, top_k=_parse_top_k(data))
+    except (TypeError, ValueError) as e:
+        return Response({"error": str(e)}, status=400)
+    if single:
+        return Response({"model_version": bundle.version, **explanations[0]})
+    return Response({"model_version": bundle.version, "results": explanations})
+
+@api_view(['POST'])
+def what_if(request):
+    # 🔀 Score one customer under a grid of plan / coverage changes in a single
+    # pipeline pass; scenarios are hypothetical, so nothing is logged or cached
+    data = request.data
+    limit = data.get("limit")
+    if limit is not None and (not isinstance(limit, int) or limit < 1):
+        return Response({"error": "'limit' should be a positive integer"}, status=400)
+    try:
+        with timer("what_if.score"):
+            result = score_scenarios(data.get("features"), data.get("grid"), models.current(), limit)
+    except (TypeError, ValueError) as e:
+        return Response({"error": str(e)}, status=400)
+    return Response(result)
+
+@api_view(['POST'])
+@parser_classes([MultiPartParser])
+def predict_upload(request):
+    # 📂 Score (and by default save) every customer in an uploaded CSV/Parquet
+    # file. Django spools large uploads to disk and the file is read chunk by
+    # chunk, so memory stays flat; results stream back as NDJSON or CSV
+    uploaded_file = request.FILES.get("file")
+    if uploaded_file is None:
+        return Response({"error": "Upload the customer file as 'file'"}, status=400)
+
+    # Not "format": DRF reserves that query parameter for its own content negotiation
+    output_format = request.query_params.get("output", "ndjson")
+    if output_format not in OUTPUT_FORMATS:
+        return Response({"error": f"'output' should be one of {', '.join(OUTPUT_FORMATS)}"}, status=400)
+    save = request.query_params.get("save", "true").lower() not in ("0", "false", "no")
+    chunk_rows = getattr(settings, "CHURN_UPLOAD_CHUNK_ROWS", 5000)
+
+    # Read the first chunk up front so a malformed file still gets a 400
+    chunks = iter_feature_chunks(uploaded_file, chunk_rows)
+    try:
+        first_chunk = next(chunks, None)
+    except READ_ERRORS as e:
+        return Response({"error": f"Could not read uploaded file: {str(e)}"}, status=400)
+
+    def stream():
+        if output_format == "csv":
+            yield ",".join(CSV_RESULT_COLUMNS) + "\r\n"
+        first_row, chunk = 0, first_chunk
+        while chunk is not None:
+            try:
+                # A bad value only fails its own chunk
+                features_matrix = chunk.to_numpy(dtype=float)
+                results = get_comprehensive_analysis_batch(features_matrix, use_cache=False)
+                if save:
+                    CustomerRecord.objects.bulk_create(records_from_features(features_matrix, results), batch_size=1000)
+                yield format_results(results, first_row, output_format)
+            except Exception as e:
+                yield format_error(first_row, len(chunk), e, output_format)
+            first_row += len(chunk)
+
+            try:
+                chunk = next(chunks, None)
+            except Exception as e:
+                # The rest of the file can't be parsed or decoded (READ_ERRORS, or anything
+                # else the reader raises); report where it stopped instead of cutting the stream
+                yield format_error(first_row, None, e, output_format)
+                return
+
+    content_type = "text/csv" if output_format == "csv" else "application/x-ndjson"
+    return StreamingHttpResponse(stream(), content_type=content_type)
+
+@api_view(['GET'])
+def customer_records(request):
+    # 🔎 Filtered, keyset-paginated listing of saved predictions
+    try:
+        queryset = filter_records(CustomerRecord.objects.all(), request.query_params)
+        paginator = RecordKeysetPagination()
+        page = paginator.paginate_queryset(queryset, request)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return paginator.get_paginated_response(CustomerRecordSerializer(page, many=True).data)
+
+@api_view(['GET'])
+def customer_record_aggregates(request):
+    # 📊 Risk histogram and churn rates per plan / insurance type, computed by the database
+    try:
+        queryset = filter_records(CustomerRecord.objects.all(), request.query_params)
+        bins = request.query_params.get('bins', '10')
+        if not bins.isdigit():
+            raise ValueError("'bins' should be a whole number")
+        histogram = risk_histogram(queryset, int(bins))
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response({
+        'count': sum(bucket['count'] for bucket in histogram),
+        'risk_histogram': histogram,
+        'churn_rate_by_plan': churn_rate_by(queryset, 'plan_type'),
+        'churn_rate_by_insurance_type': churn_rate_by(queryset, 'type_of_insurance'),
+    })
+
+@api_view(['GET'])
+def churn_rollups(request):
+    # 🗓️ Precomputed daily churn-risk rollups; reads the rollup table only, never the records
+    dimension = request.query_params.get('dimension', 'all')
+    if dimension not in ROLLUP_DIMENSIONS:
+        return Response({'error': f"'dimension' should be one of {', '.join(ROLLUP_DIMENSIONS)}"},
+                        status=status.HTTP_400_BAD_REQUEST)
+    days = {}
+    for name in ('start', 'end'):
+        value = request.query_params.get(name)
+        try:
+            days[name] = parse_date(value) if value else None
+        except ValueError:
+            days[name] = None
+        if value and days[name] is None:
+            return Response({'error': f"'{name}' should be an ISO 8601 date"}, status=status.HTTP_400_BAD_REQUEST)
+    return Response({
+        'dimension': dimension,
+        'watermark': watermark_status(),
+        'rows': rollup_rows(dimension, days['start'], days['end']),
+    })
+
+@api_view(['GET'])
+def drift_report(request):
+    # 🌊 Live feature / churn-probability distributions against the training reference (per worker process)
+    return Response(drift_monitor.report())
+
+@api_view(['GET'])
+def prediction_cache_stats(request):
+    # Hit/miss counters are per worker process
+    return Response(prediction_cache.stats())
+
+def metrics_endpoint(request):
+    # 📈 Prometheus text exposition format; values are per worker process
+    return HttpResponse(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
 def prediction_form(request):
     return render(request, "prediction_form.html")
 
@@ -117,17 +424,34 @@ def save_customer_data(data, churn_prob, recommendation):
     
 @api_view(['POST'])
 def retrain_model_api(request):
+    # Training code pulls in XGBoost/scikit-learn; only import it when retraining is requested
+    from .model_utils import TRAINING_MODES
     try:
-        # Paths relative to the project root (where manage.py is)
-        dataset_path = os.path.join('logs','training_data.csv')
-        model_output_path = os.path.join('models','churn_model.pkl')
+        # Logged predictions live in the feature store (logs/feature_store/)
+        if not feature_store.rows:
+            return Response({'error': 'No training data in the feature store.'}, status=status.HTTP_404_NOT_FOUND)
 
-        if not os.path.exists(dataset_path):
-            return Response({'error': 'training_data.csv not found in project root.'}, status=status.HTTP_404_NOT_FOUND)
+        # "auto" continues the current model on new rows unless a full refit is due
+        mode = request.data.get('mode', 'auto')
+        if mode not in TRAINING_MODES:
+            return Response({'error': f"'mode' should be one of {', '.join(TRAINING_MODES)}"}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Retrain and save model
-        message = retrain_model_from_csv(dataset_path, model_output_path)
-        return Response({'message': message}, status=status.HTTP_200_OK)
+        # Retraining runs in the background; duplicate submissions share one job
+        job, created = submit_retrain(mode=mode)
+        return Response({
+            'message': 'Retraining started.' if created else 'A retraining job is already in progress.',
+            'job_id': job.id,
+            'status': job.status,
+            'coalesced': not created,
+        }, status=status.HTTP_202_ACCEPTED)
 
     except Exception as e:
-        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
\ No newline at end of file
+        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+@api_view(['GET'])
+def retrain_job_status(request, job_id):
+    try:
+        job = RetrainJob.objects.get(pk=job_id)
+    except RetrainJob.DoesNotExist:
+        return Response({'error': f'Retraining job {job_id} not found.'}, status=status.HTTP_404_NOT_FOUND)
+    return Response(RetrainJobSerializer(job).data)
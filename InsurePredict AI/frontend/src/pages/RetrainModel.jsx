@@ -5,15 +5,33 @@ const RetrainModel = () => {
   const [message, setMessage] = useState('');
   const [loading, setLoading] = useState(false);
 
+  const API_URL = 'http://ec2-13-60-196-93.eu-north-1.compute.amazonaws.com/api/retrain-model/';
+
+  // Retraining runs as a background job; poll it until it finishes
+  const pollJob = async (jobId) => {
+    while (true) {
+      await new Promise((resolve) => setTimeout(resolve, 2000));
+      const { data } = await axios.get(`${API_URL}${jobId}/`);
+      if (data.status === 'succeeded') {
+        return data.message || 'Model retrained successfully!';
+      }
+      if (data.status === 'failed') {
+        throw new Error(data.error || 'Retraining failed with an error.');
+      }
+      setMessage(`${data.message || 'Retraining'} (${Math.round(data.progress * 100)}%)`);
+    }
+  };
+
   const handleRetrain = async () => {
     setLoading(true);
     setMessage('');
 
     try {
-      const response = await axios.post('http://ec2-13-60-196-93.eu-north-1.compute.amazonaws.com/api/retrain-model/');
-      setMessage(response.data.message || 'Model retrained successfully!');
+      const response = await axios.post(API_URL);
+      setMessage(response.data.message);
+      setMessage(await pollJob(response.data.job_id));
     } catch (error) {
-      setMessage(error.response?.data?.error || 'Something went wrong.');
+      setMessage(error.response?.data?.error || error.message || 'Something went wrong.');
     } finally {
       setLoading(false);
     }